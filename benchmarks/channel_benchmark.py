@@ -0,0 +1,130 @@
+"""
+.. module:: channel_benchmark
+   :platform: Unix
+   :synopsis: Throughput of large EMS messages from a simulated device over channels created with each channel profile
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+
+Starts a simulated device with enough interfaces that every EMS message is large, then streams from it over
+a channel created with the options of every profile and reports messages and megabytes per second::
+
+    python benchmarks/channel_benchmark.py --interfaces 20000 --counters 32 --duration 20
+    python benchmarks/channel_benchmark.py --config rtnm.ini --profiles default,large-snapshots
+
+Profiles come from the channel-profile sections of --config, or from BENCHMARK_PROFILES without one. A message
+larger than the max-receive-message-size of a profile ends its stream with RESOURCE_EXHAUSTED, reported as its error.
+"""
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from datetime import datetime
+from pathlib import Path
+from time import sleep, monotonic
+from typing import List, Dict, Tuple, Any, Optional
+
+import grpc
+
+from pipeline_benchmark import BENCHMARKS_DIR, RTNM_DIR, free_port, stop_process, git_revision
+
+sys.path.insert(0, str(RTNM_DIR))
+
+from channels.channels import channel_options
+from protos.cisco_mdt_dial_in_pb2 import CreateSubsArgs
+from protos.cisco_mdt_dial_in_pb2_grpc import gRPCConfigOperStub
+from utils.utils import channel_profiles
+
+# Settings of the profiles compared when no configuration is given
+BENCHMARK_PROFILES: Dict[str, Dict[str, str]] = {
+    "default": {},
+    "large-messages": {"max-receive-message-size": "-1"},
+    "fixed-window": {"max-receive-message-size": "-1", "bdp-probe": "false", "initial-window-size": "65535"},
+    "large-window": {"max-receive-message-size": "-1", "bdp-probe": "false", "initial-window-size": "16777216",
+                     "max-frame-size": "16777215"},
+}
+
+
+def stream(address: str, options: List[Tuple[str, Any]], duration: float) -> Dict[str, Any]:
+    """Stream EMS messages from the device for duration seconds after the first message arrived"""
+    messages: int = 0
+    received_bytes: int = 0
+    error: Optional[str] = None
+    first_message: Optional[float] = None
+    connect: float = monotonic()
+    start: float = connect
+    with grpc.insecure_channel(address, options) as channel:
+        call = gRPCConfigOperStub(channel).CreateSubs(CreateSubsArgs(ReqId=1, encode=3, Subscriptions=["benchmark"]),
+                                                      timeout=duration * 10)
+        try:
+            for reply in call:
+                if first_message is None:
+                    start = monotonic()
+                    first_message = start - connect
+                    continue
+                messages += 1
+                received_bytes += len(reply.data)
+                if monotonic() - start >= duration:
+                    break
+        except grpc.RpcError as rpc_error:
+            error = f"{rpc_error.code().name}: {rpc_error.details()}"
+        finally:
+            call.cancel()
+    elapsed: float = max(monotonic() - start, 1e-9)
+    return {"messages": messages, "bytes": received_bytes, "seconds": elapsed, "first_message_seconds": first_message,
+            "messages_per_second": messages / elapsed, "megabytes_per_second": received_bytes / elapsed / 1e6,
+            "error": error}
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Large message throughput of every gRPC channel profile")
+    parser.add_argument("-c", "--config", dest="config", type=Path,
+                        help="RTNM configuration whose channel-profile sections are compared")
+    parser.add_argument("--profiles", dest="profiles", help="Comma separated profiles to compare, defaults to all")
+    parser.add_argument("--interfaces", dest="interfaces", type=int, default=20000,
+                        help="Interfaces of the simulated device, every EMS message holds all of them")
+    parser.add_argument("--counters", dest="counters", type=int, default=32, help="Counter leaves per interface")
+    parser.add_argument("--rate", dest="rate", type=float, default=1000.0,
+                        help="Messages per second the device sends at most")
+    parser.add_argument("--duration", dest="duration", type=float, default=20.0, help="Seconds to measure per profile")
+    parser.add_argument("--simulator-startup", dest="simulator_startup", type=float, default=2.0)
+    parser.add_argument("--output", dest="output", type=Path,
+                        help="Result file, defaults to benchmarks/results/channels-<timestamp>-<revision>.json")
+    args = parser.parse_args()
+    if args.config is not None:
+        config: ConfigParser = ConfigParser()
+        config.read(args.config)
+        profiles: Dict[str, List[Tuple[str, Any]]] = channel_profiles(config)
+    else:
+        profiles = {name: channel_options(settings) for name, settings in BENCHMARK_PROFILES.items()}
+    if args.profiles:
+        profiles = {name: profiles[name] for name in args.profiles.split(",")}
+    revision: str = git_revision()
+    port: int = free_port()
+    simulator: subprocess.Popen = subprocess.Popen(
+        [sys.executable, "-m", "simulator.simulator", "dial-in", "--devices", "1", "--port", str(port),
+         "--rate", str(args.rate), "--interfaces", str(args.interfaces), "--counters", str(args.counters)],
+        cwd=RTNM_DIR, start_new_session=True, stdout=subprocess.DEVNULL)
+    results: List[Dict[str, Any]] = []
+    try:
+        sleep(args.simulator_startup)
+        print(f"{'profile':<20}{'msg/s':>10}{'MB/s':>10}{'first msg s':>13}  error")
+        for name, options in profiles.items():
+            result: Dict[str, Any] = {"profile": name, "options": options,
+                                      **stream(f"127.0.0.1:{port}", options, args.duration)}
+            first: str = f"{result['first_message_seconds']:.2f}" if result["first_message_seconds"] else "-"
+            print(f"{name:<20}{result['messages_per_second']:>10.1f}{result['megabytes_per_second']:>10.1f}"
+                  f"{first:>13}  {result['error'] or ''}")
+            results.append(result)
+    finally:
+        stop_process(simulator)
+    output: Path = args.output or (BENCHMARKS_DIR / "results" /
+                                   f"channels-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump({"revision": revision, "arguments": {**vars(args), "output": str(args.output)},
+                   "results": results}, result_file, indent=2, default=str)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
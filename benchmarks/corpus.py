@@ -0,0 +1,285 @@
+"""
+.. module:: corpus
+   :platform: Unix, Windows
+   :synopsis: Deterministic corpus of serialized gNMI SubscribeResponse and EMS Telemetry payloads
+              of typical IOS-XR sensor paths used to benchmark the parsers
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+
+Every sensor (interfaces, bgp, lldp, platform) comes in three variants, small (one entry, a handful
+of leaves), large (many entries and leaves) and nested (leaves spread over containers up to four levels
+deep), for both gNMI and EMS. gNMI comes in the encodings a device can be subscribed with, typed PROTO values,
+ASCII and JSON_IETF, all carrying the same values, and as gnmi-json-tree with every entry in one JSON_IETF list
+the way devices subscribed with JSON_IETF send whole subtrees. The same seed always produces the same bytes.
+The corpus can be written as capture files to replay through the whole pipeline::
+
+    python benchmarks/corpus.py --output corpus
+    python rtnm.py -c rtnm.ini --replay corpus/interfaces-large-gnmi --replay-speed 0
+
+"""
+import json
+import random
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent / "rtnm"))
+
+from protos.gnmi_pb2 import Notification, Path as GNMIPath, PathElem, SubscribeResponse, TypedValue, Update
+from protos.telemetry_pb2 import Telemetry, TelemetryField
+
+# Fixed so payloads are byte for byte identical between runs
+TIMESTAMP_MS: int = 1600000000000
+HOSTNAME: str = "corpus-router"
+VERSION: str = "7.3.1"
+IP: str = "192.0.2.1"
+
+# Sensor paths with their gNMI prefix, EMS encoding path, keys and leaves with the type of their values,
+# keys are formatted with the index of the entry as i, and i split into two octets as a and b
+SENSORS: Dict[str, Dict[str, Any]] = {
+    "interfaces": {
+        "origin": "openconfig-interfaces",
+        "prefix": [("interfaces", {}), ("interface", {"name": "HundredGigE0/0/0/{i}"}), ("state", {}),
+                   ("counters", {})],
+        "encoding_path": "Cisco-IOS-XR-infra-statsd-oper:infra-statistics/interfaces/interface/latest/generic-counters",
+        "keys": {"interface-name": "HundredGigE0/0/0/{i}"},
+        "leaves": [("in-octets", "uint"), ("in-unicast-pkts", "uint"), ("in-multicast-pkts", "uint"),
+                   ("in-broadcast-pkts", "uint"), ("in-discards", "uint"), ("in-errors", "uint"),
+                   ("out-octets", "uint"), ("out-unicast-pkts", "uint"), ("out-multicast-pkts", "uint"),
+                   ("out-broadcast-pkts", "uint"), ("out-discards", "uint"), ("out-errors", "uint"),
+                   ("carrier-transitions", "uint"), ("last-clear", "string")],
+    },
+    "bgp": {
+        "origin": "openconfig-network-instance",
+        "prefix": [("network-instances", {}), ("network-instance", {"name": "default"}), ("protocols", {}),
+                   ("protocol", {"identifier": "BGP", "name": "default"}), ("bgp", {}), ("neighbors", {}),
+                   ("neighbor", {"neighbor-address": "10.0.{a}.{b}"}), ("state", {})],
+        "encoding_path": "Cisco-IOS-XR-ipv4-bgp-oper:bgp/instances/instance/instance-active/default-vrf/neighbors/neighbor",
+        "keys": {"instance-name": "default", "neighbor-address": "10.0.{a}.{b}"},
+        "leaves": [("session-state", "string"), ("peer-as", "uint"), ("local-as", "uint"), ("peer-type", "string"),
+                   ("established-transitions", "uint"), ("last-established", "uint"),
+                   ("messages-received", "uint"), ("messages-sent", "uint"), ("queue-input", "uint"),
+                   ("queue-output", "uint"), ("supports-graceful-restart", "bool")],
+    },
+    "lldp": {
+        "origin": "openconfig-lldp",
+        "prefix": [("lldp", {}), ("interfaces", {}), ("interface", {"name": "HundredGigE0/0/0/{i}"}),
+                   ("neighbors", {}), ("neighbor", {"id": "neighbor-{i}"}), ("state", {})],
+        "encoding_path": "Cisco-IOS-XR-ethernet-lldp-oper:lldp/nodes/node/neighbors/details/detail",
+        "keys": {"node-name": "0/RP0/CPU0", "interface-name": "HundredGigE0/0/0/{i}", "device-id": "neighbor-{i}"},
+        "leaves": [("system-name", "string"), ("system-description", "string"), ("chassis-id", "string"),
+                   ("chassis-id-type", "string"), ("port-id", "string"), ("port-description", "string"),
+                   ("management-address", "string"), ("ttl", "uint"), ("age", "uint"), ("last-update", "uint")],
+    },
+    "platform": {
+        "origin": "openconfig-platform",
+        "prefix": [("components", {}), ("component", {"name": "0/{i}/CPU0"}), ("state", {})],
+        "encoding_path": "Cisco-IOS-XR-wdsysmon-fd-oper:system-monitoring/cpu-utilization",
+        "keys": {"node-name": "0/{i}/CPU0"},
+        "leaves": [("description", "string"), ("type", "string"), ("oper-status", "string"),
+                   ("temperature-instant", "float"), ("temperature-avg", "float"), ("temperature-max", "float"),
+                   ("memory-available", "uint"), ("memory-utilized", "uint"), ("total-cpu-one-minute", "float"),
+                   ("uptime", "uint"), ("removable", "bool")],
+    },
+}
+
+# Number of keyed entries, leaves per entry (padded with synthetic counters) and container depth
+VARIANTS: Dict[str, Dict[str, int]] = {
+    "small": {"entries": 1, "leaves": 4, "depth": 0},
+    "large": {"entries": 64, "leaves": 64, "depth": 0},
+    "nested": {"entries": 8, "leaves": 24, "depth": 4},
+}
+
+# gNMI formats and the subscribe encoding of their values
+GNMI_ENCODINGS: Dict[str, str] = {"gnmi": "PROTO", "gnmi-ascii": "ASCII", "gnmi-json": "JSON_IETF",
+                                  "gnmi-json-tree": "JSON_IETF"}
+
+FORMATS: List[str] = [*GNMI_ENCODINGS, "ems"]
+
+
+class CorpusEntry:
+    """The serialized messages of one sensor, variant and format
+
+    :param sensor: Name of the sensor in SENSORS
+    :type sensor: str
+    :param variant: Name of the variant in VARIANTS
+    :type variant: str
+    :param encoding: A gnmi format or ems
+    :type encoding: str
+    :param payloads: The serialized messages
+    :type payloads: List[bytes]
+
+    """
+
+    def __init__(self, sensor: str, variant: str, encoding: str, payloads: List[bytes]) -> None:
+        self.sensor: str = sensor
+        self.variant: str = variant
+        self.encoding: str = encoding
+        self.payloads: List[bytes] = payloads
+
+    @property
+    def name(self) -> str:
+        return f"{self.sensor}-{self.variant}-{self.encoding}"
+
+    @property
+    def frame_encoding(self) -> str:
+        """gnmi or ems, the first element of the tuples the dispatcher batches"""
+        return "gnmi" if self.encoding in GNMI_ENCODINGS else self.encoding
+
+    def frames(self) -> List[Tuple[str, bytes, str, str, str]]:
+        """The payloads as the tuples the dial in clients put on the data queue"""
+        return [(self.frame_encoding, payload, HOSTNAME, VERSION, IP) for payload in self.payloads]
+
+
+def _leaves(sensor: Dict[str, Any], variant: Dict[str, int]) -> List[Tuple[List[str], str, str]]:
+    leaves: List[Tuple[str, str]] = sensor["leaves"] + [(f"counter-{index}", "uint") for index in
+                                                         range(len(sensor["leaves"]), variant["leaves"])]
+    return [([f"level-{level}" for level in range(index % (variant["depth"] + 1))], name, kind)
+            for index, (name, kind) in enumerate(leaves[:variant["leaves"]])]
+
+
+def _value(rng: random.Random, name: str, kind: str) -> Any:
+    if kind == "uint":
+        return rng.randint(0, 1 << 40)
+    if kind == "float":
+        return round(rng.uniform(0, 100), 2)
+    if kind == "bool":
+        return rng.random() < 0.5
+    return f"{name}-{rng.randint(0, 9999)}"
+
+
+def _format_keys(keys: Dict[str, str], index: int) -> Dict[str, str]:
+    return {key: value.format(i=index, a=index // 256, b=index % 256) for key, value in keys.items()}
+
+
+def _typed_value(kind: str, value: Any, encoding: str) -> TypedValue:
+    if encoding == "JSON_IETF":
+        return TypedValue(json_ietf_val=json.dumps(value).encode("utf-8"))
+    if encoding == "ASCII":
+        return TypedValue(ascii_val=str(value))
+    return TypedValue(**{{"uint": "uint_val", "float": "float_val", "bool": "bool_val",
+                          "string": "string_val"}[kind]: value})
+
+
+def gnmi_payloads(sensor: Dict[str, Any], variant: Dict[str, int], rng: random.Random,
+                  encoding: str = "PROTO") -> List[bytes]:
+    """One SubscribeResponse per keyed entry like IOS-XR sends them, with the values in a subscribe encoding"""
+    payloads: List[bytes] = []
+    for index in range(variant["entries"]):
+        prefix: GNMIPath = GNMIPath(origin=sensor["origin"],
+                                    elem=[PathElem(name=name, key=_format_keys(keys, index))
+                                          for name, keys in sensor["prefix"]])
+        notification: Notification = Notification(timestamp=TIMESTAMP_MS * 1000000, prefix=prefix)
+        for containers, name, kind in _leaves(sensor, variant):
+            typed_value: TypedValue = _typed_value(kind, _value(rng, name, kind), encoding)
+            notification.update.append(Update(path=GNMIPath(elem=[PathElem(name=elem)
+                                                                  for elem in containers + [name]]),
+                                              val=typed_value))
+        payloads.append(SubscribeResponse(update=notification).SerializeToString(deterministic=True))
+    return payloads
+
+
+def gnmi_tree_payloads(sensor: Dict[str, Any], variant: Dict[str, int], rng: random.Random) -> List[bytes]:
+    """A single SubscribeResponse whose prefix ends above the innermost keyed list and whose update holds
+    every entry of that list as JSON_IETF, keys included as members of the entries
+
+    """
+    list_index: int = max(index for index, (_, keys) in enumerate(sensor["prefix"]) if keys)
+    list_name, list_keys = sensor["prefix"][list_index]
+    entries: List[Dict[str, Any]] = []
+    for index in range(variant["entries"]):
+        entry: Dict[str, Any] = dict(_format_keys(list_keys, index))
+        container: Dict[str, Any] = entry
+        for name, _ in sensor["prefix"][list_index + 1:]:
+            container = container.setdefault(name, {})
+        for containers, name, kind in _leaves(sensor, variant):
+            leaf_container: Dict[str, Any] = container
+            for container_name in containers:
+                leaf_container = leaf_container.setdefault(container_name, {})
+            leaf_container[name] = _value(rng, name, kind)
+        entries.append(entry)
+    prefix: GNMIPath = GNMIPath(origin=sensor["origin"],
+                                elem=[PathElem(name=name, key=_format_keys(keys, 0))
+                                      for name, keys in sensor["prefix"][:list_index]])
+    notification: Notification = Notification(timestamp=TIMESTAMP_MS * 1000000, prefix=prefix)
+    notification.update.append(Update(path=GNMIPath(elem=[PathElem(name=list_name)]),
+                                      val=TypedValue(json_ietf_val=json.dumps(entries).encode("utf-8"))))
+    return [SubscribeResponse(update=notification).SerializeToString(deterministic=True)]
+
+
+def ems_payloads(sensor: Dict[str, Any], variant: Dict[str, int], rng: random.Random) -> List[bytes]:
+    """A single self describing GPB Telemetry message with a row per keyed entry"""
+    telemetry: Telemetry = Telemetry(node_id_str=HOSTNAME, subscription_id_str="corpus",
+                                     encoding_path=sensor["encoding_path"], collection_id=1,
+                                     collection_start_time=TIMESTAMP_MS, msg_timestamp=TIMESTAMP_MS,
+                                     collection_end_time=TIMESTAMP_MS)
+    for index in range(variant["entries"]):
+        row: TelemetryField = telemetry.data_gpbkv.add(timestamp=TIMESTAMP_MS)
+        keys: TelemetryField = row.fields.add(name="keys")
+        for key, value in _format_keys(sensor["keys"], index).items():
+            keys.fields.add(name=key, string_value=value)
+        content: TelemetryField = row.fields.add(name="content")
+        containers_by_path: Dict[Tuple[str, ...], TelemetryField] = {(): content}
+        for containers, name, kind in _leaves(sensor, variant):
+            for depth in range(1, len(containers) + 1):
+                if tuple(containers[:depth]) not in containers_by_path:
+                    containers_by_path[tuple(containers[:depth])] = containers_by_path[
+                        tuple(containers[:depth - 1])].fields.add(name=containers[depth - 1])
+            value: Any = _value(rng, name, kind)
+            containers_by_path[tuple(containers)].fields.add(
+                name=name, **{{"uint": "uint64_value", "float": "double_value", "bool": "bool_value",
+                               "string": "string_value"}[kind]: value})
+    return [telemetry.SerializeToString(deterministic=True)]
+
+
+def build_corpus(sensors: List[str] = None, variants: List[str] = None, formats: List[str] = None,
+                 seed: int = 0) -> List[CorpusEntry]:
+    """Generate the corpus, every entry has its own random stream so filtering doesn't change the bytes
+
+    :param sensors: Sensors to generate, defaults to all of them
+    :type sensors: List[str]
+    :param variants: Variants to generate, defaults to all of them
+    :type variants: List[str]
+    :param formats: Formats out of FORMATS, defaults to all of them
+    :type formats: List[str]
+    :param seed: Seed of the leaf values
+    :type seed: int
+
+    """
+    corpus: List[CorpusEntry] = []
+    for sensor_name in sensors or SENSORS:
+        for variant_name in variants or VARIANTS:
+            for encoding in formats or FORMATS:
+                if encoding in GNMI_ENCODINGS:
+                    # Every gNMI encoding carries the values of the PROTO payloads
+                    rng: random.Random = random.Random(f"{seed}-{sensor_name}-{variant_name}-gnmi")
+                    if encoding == "gnmi-json-tree":
+                        payloads: List[bytes] = gnmi_tree_payloads(SENSORS[sensor_name], VARIANTS[variant_name], rng)
+                    else:
+                        payloads = gnmi_payloads(SENSORS[sensor_name], VARIANTS[variant_name], rng,
+                                                 GNMI_ENCODINGS[encoding])
+                else:
+                    rng = random.Random(f"{seed}-{sensor_name}-{variant_name}-{encoding}")
+                    payloads = ems_payloads(SENSORS[sensor_name], VARIANTS[variant_name], rng)
+                corpus.append(CorpusEntry(sensor_name, variant_name, encoding, payloads))
+    return corpus
+
+
+def main() -> None:
+    from capture.capture import CaptureWriter
+
+    parser = ArgumentParser(description="Write the parser benchmark corpus as capture files")
+    parser.add_argument("-o", "--output", dest="output", type=Path, required=True,
+                        help="Directory to write a capture directory per corpus entry to")
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    args = parser.parse_args()
+    for entry in build_corpus(seed=args.seed):
+        writer: CaptureWriter = CaptureWriter(args.output / entry.name)
+        for frame in entry.frames():
+            writer.write(*frame, arrival=TIMESTAMP_MS / 1e3)
+        writer.close()
+        print(f"{entry.name}: {len(entry.payloads)} messages, {sum(len(payload) for payload in entry.payloads)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+.. module:: dispatcher_benchmark
+   :platform: Unix
+   :synopsis: CPU the dispatcher spends per message watching the inputs, polling every input or waiting on sentinels
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+
+Starts one idle process per device as the inputs and a producer putting messages on the data queue,
+then takes the messages off the queue the way the dispatcher does and reports the dispatcher CPU time::
+
+    python benchmarks/dispatcher_benchmark.py --devices 100,1000 --messages 20000
+
+poll checks is_alive() of every input per message like the dispatcher used to, event waits on the
+input sentinels with the ProcessWatcher thread of rtnm.py.
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from multiprocessing import Process
+from pathlib import Path
+from threading import Event
+from time import sleep, perf_counter, process_time
+from typing import List, Dict, Any
+
+from pipeline_benchmark import BENCHMARKS_DIR, RTNM_DIR, git_revision
+
+sys.path.insert(0, str(RTNM_DIR))
+
+from backpressure.backpressure import FrameQueue
+from supervisor.supervisor import ProcessWatcher
+
+MODES: List[str] = ["poll", "event"]
+
+
+def produce(queue: FrameQueue, messages: int, payload_size: int) -> None:
+    payload: bytes = b"\0" * payload_size
+    for message in range(messages):
+        queue.put(("gnmi", payload, "benchmark", "7.3.1", f"10.0.{message % 256}.1", 0.0))
+
+
+def dispatch(mode: str, inputs: List[Process], messages: int, payload_size: int) -> Dict[str, float]:
+    """Take messages off the data queue until all of them arrived, checking the inputs like the dispatcher"""
+    queue: FrameQueue = FrameQueue(messages * payload_size)
+    input_exited: Event = Event()
+    watcher: ProcessWatcher = ProcessWatcher(lambda process: input_exited.set())
+    if mode == "event":
+        for process in inputs:
+            watcher.watch(process)
+        watcher.start()
+    producer: Process = Process(target=produce, args=(queue, messages, payload_size))
+    producer.start()
+    received: int = 0
+    start_cpu: float = process_time()
+    start: float = perf_counter()
+    while received < messages:
+        if mode == "poll":
+            if not all([process.is_alive() for process in inputs]):
+                break
+        elif input_exited.is_set():
+            break
+        if queue.get(timeout=10) is not None:
+            received += 1
+    cpu: float = process_time() - start_cpu
+    elapsed: float = perf_counter() - start
+    producer.join()
+    if mode == "event":
+        watcher.stop()
+    return {"received": received, "cpu_seconds": cpu, "seconds": elapsed,
+            "cpu_us_per_message": cpu / max(received, 1) * 1e6, "messages_per_second": received / elapsed}
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Dispatcher CPU per message against the number of inputs")
+    parser.add_argument("--devices", dest="devices", default="10,100,1000", help="Comma separated input counts")
+    parser.add_argument("--messages", dest="messages", type=int, default=20000, help="Messages per run")
+    parser.add_argument("--payload-size", dest="payload_size", type=int, default=512, help="Bytes per message")
+    parser.add_argument("--modes", dest="modes", default=",".join(MODES), help="poll and/or event")
+    parser.add_argument("--output", dest="output", type=Path,
+                        help="Result file, defaults to benchmarks/results/dispatcher-<timestamp>-<revision>.json")
+    args = parser.parse_args()
+    revision: str = git_revision()
+    results: List[Dict[str, Any]] = []
+    print(f"{'devices':>8}{'mode':>8}{'cpu us/msg':>14}{'msg/s':>12}")
+    for devices in [int(count) for count in args.devices.split(",")]:
+        inputs: List[Process] = [Process(target=sleep, args=(3600,), daemon=True) for _ in range(devices)]
+        for process in inputs:
+            process.start()
+        try:
+            for mode in args.modes.split(","):
+                result: Dict[str, Any] = {"devices": devices, "mode": mode, "messages": args.messages,
+                                          **dispatch(mode, inputs, args.messages, args.payload_size)}
+                print(f"{devices:>8}{mode:>8}{result['cpu_us_per_message']:>14.1f}"
+                      f"{result['messages_per_second']:>12.0f}")
+                results.append(result)
+        finally:
+            for process in inputs:
+                process.terminate()
+            for process in inputs:
+                process.join()
+    output: Path = args.output or (BENCHMARKS_DIR / "results" /
+                                   f"dispatcher-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump({"revision": revision, "arguments": {**vars(args), "output": str(args.output)},
+                   "results": results}, result_file, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+.. module:: mock_tsdb
+   :platform: Unix, Windows
+   :synopsis: Local stand in for the InfluxDB write API that counts, validates and times the points RTNM uploads
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import time
+from typing import Dict, List, Any, Tuple
+
+
+class MockTSDBStats:
+    """Counters of what the mock TSDB received, latency is the time from the timestamp of a point until it arrived"""
+
+    def __init__(self) -> None:
+        self.lock: Lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests: int = 0
+        self.points: int = 0
+        self.invalid: int = 0
+        self.bytes: int = 0
+        self.latencies: List[float] = []
+
+    def record(self, body_size: int, points: int, invalid: int, latencies: List[float]) -> None:
+        with self.lock:
+            self.requests += 1
+            self.bytes += body_size
+            self.points += points
+            self.invalid += invalid
+            self.latencies.extend(latencies)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies: List[float] = sorted(self.latencies)
+
+            def percentile(fraction: float) -> float:
+                if not latencies:
+                    return 0.0
+                return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+            return {"requests": self.requests, "points": self.points, "invalid": self.invalid,
+                    "bytes": self.bytes, "latency_p50": percentile(0.5), "latency_p99": percentile(0.99)}
+
+
+def parse_line_protocol(body: str, now: float) -> Tuple[int, int, List[float]]:
+    """Validate InfluxDB line protocol and measure the latency of every point
+
+    :param body: The body of a write request
+    :type body: str
+    :param now: When the request arrived
+    :type now: float
+    :return: The number of valid points, invalid lines and the latency of every valid point in seconds
+    """
+    points: int = 0
+    invalid: int = 0
+    latencies: List[float] = []
+    for line in body.split("\n"):
+        if not line:
+            continue
+        head, _, timestamp = line.rpartition(" ")
+        measurement, _, fields = head.replace("\\ ", "\0").partition(" ")
+        if not measurement or "=" not in fields or not timestamp.isdigit():
+            invalid += 1
+            continue
+        points += 1
+        latencies.append(now - int(timestamp) / 1e9)
+    return points, invalid, latencies
+
+
+class MockTSDB(Thread):
+    """HTTP server answering POST /api/v2/write like InfluxDB 2
+
+    :param port: The port to listen on, 0 picks a free port
+    :type port: int
+    :param address: The address to bind to
+    :type address: str
+
+    """
+
+    def __init__(self, port: int = 0, address: str = "127.0.0.1") -> None:
+        super().__init__(name="mock-tsdb", daemon=True)
+        self.stats: MockTSDBStats = MockTSDBStats()
+        stats: MockTSDBStats = self.stats
+
+        class MockTSDBHandler(BaseHTTPRequestHandler):
+            def _reply(self, code: int, body: bytes = b"", content_type: str = "application/json") -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self) -> None:
+                now: float = time()
+                body: bytes = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                size: int = len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                if self.path.startswith("/api/v2/write"):
+                    points, invalid, latencies = parse_line_protocol(body.decode("utf-8"), now)
+                    stats.record(size, points, invalid, latencies)
+                    # Invalid lines are counted rather than rejected so a benchmark run isn't cut short
+                    self._reply(204)
+                else:
+                    self._reply(404)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.http_server: ThreadingHTTPServer = ThreadingHTTPServer((address, port), MockTSDBHandler)
+        self.port: int = self.http_server.server_address[1]
+
+    def run(self) -> None:
+        self.http_server.serve_forever()
+
+    def stop(self) -> None:
+        self.http_server.shutdown()
@@ -0,0 +1,141 @@
+"""
+.. module:: parser_benchmark
+   :platform: Unix, Windows
+   :synopsis: Microbenchmarks of decoding and parsing the corpus with RTNMParser
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+
+Reports microseconds per message and the memory every message allocates for each parser stage::
+
+    python benchmarks/parser_benchmark.py --sensors interfaces,bgp --variants large
+
+The gnmi, gnmi-ascii and gnmi-json formats carry the same values in the PROTO, ASCII and JSON_IETF
+subscribe encodings, comparing them shows what the encoding a device is subscribed with costs, gnmi-json-tree
+times flattening whole JSON_IETF subtrees into leaf fields and key tags::
+
+    python benchmarks/parser_benchmark.py --formats gnmi,gnmi-ascii,gnmi-json,gnmi-json-tree --targets decode,parse
+
+Allocations are measured with tracemalloc over a single pass, blocks are those still held by
+the parsed output and peak is the most memory in use at once, including temporaries.
+"""
+import json
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import List, Dict, Any, Callable, Optional
+
+from corpus import build_corpus, CorpusEntry, HOSTNAME, VERSION, IP, SENSORS, VARIANTS, FORMATS
+from pipeline_benchmark import BENCHMARKS_DIR, git_revision
+
+from parsers.Parsers import RTNMParser
+from protos.gnmi_pb2 import SubscribeResponse
+from protos.telemetry_pb2 import Telemetry
+
+TARGETS: List[str] = ["decode", "parse", "parse_content"]
+
+
+def stage(target: str, entry: CorpusEntry) -> Optional[Callable[[Any], Any]]:
+    """The function benchmarked for a target on every decoded message of an entry, None if it doesn't apply"""
+    parser: RTNMParser = RTNMParser([], "benchmark")
+    if target == "decode":
+        message_type = SubscribeResponse if entry.frame_encoding == "gnmi" else Telemetry
+        return message_type.FromString
+    if target == "parse":
+        if entry.frame_encoding == "gnmi":
+            return lambda response: parser.parse_gnmi(response, HOSTNAME, VERSION, IP)
+        return lambda response: parser.parse_ems(response, VERSION, IP)
+    if target != "parse_content":
+        raise ValueError(f"Unknown target {target}, expected one of {', '.join(TARGETS)}")
+    if entry.frame_encoding == "gnmi":
+        return None
+
+    def parse_content(response: Telemetry) -> Dict[str, Any]:
+        parsed_content: Dict[str, Any] = {}
+        for row in response.data_gpbkv:
+            parser.parse_content(row.fields[1], "", parsed_content)
+        return parsed_content
+    return parse_content
+
+
+def measure(function: Callable[[Any], Any], messages: List[Any], number: int, repeat: int) -> Dict[str, float]:
+    """Time the function over every message number times, keeping the best of repeat runs, then
+    trace a single pass for allocations
+
+    """
+    best: float = float("inf")
+    for _ in range(repeat):
+        start: float = perf_counter()
+        for _ in range(number):
+            for message in messages:
+                function(message)
+        best = min(best, perf_counter() - start)
+    tracemalloc.start()
+    results: List[Any] = [function(message) for message in messages]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    tracemalloc.start()
+    before: tracemalloc.Snapshot = tracemalloc.take_snapshot()
+    results = [function(message) for message in messages]
+    after: tracemalloc.Snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks: int = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "lineno"))
+    del results
+    return {
+        "us_per_message": best / (number * len(messages)) * 1e6,
+        "blocks_per_message": blocks / len(messages),
+        "peak_bytes_per_message": peak / len(messages),
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Microbenchmarks of the RTNM parsers over a deterministic corpus")
+    parser.add_argument("--sensors", dest="sensors", default=",".join(SENSORS), help="Comma separated sensors")
+    parser.add_argument("--variants", dest="variants", default=",".join(VARIANTS), help="Comma separated variants")
+    parser.add_argument("--formats", dest="formats", default=",".join(FORMATS),
+                        help=f"Comma separated formats out of {', '.join(FORMATS)}")
+    parser.add_argument("--targets", dest="targets", default=",".join(TARGETS),
+                        help=f"Comma separated stages out of {', '.join(TARGETS)}")
+    parser.add_argument("-n", "--number", dest="number", type=int, default=100,
+                        help="Passes over the messages of an entry per timing run")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5, help="Timing runs, the best is kept")
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    parser.add_argument("--output", dest="output", type=Path,
+                        help="Result file, defaults to benchmarks/results/parsers-<timestamp>-<revision>.json")
+    args = parser.parse_args()
+    revision: str = git_revision()
+    results: List[Dict[str, Any]] = []
+    print(f"{'entry':<28}{'target':<15}{'us/msg':>12}{'blocks/msg':>12}{'peak B/msg':>12}")
+    for entry in build_corpus(args.sensors.split(","), args.variants.split(","), args.formats.split(","), args.seed):
+        decoder = stage("decode", entry)
+        for target in args.targets.split(","):
+            function: Optional[Callable[[Any], Any]] = stage(target, entry)
+            if function is None:
+                continue
+            messages: List[Any] = entry.payloads if target == "decode" else [decoder(payload)
+                                                                             for payload in entry.payloads]
+            result: Dict[str, Any] = {"entry": entry.name, "sensor": entry.sensor, "variant": entry.variant,
+                                      "format": entry.encoding, "target": target, "messages": len(messages),
+                                      "payload_bytes": sum(len(payload) for payload in entry.payloads)}
+            try:
+                result.update(measure(function, messages, args.number, args.repeat))
+                print(f"{entry.name:<28}{target:<15}{result['us_per_message']:>12.1f}"
+                      f"{result['blocks_per_message']:>12.1f}{result['peak_bytes_per_message']:>12.0f}")
+            except Exception as error:
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                result["error"] = f"{type(error).__name__}: {error}"
+                print(f"{entry.name:<28}{target:<15}  failed: {result['error']}")
+            results.append(result)
+    output: Path = args.output or (BENCHMARKS_DIR / "results" /
+                                   f"parsers-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump({"revision": revision, "arguments": {**vars(args), "output": str(args.output)},
+                   "results": results}, result_file, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+.. module:: pipeline_benchmark
+   :platform: Unix
+   :synopsis: End to end throughput benchmark of rtnm.py against simulated devices and a mock TSDB
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+
+Every combination of device count, batch size and worker pool size starts the device simulator,
+a mock InfluxDB and rtnm.py, waits out a warm up, then measures for a fixed duration::
+
+    python benchmarks/pipeline_benchmark.py --devices 10,100 --batch-sizes 100,1000 --workers 2,4
+
+Results are written as JSON to benchmarks/results so regressions can be tracked across commits.
+"""
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser, Namespace
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+from threading import Event, Thread
+from time import sleep, monotonic
+from typing import Dict, List, Any
+from urllib.request import urlopen
+
+from mock_tsdb import MockTSDB
+
+BENCHMARKS_DIR: Path = Path(__file__).absolute().parent
+RTNM_DIR: Path = BENCHMARKS_DIR.parent / "rtnm"
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def process_tree(pid: int) -> List[int]:
+    """The pid and the pids of every descendant of a process, read from /proc"""
+    pids: List[int] = [pid]
+    for child in pids:
+        try:
+            for task in os.listdir(f"/proc/{child}/task"):
+                with open(f"/proc/{child}/task/{task}/children") as children:
+                    pids.extend(int(grandchild) for grandchild in children.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def tree_rss(pid: int) -> int:
+    """Resident set size in bytes of a process and all of its descendants"""
+    rss: int = 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return rss
+
+
+class RSSSampler(Thread):
+    """Track the peak resident set size of a process tree"""
+
+    def __init__(self, pid: int, interval: float = 0.5) -> None:
+        super().__init__(daemon=True)
+        self.pid: int = pid
+        self.interval: float = interval
+        self.peak: int = 0
+        self.stopped: Event = Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, tree_rss(self.pid))
+
+
+def messages_received(metrics_port: int) -> float:
+    """Total messages the dispatcher received, scraped from the RTNM metrics endpoint"""
+    try:
+        with urlopen(f"http://127.0.0.1:{metrics_port}/metrics", timeout=5) as response:
+            body: str = response.read().decode("utf-8")
+    except OSError:
+        return 0.0
+    return sum(float(line.rsplit(" ", 1)[1]) for line in body.splitlines()
+               if line.startswith("rtnm_messages_received_total"))
+
+
+def stop_process(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+def run_case(args: Namespace, devices: int, batch_size: int, workers: int) -> Dict[str, Any]:
+    """Run one combination of the benchmark matrix and return its results"""
+    mock: MockTSDB = MockTSDB()
+    mock.start()
+    device_port: int = free_port()
+    metrics_port: int = free_port()
+    with tempfile.TemporaryDirectory() as work_dir:
+        simulator: subprocess.Popen = subprocess.Popen(
+            [sys.executable, "-m", "simulator.simulator", "dial-in", "--devices", str(devices),
+             "--port", str(device_port), "--rate", str(args.rate), "--interfaces", str(args.interfaces),
+             "--counters", str(args.counters), "--processes", str(args.simulator_processes),
+             "--format", args.format, "--write-config", str(Path(work_dir) / "benchmark.ini"),
+             "--output-port", str(mock.port)],
+            cwd=RTNM_DIR, start_new_session=True, stdout=subprocess.DEVNULL)
+        while not (Path(work_dir) / "benchmark.ini").exists():
+            sleep(0.1)
+        sleep(args.simulator_startup)
+        rtnm: subprocess.Popen = subprocess.Popen(
+            [sys.executable, str(RTNM_DIR / "rtnm.py"), "-c", "benchmark.ini", "-b", str(batch_size),
+             "-w", str(workers), "-r", "-m", str(metrics_port)],
+            cwd=work_dir, start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        rss: RSSSampler = RSSSampler(rtnm.pid)
+        rss.start()
+        try:
+            sleep(args.warmup)
+            mock.stats.reset()
+            start_messages: float = messages_received(metrics_port)
+            start: float = monotonic()
+            sleep(args.duration)
+            elapsed: float = monotonic() - start
+            received: float = messages_received(metrics_port) - start_messages
+            stats: Dict[str, Any] = mock.stats.snapshot()
+        finally:
+            rss.stopped.set()
+            stop_process(rtnm)
+            stop_process(simulator)
+            mock.stop()
+    return {
+        "devices": devices,
+        "batch_size": batch_size,
+        "workers": workers,
+        "format": args.format,
+        "duration": elapsed,
+        "messages_per_second": received / elapsed,
+        "points_per_second": stats["points"] / elapsed,
+        "latency_p50": stats["latency_p50"],
+        "latency_p99": stats["latency_p99"],
+        "peak_rss_bytes": rss.peak,
+        "requests": stats["requests"],
+        "bytes_uploaded": stats["bytes"],
+        "invalid_points": stats["invalid"],
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = ArgumentParser(description="End to end throughput benchmark of the RTNM pipeline")
+    parser.add_argument("--devices", dest="devices", default="10", help="Comma separated device counts")
+    parser.add_argument("--batch-sizes", dest="batch_sizes", default="100", help="Comma separated batch sizes")
+    parser.add_argument("--workers", dest="workers", default="2", help="Comma separated worker pool sizes")
+    parser.add_argument("--format", dest="format", choices=["gnmi", "cisco-ems"], default="gnmi")
+    parser.add_argument("--rate", dest="rate", type=float, default=1.0, help="Rounds of counters per second per device")
+    parser.add_argument("--interfaces", dest="interfaces", type=int, default=16)
+    parser.add_argument("--counters", dest="counters", type=int, default=16)
+    parser.add_argument("--simulator-processes", dest="simulator_processes", type=int, default=1)
+    parser.add_argument("--simulator-startup", dest="simulator_startup", type=float, default=2.0)
+    parser.add_argument("--warmup", dest="warmup", type=float, default=10.0, help="Seconds before measuring")
+    parser.add_argument("--duration", dest="duration", type=float, default=30.0, help="Seconds to measure")
+    parser.add_argument("--output", dest="output", type=Path,
+                        help="Result file, defaults to benchmarks/results/<timestamp>-<revision>.json")
+    args = parser.parse_args()
+    revision: str = git_revision()
+    results: List[Dict[str, Any]] = []
+    for devices, batch_size, workers in product([int(x) for x in args.devices.split(",")],
+                                                [int(x) for x in args.batch_sizes.split(",")],
+                                                [int(x) for x in args.workers.split(",")]):
+        print(f"Running {devices} devices, batch size {batch_size}, {workers} workers", flush=True)
+        result: Dict[str, Any] = run_case(args, devices, batch_size, workers)
+        print(f"  {result['messages_per_second']:.0f} msgs/s, {result['points_per_second']:.0f} points/s, "
+              f"p50 {result['latency_p50']:.3f}s, p99 {result['latency_p99']:.3f}s, "
+              f"peak RSS {result['peak_rss_bytes'] / 1048576:.0f} MiB", flush=True)
+        results.append(result)
+    output: Path = args.output or (BENCHMARKS_DIR / "results" /
+                                   f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump({"revision": revision, "arguments": {**vars(args), "output": str(args.output)},
+                   "results": results}, result_file, indent=2, default=str)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
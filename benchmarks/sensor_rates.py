@@ -0,0 +1,91 @@
+"""
+.. module:: sensor_rates
+   :platform: Unix, Windows
+   :synopsis: Messages per second of every sensor path scraped from a running rtnm.py, compared against a baseline
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+
+Measure the rates with the current subscriptions and save them, change the subscription options of
+the inputs (ON_CHANGE, TARGET_DEFINED, suppress-redundant, heartbeat-interval, updates-only), restart
+rtnm.py and compare::
+
+    python benchmarks/sensor_rates.py --metrics-port 8000 --interval 120 --output before.json
+    python benchmarks/sensor_rates.py --metrics-port 8000 --interval 120 --baseline before.json
+
+Rates come from the count of rtnm_device_to_collector_seconds, one observation per message of a device and path.
+"""
+import json
+import re
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+from time import sleep, monotonic
+from typing import Dict, Tuple
+from urllib.request import urlopen
+
+from pipeline_benchmark import BENCHMARKS_DIR, git_revision
+
+COUNT_LINE: re.Pattern = re.compile(
+    r'^rtnm_device_to_collector_seconds_count\{device="(?P<device>[^"]*)",path="(?P<path>[^"]*)"\} (?P<value>\S+)$')
+
+
+def scrape(metrics_port: int) -> Dict[Tuple[str, str], float]:
+    """Messages received so far keyed by device and path"""
+    with urlopen(f"http://127.0.0.1:{metrics_port}/metrics", timeout=10) as response:
+        body: str = response.read().decode("utf-8")
+    counts: Dict[Tuple[str, str], float] = {}
+    for line in body.splitlines():
+        match = COUNT_LINE.match(line)
+        if match:
+            counts[(match["device"], match["path"])] = float(match["value"])
+    return counts
+
+
+def path_rates(before: Dict[Tuple[str, str], float], after: Dict[Tuple[str, str], float],
+               seconds: float) -> Dict[str, Dict[str, float]]:
+    """Messages per second of every path summed over the devices and the number of devices sending it"""
+    rates: Dict[str, Dict[str, float]] = {}
+    for (device, path), count in after.items():
+        rate: Dict[str, float] = rates.setdefault(path, {"messages_per_second": 0.0, "devices": 0})
+        rate["messages_per_second"] += (count - before.get((device, path), 0.0)) / seconds
+        rate["devices"] += 1
+    return rates
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Per sensor message rates of a running rtnm.py")
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int, required=True,
+                        help="The --metrics-port of rtnm.py")
+    parser.add_argument("--interval", dest="interval", type=float, default=60.0,
+                        help="Seconds between the two scrapes, longer than the largest sample or heartbeat interval")
+    parser.add_argument("--baseline", dest="baseline", type=Path, help="Result file of an earlier run to compare to")
+    parser.add_argument("--output", dest="output", type=Path,
+                        help="Result file, defaults to benchmarks/results/sensor-rates-<timestamp>-<revision>.json")
+    args = parser.parse_args()
+    before: Dict[Tuple[str, str], float] = scrape(args.metrics_port)
+    start: float = monotonic()
+    sleep(args.interval)
+    after: Dict[Tuple[str, str], float] = scrape(args.metrics_port)
+    rates: Dict[str, Dict[str, float]] = path_rates(before, after, monotonic() - start)
+    baseline: Dict[str, Dict[str, float]] = {}
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["paths"]
+    print(f"{'path':<70}{'devices':>8}{'msg/s':>12}{'baseline':>12}{'reduction':>11}")
+    for path in sorted(set(rates) | set(baseline)):
+        current: float = rates.get(path, {}).get("messages_per_second", 0.0)
+        line: str = f"{path:<70}{rates.get(path, {}).get('devices', 0):>8}{current:>12.2f}"
+        if path in baseline:
+            previous: float = baseline[path]["messages_per_second"]
+            reduction: float = 1 - current / previous if previous else 0.0
+            line += f"{previous:>12.2f}{reduction:>11.1%}"
+        print(line)
+    output: Path = args.output or (BENCHMARKS_DIR / "results" /
+                                   f"sensor-rates-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{git_revision()}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump({"interval": args.interval, "baseline": str(args.baseline), "paths": rates}, result_file, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+.. module:: backpressure
+   :platform: Unix
+   :synopsis: Data queue bounded in bytes with a policy for when it is full (block, drop the oldest frames or spill to disk)
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import os
+from logging import Logger, getLogger
+from multiprocessing import Queue, Value, Condition
+from pathlib import Path
+from queue import Empty
+from threading import Lock, Thread
+from typing import Tuple, Optional, Iterator, List, Dict, Any
+
+from capture.capture import CaptureWriter, read_capture
+from framing.framing import frame_count, unpack_frames
+from metrics.metrics import FRAMES_DROPPED, BYTES_DROPPED, FRAMES_SPILLED, QUEUE_BYTES
+
+BLOCK: str = "block"
+DROP_OLDEST: str = "drop-oldest"
+SPILL: str = "spill"
+POLICIES: List[str] = [BLOCK, DROP_OLDEST, SPILL]
+
+Frame = Tuple[str, bytes, Optional[str], Optional[str], str, float]
+
+
+class FrameQueue:
+    """Queue between the inputs and the dispatcher that holds at most max_bytes of payloads,
+    when a frame doesn't fit the policy decides what happens:
+
+    * block: the input waits for room, a gRPC input stops reading its stream so HTTP/2 flow control
+      pushes back on the device
+    * drop-oldest: frames are taken off the head of the queue until the new one fits
+    * spill: the input writes frames to capture files under spill_path and a thread of the input queues them
+      again, in order, once the queue is down to half of max_bytes, whether or not the input still puts frames,
+      leftover spill files can be replayed with --replay
+
+    A single frame larger than max_bytes is let through when the queue is empty
+
+    :param max_bytes: Bytes of payloads the queue holds before the policy applies
+    :type max_bytes: int
+    :param policy: block, drop-oldest or spill
+    :type policy: str
+    :param spill_path: Directory each input spills to its own subdirectory of
+    :type spill_path: Path
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+
+    def __init__(self, max_bytes: int, policy: str = BLOCK, spill_path: Path = Path("spill"),
+                 log_name: str = "") -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy {policy}, policies are {', '.join(POLICIES)}")
+        self.max_bytes: int = max_bytes
+        self.policy: str = policy
+        self.spill_path: Path = spill_path
+        self.log_name: str = log_name
+        self.queue: Queue = Queue()
+        self.queued_bytes = Value("q", 0)
+        self.not_full: Condition = Condition(self.queued_bytes.get_lock())
+        self.dropped_frames = Value("q", 0)
+        self.dropped_bytes = Value("q", 0)
+        self.spilled_frames = Value("q", 0)
+        self._exported: Dict[str, int] = {"dropped_frames": 0, "dropped_bytes": 0, "spilled_frames": 0}
+        # Spill state of the process putting frames, shared by the client threads of a DeviceGroup process
+        self._spill_lock: Lock = Lock()
+        self._spill_writer: Optional[CaptureWriter] = None
+        self._spill_files: List[Path] = []
+        self._spill_reader: Optional[Iterator[Tuple[Dict[str, Any], bytes]]] = None
+        self._drainer: Optional[Thread] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state: Dict[str, Any] = self.__dict__.copy()
+        del state["_spill_lock"]
+        del state["_drainer"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._spill_lock = Lock()
+        self._drainer = None
+
+    def _has_room(self, size: int) -> bool:
+        return self.queued_bytes.value + size <= self.max_bytes or self.queued_bytes.value == 0
+
+    def put(self, frame: Frame) -> None:
+        """Put a frame on the queue applying the policy when it is full, called by the inputs"""
+        size: int = len(frame[1])
+        if self.policy == SPILL:
+            self._put_spill(frame, size)
+            return
+        with self.not_full:
+            if self.policy == BLOCK:
+                while not self._has_room(size):
+                    self.not_full.wait(1)
+            else:
+                while not self._has_room(size):
+                    try:
+                        # Frames can still be in the feeder thread of an input for a moment after they were put
+                        oldest: Optional[Frame] = self.queue.get(timeout=0.1)
+                    except Empty:
+                        break
+                    if oldest is None:
+                        # The wake of the dispatcher, it is put back and the frame let through
+                        self.queue.put(None)
+                        break
+                    self.queued_bytes.value -= len(oldest[1])
+                    with self.dropped_frames.get_lock():
+                        self.dropped_frames.value += frame_count(oldest)
+                    with self.dropped_bytes.get_lock():
+                        self.dropped_bytes.value += len(oldest[1])
+            self.queued_bytes.value += size
+        self.queue.put(frame)
+
+    def _put_spill(self, frame: Frame, size: int) -> None:
+        with self._spill_lock:
+            if self._spill_writer is not None or self._spill_files:
+                self._spill(frame)
+            else:
+                with self.not_full:
+                    if not self._has_room(size):
+                        self._spill(frame)
+                        return
+                    self.queued_bytes.value += size
+                self.queue.put(frame)
+            self._unspill()
+
+    def _spill(self, frame: Frame) -> None:
+        if self._spill_writer is None:
+            path: Path = self.spill_path / f"{os.getpid()}"
+            if not self._spill_files:
+                getLogger(self.log_name).warning(f"Data queue is full, spilling frames to {path}")
+            self._spill_writer = CaptureWriter(path, max_files=0)
+            if self._drainer is None:
+                self._drainer = Thread(target=self._drain_spill, name=f"spill-drainer-{os.getpid()}", daemon=True)
+                self._drainer.start()
+        for unpacked in unpack_frames(frame):
+            self._spill_writer.write_frame(unpacked)
+        with self.spilled_frames.get_lock():
+            self.spilled_frames.value += frame_count(frame)
+
+    def _drain_spill(self) -> None:
+        """Queue spilled frames again as the dispatcher makes room until none are left, so the spill files
+        of an input that stopped putting frames drain too
+
+        """
+        while True:
+            with self._spill_lock:
+                self._unspill()
+                if self._spill_writer is None and not self._spill_files and self._spill_reader is None:
+                    self._drainer = None
+                    return
+            with self.not_full:
+                self.not_full.wait(1)
+
+    def _unspill(self) -> None:
+        """Queue spilled frames again in the order they were spilled while there is room"""
+        log: Logger = getLogger(self.log_name)
+        while True:
+            if self._spill_reader is None:
+                if not self._spill_files:
+                    if self._spill_writer is None or self.queued_bytes.value > self.max_bytes // 2:
+                        return
+                    self._spill_writer.close()
+                    self._spill_files = self._spill_writer.files
+                    self._spill_writer = None
+                    log.info(f"Data queue has room, queueing {len(self._spill_files)} spill files again")
+                self._spill_reader = read_capture(self._spill_files[0])
+            with self.not_full:
+                if self.queued_bytes.value >= self.max_bytes:
+                    return
+                try:
+                    metadata, payload = next(self._spill_reader)
+                except StopIteration:
+                    self._spill_reader = None
+                    self._spill_files.pop(0).unlink()
+                    continue
+                self.queued_bytes.value += len(payload)
+            self.queue.put((metadata["encoding"], payload, metadata["hostname"], metadata["version"],
+                            metadata["ip"], metadata["arrival"]))
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Frame]:
+        """Take a frame off the queue, called by the dispatcher
+
+        :param timeout: Seconds to wait for a frame
+        :type timeout: Optional[float]
+        :raises: Empty
+
+        """
+        frame: Optional[Frame] = self.queue.get(timeout=timeout)
+        if frame is not None:
+            with self.not_full:
+                self.queued_bytes.value -= len(frame[1])
+                self.not_full.notify_all()
+        return frame
+
+    def wake(self) -> None:
+        """Wake the dispatcher blocked in get, which returns None"""
+        self.queue.put(None)
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    def export_metrics(self) -> None:
+        """Record the bytes queued and any frames dropped or spilled since the last call in the metrics registry"""
+        QUEUE_BYTES.set(self.queued_bytes.value)
+        for name, counter in [("dropped_frames", FRAMES_DROPPED), ("dropped_bytes", BYTES_DROPPED),
+                              ("spilled_frames", FRAMES_SPILLED)]:
+            value: int = getattr(self, name).value
+            if value > self._exported[name]:
+                counter.inc(value - self._exported[name], policy=self.policy)
+                self._exported[name] = value
@@ -0,0 +1,89 @@
+"""
+.. module:: cache
+   :platform: Unix, Windows
+   :synopsis: On disk cache of the hostname and version of every device shared by the dial in clients
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import json
+import os
+import threading
+from logging import Logger, getLogger
+from pathlib import Path
+from time import time
+from typing import Dict, Any, Optional, List
+
+
+class DeviceMetadataCache:
+    """Hostname, software version, a fingerprint of the gNMI capabilities and the encodings of every device,
+    one JSON file per device address shared by every input of the device, an input only fills in the fields it
+    knows so a cisco-ems input, which has no hostname, never clears the hostname stored by a gNMI input
+
+    :param path: Directory of the cache files
+    :type path: Path
+    :param ttl: Seconds an entry is used before it is refreshed in the background
+    :type ttl: float
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+
+    def __init__(self, path: Path, ttl: float = 86400.0, log_name: str = "") -> None:
+        self.path: Path = path
+        self.ttl: float = ttl
+        self.log_name: str = log_name
+
+    def _file_name(self, address: str) -> Path:
+        return self.path / f"{address.replace(':', '_').replace('/', '_')}.json"
+
+    def load(self, address: str) -> Optional[Dict[str, Any]]:
+        """The cached metadata of a device, None if it was never cached or the file is unreadable
+
+        :param address: host:port of the device
+        :type address: str
+
+        """
+        try:
+            with open(self._file_name(address)) as cache_file:
+                return json.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            getLogger(self.log_name).warning(f"Ignoring unreadable metadata cache of {address}: {error}")
+            return None
+
+    def store(self, address: str, hostname: Optional[str], version: Optional[str], capabilities: str,
+              encodings: Optional[List[str]] = None) -> None:
+        """Merge the metadata of a device into its entry, empty values keep what is already cached,
+        the file is replaced atomically so readers never see a partial entry
+
+        :param address: host:port of the device
+        :type address: str
+        :param hostname: Hostname of the device
+        :type hostname: Optional[str]
+        :param version: Software version of the device
+        :type version: Optional[str]
+        :param capabilities: Fingerprint of the gNMI capabilities of the device
+        :type capabilities: str
+        :param encodings: Names of the gNMI encodings the device supports
+        :type encodings: Optional[List[str]]
+
+        """
+        log: Logger = getLogger(self.log_name)
+        file_name: Path = self._file_name(address)
+        # Inputs sharing a DeviceGroup process write from their own threads
+        temporary: Path = file_name.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        entry: Dict[str, Any] = self.load(address) or {}
+        fields: Dict[str, Any] = {"hostname": hostname, "version": version, "capabilities": capabilities,
+                                  "encodings": encodings}
+        entry.update({field: value for field, value in fields.items() if value})
+        entry.update({"address": address, "updated": time()})
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(temporary, "w") as cache_file:
+                json.dump(entry, cache_file)
+            os.replace(temporary, file_name)
+        except OSError as error:
+            log.warning(f"Unable to write the metadata cache of {address}: {error}")
+
+    def is_stale(self, entry: Dict[str, Any]) -> bool:
+        return time() - entry.get("updated", 0) > self.ttl
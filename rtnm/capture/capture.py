@@ -0,0 +1,160 @@
+"""
+.. module:: capture
+   :platform: Unix, Windows
+   :synopsis: Record raw telemetry frames to rotating capture files and replay them into the pipeline
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import json
+from datetime import datetime
+from logging import Logger, getLogger
+from multiprocessing import Process, Queue
+from pathlib import Path
+from struct import Struct
+from time import time, sleep
+from typing import List, Tuple, Optional, Iterator, Dict, Any
+
+from errors.errors import CaptureFileError
+
+CAPTURE_MAGIC: bytes = b"RTNMCAP1"
+CAPTURE_SUFFIX: str = ".rtnmcap"
+# Length of the JSON metadata followed by the length of the payload of every record
+RECORD_HEADER: Struct = Struct(">II")
+
+Frame = Tuple[str, bytes, Optional[str], Optional[str], str, float]
+
+
+class CaptureWriter:
+    """Write every raw frame entering the pipeline to length prefixed capture files, rotating to
+    a new file when the current one reaches max_bytes and deleting the oldest past max_files
+
+    :param path: Directory to write capture files to
+    :type path: Path
+    :param max_bytes: Size a capture file grows to before rotating
+    :type max_bytes: int
+    :param max_files: Number of capture files to keep, 0 to keep them all
+    :type max_files: int
+
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 268435456, max_files: int = 10) -> None:
+        self.path: Path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes: int = max_bytes
+        self.max_files: int = max_files
+        self.files: List[Path] = []
+        self._file = None
+        self._size: int = 0
+        self._rotate()
+
+    def _rotate(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        file_name: Path = self.path / f"capture-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{CAPTURE_SUFFIX}"
+        self._file = open(file_name, "wb")
+        self._file.write(CAPTURE_MAGIC)
+        self._size = len(CAPTURE_MAGIC)
+        self.files.append(file_name)
+        if self.max_files and len(self.files) > self.max_files:
+            self.files.pop(0).unlink()
+
+    def write(self, encoding: str, payload: bytes, hostname: Optional[str], version: Optional[str],
+              ip: str, arrival: Optional[float] = None) -> None:
+        metadata: bytes = json.dumps({"encoding": encoding, "hostname": hostname, "version": version,
+                                      "ip": ip, "arrival": time() if arrival is None else arrival}).encode("utf-8")
+        if self._size >= self.max_bytes:
+            self._rotate()
+        self._file.write(RECORD_HEADER.pack(len(metadata), len(payload)))
+        self._file.write(metadata)
+        self._file.write(payload)
+        self._size += RECORD_HEADER.size + len(metadata) + len(payload)
+
+    def write_frame(self, frame: Frame) -> None:
+        self.write(*frame[:5], arrival=frame[5] if len(frame) > 5 else None)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def capture_files(path: Path) -> List[Path]:
+    """The capture files of a directory in the order they were written, or the file itself
+
+    :param path: A capture file or a directory of capture files
+    :type path: Path
+
+    """
+    if path.is_dir():
+        return sorted(path.glob(f"*{CAPTURE_SUFFIX}"))
+    return [path]
+
+
+def read_capture(path: Path) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+    """Read the metadata and payload of every record of a capture file
+
+    :param path: The capture file to read
+    :type path: Path
+    :raises: CaptureFileError
+
+    """
+    with open(path, "rb") as capture:
+        if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise CaptureFileError(f"{path} is not a capture file")
+        while True:
+            header: bytes = capture.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                raise CaptureFileError(f"Truncated record header in {path}")
+            metadata_length, payload_length = RECORD_HEADER.unpack(header)
+            metadata: Dict[str, Any] = json.loads(capture.read(metadata_length))
+            payload: bytes = capture.read(payload_length)
+            if len(payload) < payload_length:
+                raise CaptureFileError(f"Truncated record payload in {path}")
+            yield metadata, payload
+
+
+class CaptureReplayer(Process):
+    """Feed captured frames back into the pipeline the same way a dial in client does
+
+    :param path: A capture file or a directory of capture files
+    :type path: Path
+    :param data_queue: The queue the dispatcher reads frames from
+    :type data_queue: Queue
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+    :param speed: Multiple of the captured rate to replay at, 0 replays as fast as possible
+    :type speed: float
+    :param loop: Number of times to replay the capture
+    :type loop: int
+
+    """
+
+    def __init__(self, path: Path, data_queue: Queue, log_name: str, speed: float = 1.0, loop: int = 1) -> None:
+        super().__init__(name=f"replay-{path.name}")
+        self.path: Path = path
+        self.queue: Queue = data_queue
+        self.log: Logger = getLogger(log_name)
+        self.speed: float = speed
+        self.loop: int = loop
+
+    def run(self) -> None:
+        frames: int = 0
+        start: float = time()
+        for _ in range(self.loop):
+            replay_start: float = time()
+            first_arrival: Optional[float] = None
+            for capture_file in capture_files(self.path):
+                self.log.info(f"Replaying {capture_file}")
+                for metadata, payload in read_capture(capture_file):
+                    if self.speed > 0:
+                        if first_arrival is None:
+                            first_arrival = metadata["arrival"]
+                        delay: float = (metadata["arrival"] - first_arrival) / self.speed - (time() - replay_start)
+                        if delay > 0:
+                            sleep(delay)
+                    self.queue.put((metadata["encoding"], payload, metadata["hostname"], metadata["version"],
+                                    metadata["ip"], time()))
+                    frames += 1
+        total_time: float = time() - start
+        self.log.info(f"Replayed {frames} frames in {total_time:.2f}s ({frames / max(total_time, 1e-9):.0f} frames/s)")
@@ -0,0 +1,112 @@
+"""
+.. module:: channels
+   :platform: Unix, Windows
+   :synopsis: Reference counted gRPC channels shared by the dial in clients of a process connecting to the same device
+              and the named profiles of options they are created with
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+from distutils.util import strtobool
+from threading import Lock
+from typing import Dict, List, Tuple, Callable, Hashable, Any, Optional, Mapping
+
+# Options of every channel unless its profile changes them
+DEFAULT_CHANNEL_OPTIONS: List[Tuple[str, Any]] = [
+    ("grpc.ssl_target_name_override", "ems.cisco.com"),
+    ("grpc.keepalive_time_ms", 60000),
+    ("grpc.keepalive_timeout_ms", 10000),
+]
+
+
+def _milliseconds(seconds: str) -> int:
+    return int(float(seconds) * 1000)
+
+
+def _flag(value: str) -> int:
+    return int(strtobool(value))
+
+
+# Settings of a channel profile with the gRPC channel argument they set and how the value is converted,
+# other settings starting with grpc. are passed to gRPC as they are
+PROFILE_SETTINGS: Dict[str, Tuple[str, Callable[[str], Any]]] = {
+    "ssl-target-name-override": ("grpc.ssl_target_name_override", str),
+    "max-receive-message-size": ("grpc.max_receive_message_length", int),
+    "max-send-message-size": ("grpc.max_send_message_length", int),
+    "keepalive-time": ("grpc.keepalive_time_ms", _milliseconds),
+    "keepalive-timeout": ("grpc.keepalive_timeout_ms", _milliseconds),
+    "keepalive-without-calls": ("grpc.keepalive_permit_without_calls", _flag),
+    "max-pings-without-data": ("grpc.http2.max_pings_without_data", int),
+    "initial-window-size": ("grpc.http2.lookahead_bytes", int),
+    "bdp-probe": ("grpc.http2.bdp_probe", _flag),
+    "max-frame-size": ("grpc.http2.max_frame_size", int),
+    "write-buffer-size": ("grpc.http2.write_buffer_size", int),
+}
+
+
+def channel_options(settings: Mapping[str, str]) -> List[Tuple[str, Any]]:
+    """The options of a channel profile, its settings applied over DEFAULT_CHANNEL_OPTIONS
+
+    :param settings: The settings of the profile, the io key of its configuration section is ignored
+    :type settings: Mapping[str, str]
+    :raises: ValueError for a setting that isn't in PROFILE_SETTINGS or a gRPC channel argument
+
+    """
+    options: Dict[str, Any] = dict(DEFAULT_CHANNEL_OPTIONS)
+    for setting, value in settings.items():
+        if setting == "io":
+            continue
+        if setting in PROFILE_SETTINGS:
+            argument, convert = PROFILE_SETTINGS[setting]
+            options[argument] = convert(value)
+        elif setting.startswith("grpc."):
+            options[setting] = int(value) if value.lstrip("-").isdigit() else value
+        else:
+            raise ValueError(f"Unknown channel profile setting {setting}")
+    return list(options.items())
+
+
+class ChannelRegistry:
+    """gRPC channels keyed by target and channel credentials, every subscription to a device acquires the
+    same channel, so they share one HTTP/2 connection and TLS session, and the channel is closed when the
+    last of them releases it, a subscription that reconnects releases and acquires it again
+
+    """
+
+    def __init__(self) -> None:
+        self.channels: Dict[Hashable, List[Any]] = {}
+        self.lock: Lock = Lock()
+
+    def acquire(self, key: Hashable, create: Callable[[], Any]) -> Any:
+        """The channel of a key, created the first time it is acquired
+
+        :param key: The target and credentials of the channel
+        :type key: Hashable
+        :param create: Creates the channel
+        :type create: Callable[[], grpc.Channel]
+        :return: The channel
+        """
+        with self.lock:
+            entry: Optional[List[Any]] = self.channels.get(key)
+            if entry is None:
+                entry = self.channels[key] = [create(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, key: Hashable) -> None:
+        """Stop using the channel of a key, it is closed once nothing uses it"""
+        with self.lock:
+            entry: Optional[List[Any]] = self.channels.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self.channels[key]
+        entry[0].close()
+
+    def references(self) -> List[Tuple[Hashable, int]]:
+        with self.lock:
+            return [(key, entry[1]) for key, entry in self.channels.items()]
+
+
+# Shared by every dial in client of a process
+CHANNELS: ChannelRegistry = ChannelRegistry()
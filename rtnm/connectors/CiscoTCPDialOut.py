@@ -6,11 +6,14 @@
 """
 import json
 import logging
+from pathlib import Path
 from struct import Struct
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 
 from errors.errors import TelemetryTCPDialOutServerError
 from converters.converters import DataConverter
+from databases.databases import RETRYABLE_BULK_STATUS, bulk_backoff_delay, split_bulk_items, write_dead_letters
+from tornado import gen
 from tornado.httpclient import AsyncHTTPClient, HTTPError, HTTPRequest, HTTPResponse
 # from tornado.iostream import StreamClosedError
 from tornado.locks import Lock
@@ -29,10 +32,15 @@ class TelemetryTCPDialOutServer(TCPServer):
     :type batch_size: int
     :param log_name: Used for getting the application log
     :type log_name: str
+    :param dead_letter_file: File to append documents Elastic Search refused to index
+    :type dead_letter_file: Optional[str]
+    :param max_retries: Number of times rejected items are resent before being dead lettered
+    :type max_retries: int
 
     """
 
-    def __init__(self, address: str, port: str, batch_size: int, log_name: str) -> None:
+    def __init__(self, address: str, port: str, batch_size: int, log_name: str,
+                 dead_letter_file: Optional[str] = None, max_retries: int = 5) -> None:
         try:
             super().__init__()
             self.batch_size: int = batch_size
@@ -41,9 +49,27 @@ class TelemetryTCPDialOutServer(TCPServer):
             self.http_client = AsyncHTTPClient(max_clients=1000)
             self.log: logging.Logger = logging.getLogger(log_name)
             self.index_list: List[str] = []
+            if dead_letter_file is None:
+                dead_letter_file = str(Path().absolute() / "logs" / "elasticsearch-dead-letter.ndjson")
+            self.dead_letter_file: str = dead_letter_file
+            self.max_retries: int = max_retries
         except Exception as e:
             raise TelemetryTCPDialOutServerError(f"Error while initializing dial out server:\n {e}")
 
+    @classmethod
+    def from_output(cls, output: Dict[str, Any], batch_size: int, log_name: str) -> "TelemetryTCPDialOutServer":
+        """Create a server uploading to an Elastic Search output section as returned by generate_clients
+
+        :param output: The output section
+        :type output: Dict[str, Any]
+        :param batch_size: The number of messages to gather before uploading
+        :type batch_size: int
+        :param log_name: Used for getting the application log
+        :type log_name: str
+        """
+        return cls(output["address"], output["port"], batch_size, log_name, output.get("dead-letter-file"),
+                   output.get("bulk-retries", 5))
+
     async def get_index_list(self) -> List[str]:
         """
         :return: The indices from an Elastic Search used to check if we need to put a new index
@@ -61,12 +87,12 @@ class TelemetryTCPDialOutServer(TCPServer):
         except Exception as e:
             raise TelemetryTCPDialOutServerError(f"Error while getting index:\n {e}")
 
-    async def post_data(self, data_to_post: str) -> bool:
+    async def post_data(self, bulk_items: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
         """
 
-        :param data_to_post: Json data to post into the Elastic Search instance
-        :type data_to_post: str
-        :return: True if successfully uploaded data, else False
+        :param bulk_items: The action line and document line of every item to post into the Elastic Search instance
+        :type bulk_items: List[Tuple[str, str]]
+        :return: The items Elastic Search rejected and should be retried, empty if all were handled
         """
         try:
             headers: Dict[str, str] = {"Content-Type": "application/x-ndjson"}
@@ -74,18 +100,22 @@ class TelemetryTCPDialOutServer(TCPServer):
                 url=f"{self.url}/_bulk",
                 method="POST",
                 headers=headers,
-                body=data_to_post,
+                body="".join(f"{action}\n{document}\n" for action, document in bulk_items),
                 connect_timeout=40.0,
                 request_timeout=40.0,
             )
             response: HTTPResponse = await self.http_client.fetch(request=request)
-            if not response.error:
-                return True
+            retry_items, failed_items = split_bulk_items(bulk_items, json.loads(response.body.decode()))
+            if failed_items:
+                self.log.error(f"{len(failed_items)} documents rejected by Elastic Search, "
+                               f"writing them to {self.dead_letter_file}")
+                write_dead_letters(self.dead_letter_file, failed_items)
+            return retry_items
         except HTTPError as e:
             if e.code == 400 and e.message == "Bad Request":
                 raise TelemetryTCPDialOutServerError(f"HTTP Error while posting data due to bad request:\n {e}")
-            elif e.code == 599:
-                return False
+            elif e.code == 599 or e.code in RETRYABLE_BULK_STATUS:
+                return bulk_items
             else:
                 raise TelemetryTCPDialOutServerError(f"HTTP Error while posting data:\n {e}")
         except Exception as e:
@@ -174,14 +204,22 @@ class TelemetryTCPDialOutServer(TCPServer):
                                     put_rc = True
                             self.index_list.append(index)
                     segment_list: List[Dict[str, Any]] = sorted_by_index[index]
-                    elastic_index: Dict[str, Any] = {"index": {"_index": f"{index}"}}
-                    payload_list: List[Dict[str, Any]] = [elastic_index]
+                    elastic_index: str = json.dumps({"index": {"_index": f"{index}"}})
+                    bulk_items: List[Tuple[str, str]] = []
                     for segment in segment_list:
                         segment.pop("_index", None)
-                        payload_list.append(segment)
-                        payload_list.append(elastic_index)
-                    payload_list.pop()
-                    data_to_post: str = "\n".join(json.dumps(d) for d in payload_list)
-                    post_rc = False
-                    while not post_rc:
-                        post_rc = await self.post_data(f"{data_to_post}\n")
+                        bulk_items.append((elastic_index, json.dumps(segment)))
+                    attempt: int = 0
+                    while bulk_items:
+                        bulk_items = await self.post_data(bulk_items)
+                        if not bulk_items:
+                            break
+                        attempt += 1
+                        if attempt > self.max_retries:
+                            self.log.error(f"Giving up on {len(bulk_items)} documents after {self.max_retries} "
+                                           f"retries, writing them to {self.dead_letter_file}")
+                            write_dead_letters(self.dead_letter_file,
+                                               [(action, document, {"type": "max_retries_exceeded"})
+                                                for action, document in bulk_items])
+                            break
+                        await gen.sleep(bulk_backoff_delay(attempt))
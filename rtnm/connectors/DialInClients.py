@@ -1,34 +1,122 @@
 import grpc
 import json
 import random
-from time import sleep
+import signal
+from hashlib import sha1
+from uuid import uuid4
+from threading import Thread
+from queue import Queue
+from time import sleep, time, monotonic
 from logging import Logger, getLogger
-from typing import List, Tuple, Generator, Union, Optional
-from multiprocessing import Process, Queue, Value
+from typing import List, Tuple, Generator, Union, Optional, Dict, Any, Callable, Hashable
+from multiprocessing import Process, Value, BoundedSemaphore
+from pathlib import Path
 from protos.cisco_mdt_dial_in_pb2_grpc import gRPCConfigOperStub
 from protos.cisco_mdt_dial_in_pb2 import CreateSubsArgs
 from protos.gnmi_pb2_grpc import gNMIStub
 from protos.gnmi_pb2 import (
+    CapabilityRequest,
+    CapabilityResponse,
     Encoding,
     GetRequest,
     GetResponse,
+    Notification,
+    Path as GNMIPath,
     Subscription,
     SubscriptionList,
     SubscribeRequest,
     TypedValue
 )
 from utils.utils import create_gnmi_path
+from profiling.profiling import init_profiler, poll_profiler
+from backpressure.backpressure import FrameQueue
+from cache.cache import DeviceMetadataCache
+from framing.framing import FrameBatcher
+from polling.polling import PollScheduler, PollRequests, PollTimer
+from channels.channels import CHANNELS, DEFAULT_CHANNEL_OPTIONS
+
+# Subscribe encodings from the cheapest to decode, typed protobuf values, then opaque values, then
+# JSON documents the parsers json.loads per leaf
+ENCODING_PREFERENCE: List[str] = ["PROTO", "BYTES", "ASCII", "JSON_IETF", "JSON"]
+
+
+def select_encoding(supported: List[int], override: Optional[int] = None) -> int:
+    """The encoding to subscribe with, the override if one is configured, else the first encoding of
+    ENCODING_PREFERENCE the device supports, JSON_IETF if its capabilities are unknown
+
+    :param supported: The supported_encodings of the Capabilities response of the device
+    :type supported: List[int]
+    :param override: The encoding set in the configuration, None to select it automatically
+    :type override: Optional[int]
+
+    """
+    if override is not None:
+        return override
+    for name in ENCODING_PREFERENCE:
+        if Encoding.Value(name) in supported:
+            return Encoding.Value(name)
+    return Encoding.Value("JSON_IETF")
+
+
+class ConnectScheduler:
+    """Token bucket shared by every dial in client process limiting how many connection setups
+    (connect, Get of the hostname and version and subscribe) start per second and how many are
+    in progress at once, so after a collector restart devices don't all reconnect at the same moment
+
+    :param rate: Connection setups started per second, 0 disables the rate limit
+    :type rate: float
+    :param burst: The number of setups that can be started back to back
+    :type burst: int
+    :param max_concurrent: Setups in progress at once, 0 for no limit
+    :type max_concurrent: int
+
+    """
+
+    def __init__(self, rate: float = 20.0, burst: int = 20, max_concurrent: int = 50) -> None:
+        self.rate: float = rate
+        self.capacity: float = float(max(burst, 1))
+        self.tokens = Value("d", self.capacity)
+        # CLOCK_MONOTONIC is system wide so every process can refill the bucket from it
+        self.last = Value("d", monotonic())
+        self.slots: Optional[BoundedSemaphore] = BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+
+    def acquire(self) -> None:
+        if self.slots is not None:
+            self.slots.acquire()
+        if self.rate <= 0:
+            return
+        while True:
+            with self.tokens.get_lock():
+                now: float = monotonic()
+                self.tokens.value = min(self.capacity, self.tokens.value + (now - self.last.value) * self.rate)
+                self.last.value = now
+                if self.tokens.value >= 1:
+                    self.tokens.value -= 1
+                    return
+                wait: float = (1 - self.tokens.value) / self.rate
+            sleep(wait)
+
+    def release(self) -> None:
+        if self.slots is not None:
+            self.slots.release()
 
 
 class DialInClient(Process):
-    def __init__(self, data_queue: Queue, log_name: str, options: List[Tuple[str, str]] = None, timeout: int = 100000000, *args, **kwargs):
+    # Decorrelated jitter backoff between reconnects, reset once a stream stayed up for HEALTHY_STREAM_SECONDS
+    MIN_BACKOFF_SECONDS: float = 1.0
+    MAX_BACKOFF_SECONDS: float = 128.0
+    HEALTHY_STREAM_SECONDS: float = 30.0
+
+    def __init__(self, data_queue: FrameQueue, log_name: str, options: List[Tuple[str, Any]] = None, timeout: int = 100000000,
+                 scheduler: Optional[ConnectScheduler] = None, metadata_cache: Optional[DeviceMetadataCache] = None,
+                 batch_frames: int = 100, batch_bytes: int = 1048576, batch_delay: float = 0.05, *args, **kwargs):
         super().__init__(name=kwargs["name"])
-        if options is None:
-            opts: List[Tuple[str, str]] = [("grpc.ssl_target_name_override", "ems.cisco.com"), ("grpc.keepalive_time_ms", 60000), ("grpc.keepalive_timeout_ms", 10000)]
-        self.options: List[Tuple[str, str]] = opts
+        # The options of the channel profile of the input
+        self.options: List[Tuple[str, Any]] = list(DEFAULT_CHANNEL_OPTIONS if options is None else options)
         self._host: str = kwargs["address"]
         self._port: int = kwargs["port"]
-        self.queue: Queue = data_queue
+        self.queue: FrameQueue = data_queue
+        self.log_name: str = log_name
         self.log: Logger = getLogger(log_name)
         self._metadata: List[Tuple[str, str]] = [
             ("username", kwargs["username"]),
@@ -36,7 +124,8 @@ class DialInClient(Process):
         ]
         self.log.info(kwargs)
         self._format: str = kwargs["format"]
-        self.encoding: str = kwargs["encoding"]
+        # None for gNMI selects the encoding from the capabilities of the device
+        self.encoding: Optional[int] = kwargs["encoding"]
         self.debug: bool = kwargs["debug"]
         self.retry: bool = kwargs["retry"]
         self.compression: bool = kwargs["compression"]
@@ -45,11 +134,35 @@ class DialInClient(Process):
             self.sensors: List[str] = kwargs["sensors"]
             self.sample_interval: int = kwargs["sample-interval"]
             self.stream_mode = kwargs["stream-mode"]
+            # Seconds between polls of every sensor in POLL mode
+            self.poll_intervals: List[float] = kwargs.get("poll-intervals") or [
+                self.sample_interval / 1000000000] * len(self.sensors)
+            self.sensor_options: Dict[str, Dict[str, Any]] = kwargs.get("sensor-options") or {
+                sensor: {"mode": self.sub_mode, "suppress_redundant": False, "heartbeat_interval": 0}
+                for sensor in self.sensors}
+            self.updates_only: bool = kwargs.get("updates-only", False)
+            self.use_aliases: bool = kwargs.get("use-aliases", False)
         else:
             self.subs: List[str] = kwargs["subscriptions"]
         self._timeout: float = float(timeout)
         self.gnmi_stub = None
         self.cisco_ems_stub = None
+        self.scheduler: Optional[ConnectScheduler] = scheduler
+        self._setting_up: bool = False
+        self._stream_start: Optional[float] = None
+        self._backoff_delay: float = self.MIN_BACKOFF_SECONDS
+        # Set while a stream is up, read by the supervisor in the main process
+        self.connected = Value("b", 0)
+        self.metadata_cache: Optional[DeviceMetadataCache] = metadata_cache
+        self.address: str = f"{self._host}:{self._port}"
+        self.hostname: str = ""
+        self.version: str = ""
+        self.supported_encodings: List[int] = []
+        self.subscribe_encoding: Optional[int] = None
+        self._batch_limits: Tuple[int, int, float] = (batch_frames, batch_bytes, batch_delay)
+        self.batcher: Optional[FrameBatcher] = None
+        self.poll_scheduler: Optional[PollScheduler] = None
+        self._channel_key: Optional[Hashable] = None
         self.log.debug(f"Finished initialzing {self.name}")
 
     def _get_gnmi_stub(self) -> gNMIStub:
@@ -70,9 +183,9 @@ class DialInClient(Process):
         )
         response: GetResponse = stub.Get(get_message, metadata=self._metadata, timeout=self._timeout)
 
-        def _parse_version(version: GetResponse) -> str:
-            rc = ""
-            for notification in version.notification:
+        def _parse_version(version_response: GetResponse) -> str:
+            version: str = ""
+            for notification in version_response.notification:
                 for update in notification.update:
                     rc = json.loads(update.val.json_ietf_val)
                     for state in rc["component"]:
@@ -102,103 +215,344 @@ class DialInClient(Process):
 
         return _parse_hostname(response)
 
-    @staticmethod
-    def _backoff() -> None:
-        min_backoff_time: int = 1
-        max_backoff_time: int = 128
-        delay = min_backoff_time + random.randint(0, 1000) / 1000.0
-        sleep(delay)
-        if min_backoff_time < max_backoff_time:
-            min_backoff_time *= 2
+    def _get_capabilities(self) -> str:
+        """Fingerprint of the gNMI version, encodings and models the device supports, it changes when
+        the device is upgraded so cached metadata can't be trusted anymore, the supported encodings are kept
+        to select the encoding of the subscription
+
+        """
+        stub: gNMIStub = self._get_gnmi_stub()
+        response: CapabilityResponse = stub.Capabilities(CapabilityRequest(), metadata=self._metadata,
+                                                         timeout=self._timeout)
+        models: List[str] = sorted(f"{model.organization}:{model.name}:{model.version}"
+                                   for model in response.supported_models)
+        self.supported_encodings = sorted(response.supported_encodings)
+        return sha1(json.dumps([response.gNMI_version, self.supported_encodings, models]).encode()).hexdigest()
+
+    def _encoding_names(self) -> List[str]:
+        return [Encoding.Name(encoding) for encoding in self.supported_encodings]
+
+    def _fetch_metadata(self) -> None:
+        """Get the capabilities, hostname and version from the device and cache them"""
+        capabilities: str = ""
+        if self.metadata_cache is not None or (self._format == "gnmi" and self.encoding is None):
+            try:
+                capabilities = self._get_capabilities()
+            except Exception as error:
+                # Devices without the Capabilities RPC are subscribed with JSON_IETF by select_encoding
+                self.supported_encodings = []
+                fallback: str = ", subscribing with JSON_IETF" if self.encoding is None else ""
+                self.log.error(f"Unable to get the capabilities of {self.name}{fallback}: {error}")
+        if self._format == "gnmi":
+            self.hostname = self._get_hostname()
+        self.version = self._get_version()
+        if self.metadata_cache is not None:
+            self.metadata_cache.store(self.address, self.hostname, self.version, capabilities, self._encoding_names())
+
+    def _refresh_metadata(self, entry: Dict[str, Any]) -> None:
+        """Get the metadata from the device again if the cached entry expired or the capabilities changed,
+        runs on its own thread while the client streams with the cached metadata
+
+        """
+        try:
+            capabilities: str = self._get_capabilities()
+            if capabilities == entry.get("capabilities") and not self.metadata_cache.is_stale(entry):
+                return
+            self.log.info(f"Refreshing the cached metadata of {self.name}")
+            hostname: str = self._get_hostname() if self._format == "gnmi" else ""
+            version: str = self._get_version()
+            self.hostname, self.version = hostname or self.hostname, version or self.version
+            self.metadata_cache.store(self.address, hostname, version, capabilities, self._encoding_names())
+        except Exception as error:
+            self.log.error(f"Unable to refresh the metadata of {self.name}: {error}")
+
+    def _load_metadata(self) -> None:
+        """Use the cached hostname, version and encodings of the device and refresh them in the background,
+        or get them from the device before subscribing when they aren't cached
+
+        """
+        if self.metadata_cache is None:
+            if not self.version:
+                self._fetch_metadata()
+            return
+        entry: Optional[Dict[str, Any]] = self.metadata_cache.load(self.address)
+        if entry is None or not entry.get("version") or (self._format == "gnmi" and (
+                not entry.get("hostname") or (self.encoding is None and not entry.get("encodings")))):
+            self._fetch_metadata()
+        else:
+            self.hostname, self.version = entry.get("hostname") or "", entry["version"]
+            self.supported_encodings = [Encoding.Value(name) for name in entry.get("encodings", [])]
+            Thread(target=self._refresh_metadata, args=(entry,), name=f"{self.name}-metadata", daemon=True).start()
+
+    def _start_setup(self) -> None:
+        """Wait for the connect scheduler before setting up a connection"""
+        if self.scheduler is not None:
+            self.scheduler.acquire()
+        self._setting_up = True
+        self._stream_start = None
+
+    def _finish_setup(self) -> None:
+        if self._setting_up:
+            self._setting_up = False
+            if self.scheduler is not None:
+                self.scheduler.release()
+
+    def _streaming(self) -> None:
+        """Called for every response, the first one finishes the connection setup"""
+        if self._setting_up:
+            self._finish_setup()
+            self._stream_start = monotonic()
+            self.connected.value = 1
+
+    def _backoff(self) -> None:
+        if self._stream_start is not None and monotonic() - self._stream_start >= self.HEALTHY_STREAM_SECONDS:
+            self._backoff_delay = self.MIN_BACKOFF_SECONDS
+        self._backoff_delay = min(self.MAX_BACKOFF_SECONDS,
+                                  random.uniform(self.MIN_BACKOFF_SECONDS, self._backoff_delay * 3))
+        self.log.info(f"Reconnecting {self.name} in {self._backoff_delay:.1f}s")
+        sleep(self._backoff_delay)
 
     @staticmethod
     def sub_to_path(request):
         yield request
 
+    def _select_encoding(self) -> int:
+        """The encoding of the next subscribe, logged when it changes, for example after an upgrade of the device"""
+        encoding: int = select_encoding(self.supported_encodings, self.encoding)
+        if encoding != self.subscribe_encoding:
+            if self.encoding is not None and self.supported_encodings and encoding not in self.supported_encodings:
+                self.log.warning(f"{self.name} doesn't advertise the configured encoding {Encoding.Name(encoding)}, "
+                                 f"it supports {', '.join(self._encoding_names())}")
+            self.log.info(f"Subscribing to {self.name} with {Encoding.Name(encoding)} encoding")
+            self.subscribe_encoding = encoding
+        return encoding
+
+    def _subscribe_request(self, sensors: List[str]) -> SubscribeRequest:
+        subs: List[Subscription] = []
+        for sensor in sensors:
+            subs.append(
+                Subscription(path=create_gnmi_path(sensor), sample_interval=self.sample_interval,
+                             **self.sensor_options[sensor]))
+        sub_list: SubscriptionList = SubscriptionList(
+            subscription=subs, mode=self.stream_mode, encoding=self._select_encoding(), updates_only=self.updates_only,
+            use_aliases=self.use_aliases,
+        )
+        return SubscribeRequest(subscribe=sub_list)
+
+    @staticmethod
+    def _resolve_alias(notification: Notification, aliases: Dict[str, Tuple[GNMIPath, str]]) -> bool:
+        """Keep the aliases the device defines on a stream and put the full prefix back in notifications
+        using one, tagged with an alias unique to the definition so parsers can cache the rendered prefix
+
+        :param notification: A notification of the stream, changed in place
+        :type notification: Notification
+        :param aliases: The alias table of the stream
+        :type aliases: Dict[str, Tuple[GNMIPath, str]]
+        :return: False for a definition without updates, which isn't forwarded
+        """
+        if notification.alias:
+            prefix: GNMIPath = GNMIPath()
+            prefix.CopyFrom(notification.prefix)
+            tag: str = f"{notification.alias}@{uuid4().hex[:12]}"
+            aliases[notification.alias] = (prefix, tag)
+            # A redefined alias would find the prefix of the old definition cached by the parsers under the raw alias
+            notification.alias = tag
+            return bool(notification.update or notification.delete)
+        elems = notification.prefix.elem
+        if len(elems) == 1 and elems[0].name in aliases:
+            prefix, tag = aliases[elems[0].name]
+            notification.prefix.CopyFrom(prefix)
+            notification.alias = tag
+        return True
+
+    def _read_poll_stream(self, interval: float, requests: PollRequests, call, first: bool, ended: Queue) -> None:
+        """Read the responses of a POLL mode stream, it is added to the poll scheduler once the initial
+        updates are synced and ended gets None or the error once the stream ends
+
+        """
+        timer: Optional[PollTimer] = None
+        aliases: Dict[str, Tuple[GNMIPath, str]] = {}
+        try:
+            for response in call:
+                if first:
+                    self._streaming()
+                if response.error.message:
+                    raise grpc.RpcError(response.error.message)
+                elif response.sync_response:
+                    requests.answered()
+                    if timer is None:
+                        timer = self.poll_scheduler.add(f"{self.address}/{interval}", interval, requests.poll)
+                elif not self.use_aliases or self._resolve_alias(response.update, aliases):
+                    self.batcher.add(response.SerializeToString(), self.hostname, self.version, time())
+            ended.put(None)
+        except Exception as error:
+            ended.put(error)
+        finally:
+            if timer is not None:
+                self.poll_scheduler.remove(timer)
+
+    def _poll_streams(self, stub: gNMIStub) -> None:
+        """Open a POLL mode stream per poll interval, since a Poll request polls every sensor of its stream,
+        and return once any of them ends
+
+        """
+        groups: Dict[float, List[str]] = {}
+        for sensor, interval in zip(self.sensors, self.poll_intervals):
+            groups.setdefault(interval, []).append(sensor)
+        ended: Queue = Queue()
+        streams: List[Tuple[PollRequests, Any]] = []
+        try:
+            for interval, sensors in groups.items():
+                requests: PollRequests = PollRequests(self._subscribe_request(sensors), f"{self.name}/{interval}s",
+                                                      self.log_name, interval)
+                call = stub.Subscribe(iter(requests), metadata=self._metadata, timeout=self._timeout)
+                streams.append((requests, call))
+                Thread(target=self._read_poll_stream, args=(interval, requests, call, len(streams) == 1, ended),
+                       name=f"{self.name}-poll-{interval}", daemon=True).start()
+            error: Optional[Exception] = ended.get()
+            if error is not None:
+                raise error
+        finally:
+            for requests, call in streams:
+                requests.close()
+                call.cancel()
+
     def gnmi_subscribe(self) -> None:
         """ Subscribe to a device via gNMI"""
         retry: bool = True
-        version: str = ""
-        hostname: str = ""
-        subs: List[Subscription] = []
         while retry:
             try:
+                self._start_setup()
                 self.connect()
-                if not hostname:
-                    hostname: str = self._get_hostname()
-
-                if not version:
-                    version: str = self._get_version()
-
-                for sensor in self.sensors:
-                    subs.append(
-                        Subscription(path=create_gnmi_path(sensor), mode=self.sub_mode,
-                                     sample_interval=self.sample_interval))
-                sub_list: SubscriptionList = SubscriptionList(
-                    subscription=subs, mode=self.stream_mode, encoding=self.encoding,
-                )
-                sub_request: SubscribeRequest = SubscribeRequest(subscribe=sub_list)
+                self._load_metadata()
                 stub: gNMIStub = self._get_gnmi_stub()
-                for response in stub.Subscribe(self.sub_to_path(sub_request), metadata=self._metadata, timeout=self._timeout):
-                    if response.error.message:
-                        raise grpc.RpcError(response.error.message)
-                    elif response.sync_response:
-                        self.log.debug("Got all values atleast once")
-                    else:
-                        self.queue.put_nowait(("gnmi", response.SerializeToString(), hostname, version, self._host))
+                if self.stream_mode == SubscriptionList.Mode.Value("POLL"):
+                    self._poll_streams(stub)
+                else:
+                    self._stream(stub)
             except grpc.RpcError as error:
                 self.log.error(error)
             except Exception as error:
                 self.log.error(error)
             finally:
+                self.batcher.flush()
+                self._finish_setup()
                 self.disconnect()
-                retry = self.retry
-                if retry:
-                    self._backoff()
+            # Back off only once the stream has ended or failed, a SystemExit from SIGTERM leaves through the
+            # finally above without sleeping
+            retry = self.retry
+            if retry:
+                self._backoff()
+
+    def _stream(self, stub: gNMIStub) -> None:
+        """Read a STREAM or ONCE mode subscription until it ends"""
+        sub_request: SubscribeRequest = self._subscribe_request(self.sensors)
+        aliases: Dict[str, Tuple[GNMIPath, str]] = {}
+        for response in stub.Subscribe(self.sub_to_path(sub_request), metadata=self._metadata, timeout=self._timeout):
+            poll_profiler()
+            self._streaming()
+            if response.error.message:
+                raise grpc.RpcError(response.error.message)
+            elif response.sync_response:
+                self.log.debug("Got all values atleast once")
+            elif not self.use_aliases or self._resolve_alias(response.update, aliases):
+                self.batcher.add(response.SerializeToString(), self.hostname, self.version, time())
 
     def ems_subscribe(self) -> None:
         retry: bool = True
-        version: str = ""
         while retry:
             try:
+                self._start_setup()
                 self.connect()
-                if not version:
-                    version: str = self._get_version()
+                self._load_metadata()
                 stub: gRPCConfigOperStub = self._get_ems_stub()
                 sub_args: CreateSubsArgs = CreateSubsArgs(ReqId=1, encode=self.encoding,
                                                           Subscriptions=self.subs)
                 for segment in stub.CreateSubs(sub_args, timeout=self._timeout,
                                                metadata=self._metadata):
+                    poll_profiler()
+                    self._streaming()
                     if segment.errors:
                         raise grpc.RpcError(segment.errors)
                     else:
-                        self.queue.put_nowait(("ems", segment.data, None, version, self._host))
+                        self.batcher.add(segment.data, None, self.version, time())
             except grpc.RpcError as error:
                 self.log.error(error)
                 retry = self.retry
             except Exception as error:
                 self.log.error(error)
             finally:
+                self.batcher.flush()
+                self._finish_setup()
                 self.disconnect()
-                if retry:
-                    self._backoff()
+            if retry:
+                self._backoff()
 
-    def connect(self) -> None:
+    def channel_key(self) -> Hashable:
+        """Clients with the same key connect to the same target with the same channel credentials and options,
+        so they share a channel
+
+        """
+        return self._host, self._port, self.compression, tuple(self.options)
+
+    def _create_channel(self) -> grpc.Channel:
         if self.compression:
-            self.channel = grpc.insecure_channel(":".join([self._host, self._port]), self.options,
-                                                 compression=grpc.Compression.Gzip)
-        else:
-            self.channel = grpc.insecure_channel(":".join([self._host, self._port]), self.options)
+            return grpc.insecure_channel(":".join([self._host, self._port]), self.options,
+                                         compression=grpc.Compression.Gzip)
+        return grpc.insecure_channel(":".join([self._host, self._port]), self.options)
+
+    def connect(self) -> None:
+        self._channel_key = self.channel_key()
+        self.channel = CHANNELS.acquire(self._channel_key, self._create_channel)
 
     def disconnect(self) -> None:
-        self.log.info(f"Closing channel for {self.name}")
-        self.channel.close()
+        self.connected.value = 0
+        self.log.info(f"Releasing the channel of {self.name}")
+        if self._channel_key is not None:
+            CHANNELS.release(self._channel_key)
+            self._channel_key = None
 
     def run(self):
-        if self._format == "gnmi":
-            self.gnmi_subscribe()
-        else:
-            self.ems_subscribe()
+        init_profiler(self.name, Path().absolute() / "logs", self.log_name)
+        exit_on_terminate()
+        self.serve()
+
+    def serve(self) -> None:
+        """Stream from the device until the client gives up, on the main thread of the client process or
+        on a thread of the DeviceGroup process of its device
+
+        """
+        # Created in the client process, the thread and lock of the batcher can't cross into it
+        self.batcher = FrameBatcher(self.queue, "gnmi" if self._format == "gnmi" else "ems", self._host,
+                                    *self._batch_limits)
+        self.batcher.start()
+        try:
+            if self._format == "gnmi" and self.stream_mode == SubscriptionList.Mode.Value("POLL"):
+                self.poll_scheduler = PollScheduler(log_name=self.log_name)
+                self.poll_scheduler.start()
+            if self._format == "gnmi":
+                self.gnmi_subscribe()
+            else:
+                self.ems_subscribe()
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Queue the partial batch of the client and stop its threads"""
+        if self.poll_scheduler is not None:
+            self.poll_scheduler.stop()
+        if self.batcher is not None:
+            self.batcher.stop()
+
+
+def exit_on_terminate() -> None:
+    """Exit the process on SIGTERM instead of being killed, so the finally blocks of its clients queue their
+    partial batches before it exits
+
+    """
+    def terminate(signum, frame) -> None:
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
 
 
 class TLSDialInClient(DialInClient):
@@ -206,10 +560,80 @@ class TLSDialInClient(DialInClient):
         super().__init__(*args, **kwargs)
         self._pem = pem
 
-    def connect(self):
+    def channel_key(self) -> Hashable:
+        return (*super().channel_key(), sha1(self._pem).hexdigest())
+
+    def _create_channel(self) -> grpc.Channel:
         credentials = grpc.ssl_channel_credentials(self._pem)
         if self.compression:
-            self.channel = grpc.secure_channel(
+            return grpc.secure_channel(
                 ":".join([self._host, self._port]), credentials, self.options, compression=grpc.Compression.Gzip)
-        else:
-            self.channel = grpc.secure_channel(":".join([self._host, self._port]), credentials, self.options)
+        return grpc.secure_channel(":".join([self._host, self._port]), credentials, self.options)
+
+
+class GroupConnected:
+    """Stands in for the connected value of a DeviceGroup for the supervisor, set while every client streams
+
+    :param clients: The clients of the group
+    :type clients: List[DialInClient]
+
+    """
+
+    def __init__(self, clients: List[DialInClient]) -> None:
+        self.clients: List[DialInClient] = clients
+
+    @property
+    def value(self) -> int:
+        return int(all(client.connected.value for client in self.clients))
+
+
+class DeviceGroup(Process):
+    """Process running the dial in clients of every input that connects to the same device on a thread each,
+    so the subscriptions share one channel instead of opening a connection and TLS session per input
+
+    :param name: Name of the group
+    :type name: str
+    :param factories: Create the clients of the inputs of the device, not yet started
+    :type factories: List[Callable[[], DialInClient]]
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+
+    def __init__(self, name: str, factories: List[Callable[[], DialInClient]], log_name: str) -> None:
+        super().__init__(name=name)
+        self.clients: List[DialInClient] = [factory() for factory in factories]
+        self.log_name: str = log_name
+        self.connected: GroupConnected = GroupConnected(self.clients)
+
+    def _serve(self, client: DialInClient, stopped: Queue) -> None:
+        """Serve a client on its thread, restarting it after its own backoff when it fails, until it gives up"""
+        log: Logger = getLogger(self.log_name)
+        try:
+            while True:
+                try:
+                    client.serve()
+                    return
+                except Exception as error:
+                    log.error(f"Input [{client.name}] of group [{self.name}] failed with {error}")
+                if not client.retry:
+                    return
+                client._backoff()
+        finally:
+            stopped.put(client.name)
+
+    def run(self) -> None:
+        """Serve every client until all of them give up, then exit so the supervisor restarts the group"""
+        init_profiler(self.name, Path().absolute() / "logs", self.log_name)
+        exit_on_terminate()
+        stopped: Queue = Queue()
+        try:
+            for client in self.clients:
+                Thread(target=self._serve, args=(client, stopped), name=client.name, daemon=True).start()
+            for _ in self.clients:
+                getLogger(self.log_name).error(f"Input [{stopped.get()}] of group [{self.name}] gave up")
+            getLogger(self.log_name).error(f"Every input of group [{self.name}] gave up, stopping the group")
+        finally:
+            for client in self.clients:
+                client.stop()
+        raise SystemExit(1)
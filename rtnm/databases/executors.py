@@ -0,0 +1,240 @@
+"""
+.. module:: executors
+   :platform: Unix, Windows
+   :synopsis: Asynchronous upload executor used to post encoded batches to a TSDB
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import asyncio
+from time import monotonic, perf_counter
+from logging import Logger, getLogger
+from multiprocessing import Process, Queue
+from typing import Dict, Any, Optional, Tuple
+
+import aiohttp
+
+from metrics.metrics import (
+    REGISTRY,
+    BYTES_SENT,
+    STAGE_LATENCY,
+    UPLOAD_ERRORS,
+    UPLOAD_RETRIES,
+    init_metrics,
+    observe_upload_lag
+)
+
+
+class UploadJob:
+    """An encoded batch ready to be posted to an output
+
+    :param output: Name of the output section the batch is for
+    :type output: str
+    :param url: The URL to post the batch to
+    :type url: str
+    :param body: The encoded request body
+    :type body: bytes
+    :param headers: The HTTP headers of the request
+    :type headers: Dict[str, str]
+    :param arrivals: Arrival time of the oldest message in the batch keyed by device and path
+    :type arrivals: Optional[Dict[Tuple[str, str], float]]
+
+    """
+
+    def __init__(self, output: str, url: str, body: bytes, headers: Dict[str, str],
+                 arrivals: Optional[Dict[Tuple[str, str], float]] = None) -> None:
+        self.output: str = output
+        self.url: str = url
+        self.body: bytes = body
+        self.headers: Dict[str, str] = headers
+        self.arrivals: Dict[Tuple[str, str], float] = arrivals or {}
+        self.attempts: int = 0
+
+
+class RateLimiter:
+    """Token bucket limiting how many requests per second are started against an output
+
+    :param rate: Requests per second, 0 disables rate limiting
+    :type rate: float
+    :param burst: The number of requests that can be started back to back
+    :type burst: int
+
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate: float = rate
+        self.capacity: float = float(max(burst, 1))
+        self.tokens: float = self.capacity
+        self.last: float = monotonic()
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now: float = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Stop sending requests to an output after consecutive failures, then let a single
+    request through after the reset timeout to probe if the output recovered
+
+    :param failure_threshold: Consecutive failures before the circuit opens
+    :type failure_threshold: int
+    :param reset_timeout: Seconds the circuit stays open before a probe request is allowed
+    :type reset_timeout: float
+
+    """
+    CLOSED: str = "closed"
+    OPEN: str = "open"
+    HALF_OPEN: str = "half-open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.failures: int = 0
+        self.state: str = self.CLOSED
+        self.opened_at: float = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.1
+        return max(self.reset_timeout - (monotonic() - self.opened_at), 0.1)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = monotonic()
+
+
+class OutputChannel:
+    """Per output limits used by the executor
+
+    :param name: Name of the output section
+    :type name: str
+    :param args: The output arguments from the configuration file
+    :type args: Dict[str, Any]
+
+    """
+
+    def __init__(self, name: str, args: Dict[str, Any]) -> None:
+        self.name: str = name
+        self.in_flight: asyncio.Semaphore = asyncio.Semaphore(args.get("in-flight", 4))
+        self.rate_limiter: RateLimiter = RateLimiter(args.get("rate-limit", 0.0), args.get("in-flight", 4))
+        self.breaker: CircuitBreaker = CircuitBreaker(args.get("breaker-failures", 5),
+                                                      args.get("breaker-reset", 30.0))
+        self.max_attempts: int = args.get("upload-retries", 3) + 1
+
+
+class AsyncUploadExecutor(Process):
+    """Process running an asyncio loop that posts jobs put on the upload queue by the worker pool,
+    so the number of parse workers and the number of concurrent uploads are sized independently
+
+    :param upload_queue: Queue the worker pool puts UploadJobs on, None stops the executor
+    :type upload_queue: Queue
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+    :param outputs: The output sections from the configuration file
+    :type outputs: Dict[str, Dict[str, Any]]
+    :param metrics_queue: Queue to flush metrics to the main process, None if metrics aren't exported
+    :type metrics_queue: Optional[Queue]
+
+    """
+
+    def __init__(self, upload_queue: Queue, log_name: str, outputs: Dict[str, Dict[str, Any]],
+                 metrics_queue: Optional[Queue] = None) -> None:
+        super().__init__(name=f"{log_name}-upload-executor")
+        self.queue: Queue = upload_queue
+        self.metrics_queue: Optional[Queue] = metrics_queue
+        self.log_name: str = log_name
+        self.outputs: Dict[str, Dict[str, Any]] = outputs
+        self.log: Optional[Logger] = None
+
+    async def _post(self, session: aiohttp.ClientSession, channel: OutputChannel, job: UploadJob) -> None:
+        while job.attempts < channel.max_attempts:
+            if not channel.breaker.allow():
+                await asyncio.sleep(channel.breaker.retry_after())
+                continue
+            if job.attempts:
+                UPLOAD_RETRIES.inc(output=channel.name)
+            job.attempts += 1
+            await channel.rate_limiter.acquire()
+            # Every attempt settles the breaker, otherwise a half open circuit never closes or opens again
+            answered: bool = False
+            try:
+                start: float = perf_counter()
+                async with session.post(job.url, data=job.body, headers=job.headers) as response:
+                    BYTES_SENT.inc(len(job.body), output=channel.name)
+                    if response.status < 300:
+                        answered = True
+                        STAGE_LATENCY.observe(perf_counter() - start, stage="upload")
+                        observe_upload_lag(job.arrivals)
+                        return
+                    error: str = f"{response.status} {await response.text()}"
+                    if 400 <= response.status < 500 and response.status != 429:
+                        # The output is healthy, it rejected this batch
+                        answered = True
+                        UPLOAD_ERRORS.inc(output=channel.name)
+                        self.log.error(f"Dropping batch for {channel.name}, request was rejected with {error}")
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as client_error:
+                error = str(client_error)
+            finally:
+                if answered:
+                    channel.breaker.record_success()
+                else:
+                    channel.breaker.record_failure()
+            UPLOAD_ERRORS.inc(output=channel.name)
+            self.log.warning(f"Upload to {channel.name} failed ({error}), circuit is {channel.breaker.state}")
+        self.log.error(f"Dropping batch for {channel.name} after {job.attempts} attempts")
+
+    async def _run_job(self, session: aiohttp.ClientSession, channel: OutputChannel, job: UploadJob) -> None:
+        try:
+            await self._post(session, channel, job)
+        except Exception as error:
+            self.log.error(f"Error while uploading to {channel.name}: {error}")
+        finally:
+            channel.in_flight.release()
+            REGISTRY.flush()
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_event_loop()
+        channels: Dict[str, OutputChannel] = {name: OutputChannel(name, args) for name, args in self.outputs.items()}
+        timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=120)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                job: Optional[UploadJob] = await loop.run_in_executor(None, self.queue.get)
+                if job is None:
+                    break
+                channel: OutputChannel = channels[job.output]
+                await channel.in_flight.acquire()
+                loop.create_task(self._run_job(session, channel, job))
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if pending:
+                self.log.info(f"Waiting on {len(pending)} uploads before stopping")
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def run(self) -> None:
+        self.log = getLogger(self.log_name)
+        init_metrics(self.metrics_queue)
+        self.log.info("Starting upload executor")
+        asyncio.run(self._dispatch())
+        self.log.info("Upload executor stopped")
@@ -14,3 +14,8 @@ class DecodeError(Exception):
 
 class ElasticSearchUploaderError(Exception):
     pass
+
+
+class CaptureFileError(Exception):
+    """A capture file is corrupt or isn't a capture file"""
+    pass
@@ -0,0 +1,119 @@
+"""
+.. module:: flattening
+   :platform: Unix, Windows
+   :synopsis: Flatten JSON_IETF subtrees of gNMI updates into leaf fields and list key tags
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+from typing import List, Dict, Tuple, Any, Optional, Iterable, FrozenSet
+
+try:
+    # Optional, several times faster than the json module on the large documents JSON only devices send
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Members of a list entry that are its keys, keyed by the yang path of the list, taken from the keys of gNMI path
+# elements or else inferred from the entries of the first instance of the list seen, cleared when it reaches
+# LIST_KEYS_SIZE
+LIST_KEYS: Dict[str, Tuple[str, ...]] = {}
+LIST_KEYS_SIZE: int = 65536
+
+# Leaf names YANG models commonly key lists with, a member named one of them or ending in -name, -id or -index
+# is taken as a key when no gNMI path element named the keys of its list
+KEY_NAMES: FrozenSet[str] = frozenset(["name", "id", "index"])
+KEY_SUFFIXES: Tuple[str, ...] = tuple(f"-{name}" for name in sorted(KEY_NAMES))
+
+
+def is_key_name(name: str) -> bool:
+    return name in KEY_NAMES or name.endswith(KEY_SUFFIXES)
+
+
+def _cache(path: str, keys: Tuple[str, ...]) -> None:
+    if len(LIST_KEYS) >= LIST_KEYS_SIZE:
+        LIST_KEYS.clear()
+    LIST_KEYS[path] = keys
+
+
+def register_list_keys(path: str, keys: Iterable[str]) -> None:
+    """Use the keys of a gNMI path element for the entries of the list at its path instead of inferring them
+
+    :param path: Yang path of the list
+    :type path: str
+    :param keys: Names of the keys of the path element
+    :type keys: Iterable[str]
+
+    """
+    names: Tuple[str, ...] = tuple(keys)
+    if LIST_KEYS.get(path) != names:
+        _cache(path, names)
+
+
+def list_keys(path: str, entries: List[Dict[str, Any]]) -> Tuple[str, ...]:
+    """The members of the entries of a list that are keys, cached per list, when no gNMI path element named them
+    they are the scalar members named like keys that every entry has, every other member stays a leaf
+
+    :param path: Yang path of the list
+    :type path: str
+    :param entries: The entries of the list with the module prefixes removed from their member names
+    :type entries: List[Dict[str, Any]]
+
+    """
+    keys: Optional[Tuple[str, ...]] = LIST_KEYS.get(path)
+    if keys is None:
+        keys = tuple(name for name, value in entries[0].items()
+                     if is_key_name(name) and not isinstance(value, (dict, list))
+                     and all(name in entry for entry in entries))
+        _cache(path, keys)
+    return keys
+
+
+def _flatten(value: Any, path: str, keys: Dict[str, Any],
+             rows: List[Tuple[str, Dict[str, Any], Dict[str, Any]]]) -> None:
+    if isinstance(value, list):
+        name: str = path.rpartition("/")[2]
+        entries: List[Dict[str, Any]] = [{member.rpartition(":")[2]: child for member, child in entry.items()}
+                                         for entry in value]
+        entry_names: Tuple[str, ...] = list_keys(path, entries)
+        for entry in entries:
+            entry_keys: Dict[str, Any] = dict(keys)
+            for key in entry_names:
+                if key in entry:
+                    # Keep the key of an enclosing list with the same name, for example the name of a protocol
+                    # inside a network instance
+                    entry_keys[f"{name}-{key}" if key in keys else key] = entry.pop(key)
+            _flatten(entry, path, entry_keys, rows)
+        return
+    leaves: Dict[str, Any] = {}
+    for member, child in value.items():
+        name = member.rpartition(":")[2]
+        if isinstance(child, dict) or (isinstance(child, list) and child and isinstance(child[0], dict)):
+            _flatten(child, f"{path}/{name}", keys, rows)
+        elif child == [None]:
+            # RFC 7951 encodes a leaf of type empty as [null]
+            leaves[name] = True
+        else:
+            leaves[name] = child
+    if leaves:
+        rows.append((path, keys, leaves))
+
+
+def is_subtree(value: Any) -> bool:
+    """True for a decoded JSON value holding containers or list entries instead of a single leaf value"""
+    return isinstance(value, dict) or (isinstance(value, list) and bool(value) and isinstance(value[0], dict))
+
+
+def flatten(value: Any, path: str, keys: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """Split a decoded JSON_IETF subtree into one row per container or list entry that has leaves, the
+    leaves become the fields of the row and the keys of the enclosing list entries become its keys
+
+    :param value: The decoded subtree, a container or the entries of a list
+    :type value: Any
+    :param path: Yang path of the subtree
+    :type path: str
+    :param keys: Keys of the prefix and path of the update
+    :type keys: Dict[str, Any]
+    :return: The yang path, keys and leaves of every row
+    """
+    rows: List[Tuple[str, Dict[str, Any], Dict[str, Any]]] = []
+    _flatten(value, path, keys, rows)
+    return rows
@@ -0,0 +1,131 @@
+"""
+.. module:: framing
+   :platform: Unix, Windows
+   :synopsis: Pack the frames of a dial in client into one buffer per batch so a batch crosses
+              into the dispatcher with a single queue put
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+from struct import Struct
+from threading import Lock, Event, Thread
+from time import time
+from typing import Tuple, Optional, Iterator, Iterable, Any
+
+# Length of the payload and the time it arrived, in front of every payload of a framed batch
+FRAME_HEADER: Struct = Struct(">Id")
+
+Frame = Tuple[str, bytes, Optional[str], Optional[str], str, float]
+# A frame with the count of packed payloads appended, the payload is the packed buffer and
+# the arrival time is the one of the first payload
+FramedBatch = Tuple[str, bytes, Optional[str], Optional[str], str, float, int]
+
+
+def frame_count(frame: Tuple[Any, ...]) -> int:
+    """The number of messages in a frame or framed batch"""
+    return frame[6] if len(frame) > 6 else 1
+
+
+def unpack_frames(frame: Tuple[Any, ...]) -> Iterator[Frame]:
+    """The frames packed in a framed batch, or the frame itself
+
+    :param frame: A frame or framed batch taken off the data queue
+    :type frame: Tuple[Any, ...]
+
+    """
+    if len(frame) <= 6:
+        yield frame
+        return
+    encoding, buffer, hostname, version, ip = frame[:5]
+    view: memoryview = memoryview(buffer)
+    offset: int = 0
+    while offset < len(buffer):
+        length, arrival = FRAME_HEADER.unpack_from(buffer, offset)
+        offset += FRAME_HEADER.size
+        yield encoding, bytes(view[offset:offset + length]), hostname, version, ip, arrival
+        offset += length
+
+
+def unpack_batch(batch_list: Iterable[Tuple[Any, ...]]) -> Iterator[Frame]:
+    for frame in batch_list:
+        yield from unpack_frames(frame)
+
+
+class FrameBatcher:
+    """Accumulate the messages of a device into a framed batch that is put on the data queue once
+    it holds max_frames messages or max_bytes, or its first message is max_delay seconds old,
+    the hostname, version and ip are sent once per batch instead of with every message
+
+    :param queue: The queue the dispatcher reads from
+    :type queue: FrameQueue
+    :param encoding: gnmi or ems
+    :type encoding: str
+    :param ip: The address of the device
+    :type ip: str
+    :param max_frames: Messages per batch, 1 puts every message on the queue as is
+    :type max_frames: int
+    :param max_bytes: Bytes of payloads per batch
+    :type max_bytes: int
+    :param max_delay: Seconds a message waits in a batch before it is sent
+    :type max_delay: float
+
+    """
+
+    def __init__(self, queue, encoding: str, ip: str, max_frames: int = 100, max_bytes: int = 1048576,
+                 max_delay: float = 0.05) -> None:
+        self.queue = queue
+        self.encoding: str = encoding
+        self.ip: str = ip
+        self.max_frames: int = max_frames
+        self.max_bytes: int = max_bytes
+        self.max_delay: float = max_delay
+        self.buffer: bytearray = bytearray()
+        self.count: int = 0
+        self.first_arrival: float = 0.0
+        self.hostname: Optional[str] = None
+        self.version: Optional[str] = None
+        self.lock: Lock = Lock()
+        self.stopped: Event = Event()
+        self.flusher: Optional[Thread] = None
+
+    def start(self) -> None:
+        """Start the thread sending batches that reached max_delay, called in the client process"""
+        if self.max_frames > 1:
+            self.flusher = Thread(target=self._flush_expired, name="frame-batcher", daemon=True)
+            self.flusher.start()
+
+    def _flush_expired(self) -> None:
+        while not self.stopped.wait(self.max_delay / 2):
+            with self.lock:
+                if self.count and time() - self.first_arrival >= self.max_delay:
+                    self._flush()
+
+    def _flush(self) -> None:
+        self.queue.put((self.encoding, bytes(self.buffer), self.hostname, self.version, self.ip,
+                        self.first_arrival, self.count))
+        self.buffer = bytearray()
+        self.count = 0
+
+    def add(self, payload: bytes, hostname: Optional[str], version: Optional[str], arrival: float) -> None:
+        if self.max_frames <= 1:
+            self.queue.put((self.encoding, payload, hostname, version, self.ip, arrival))
+            return
+        with self.lock:
+            if self.count and (hostname != self.hostname or version != self.version):
+                self._flush()
+            if not self.count:
+                self.first_arrival = arrival
+                self.hostname = hostname
+                self.version = version
+            self.buffer += FRAME_HEADER.pack(len(payload), arrival)
+            self.buffer += payload
+            self.count += 1
+            if self.count >= self.max_frames or len(self.buffer) >= self.max_bytes:
+                self._flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.count:
+                self._flush()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.flush()
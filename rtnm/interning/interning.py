@@ -0,0 +1,118 @@
+"""
+.. module:: interning
+   :platform: Unix, Windows
+   :synopsis: Process wide table of the yang paths the parsers see, rendered once into measurement names
+              and ES index stems
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import sys
+from datetime import datetime, timedelta
+from time import time
+from typing import Dict, Tuple, Optional, Any
+
+# Bytes of the date suffix of an ES index, every date has the same length
+DATE_SIZE: int = sys.getsizeof("2020.01.01")
+
+
+def es_index_stem(yang_path: str, encoding: str) -> str:
+    """The ES index of a yang path without its date suffix, lower case with the characters ES doesn't allow
+    in index names replaced, shortened so the whole index name stays under 255 bytes
+
+    :param yang_path: The yang path
+    :type yang_path: str
+    :param encoding: gnmi or grpc
+    :type encoding: str
+
+    """
+    index: str = (yang_path.replace("/", "-").lower().replace(":", "-").replace("[", "-").replace("]", "")
+                  .replace('"', ""))
+    size_of_encoding: int = sys.getsizeof(encoding)
+    while sys.getsizeof(index) + DATE_SIZE + size_of_encoding > 255:
+        index = "-".join(index.split("-")[:-1])
+    return f"{index}-{encoding}"
+
+
+class InternedPath:
+    """A yang path and the names it is rendered to
+
+    :param yang_path: The rendered yang path, the measurement name of the path
+    :type yang_path: str
+    :param key: Key of the path in the PathTable, the origin and element names of a gNMI path
+    :type key: Tuple[Any, ...]
+
+    """
+    __slots__ = ("yang_path", "key", "es_stems")
+
+    def __init__(self, yang_path: str, key: Tuple[Any, ...]) -> None:
+        self.yang_path: str = sys.intern(yang_path)
+        self.key: Tuple[Any, ...] = key
+        self.es_stems: Dict[str, str] = {}
+
+    def es_stem(self, encoding: str) -> str:
+        stem: Optional[str] = self.es_stems.get(encoding)
+        if stem is None:
+            stem = self.es_stems[encoding] = es_index_stem(self.yang_path, encoding)
+        return stem
+
+
+class PathTable:
+    """Interns the yang paths of gNMI prefixes and updates by origin and element names and of EMS rows
+    by encoding path and sub path, so a path is rendered once per process instead of once per message,
+    the table is cleared when it reaches max_paths
+
+    :param max_paths: Paths kept before the table is cleared
+    :type max_paths: int
+
+    """
+
+    def __init__(self, max_paths: int = 65536) -> None:
+        self.max_paths: int = max_paths
+        self.paths: Dict[Tuple[Any, ...], InternedPath] = {}
+
+    def _add(self, key: Tuple[Any, ...], yang_path: str) -> InternedPath:
+        if len(self.paths) >= self.max_paths:
+            self.paths.clear()
+        path: InternedPath = InternedPath(yang_path, key)
+        self.paths[key] = path
+        return path
+
+    def gnmi(self, origin: str, names: Tuple[str, ...]) -> InternedPath:
+        """The path of a gNMI origin and element names, origin:name/name/..."""
+        path: Optional[InternedPath] = self.paths.get((origin, names))
+        if path is None:
+            path = self._add((origin, names), f"{origin}:{'/'.join(names)}")
+        return path
+
+    def ems(self, encoding_path: str, sub_path: str) -> InternedPath:
+        """The path of a row of an EMS message, the encoding path followed by the path of the row"""
+        path: Optional[InternedPath] = self.paths.get(("", encoding_path, sub_path))
+        if path is None:
+            path = self._add(("", encoding_path, sub_path), f"{encoding_path}{sub_path}")
+        return path
+
+    def rendered(self, yang_path: str) -> InternedPath:
+        """The path of a yang path that is already rendered, for callers that only have the string"""
+        path: Optional[InternedPath] = self.paths.get((yang_path,))
+        if path is None:
+            path = self._add((yang_path,), yang_path)
+        return path
+
+
+class DailyDate:
+    """The local date as year.month.day, formatted again only once the day rolls over"""
+
+    def __init__(self) -> None:
+        self.date: str = ""
+        self.next_day: float = 0.0
+
+    def __call__(self) -> str:
+        if time() >= self.next_day:
+            now: datetime = datetime.now()
+            self.date = f"{now.year}.{now.month:02d}.{now.day:02d}"
+            self.next_day = (datetime(now.year, now.month, now.day) + timedelta(days=1)).timestamp()
+        return self.date
+
+
+# Shared by every parser of a process
+PATHS: PathTable = PathTable()
+TODAY: DailyDate = DailyDate()
@@ -0,0 +1,336 @@
+"""
+.. module:: metrics
+   :platform: Unix, Windows
+   :synopsis: Counters and histograms of every pipeline stage exposed in the Prometheus text format
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Queue
+from threading import Lock, Thread
+from time import time
+from typing import Dict, List, Tuple, Any, Optional, Callable
+from urllib.parse import urlsplit, parse_qs
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATIO_BUCKETS: Tuple[float, ...] = (1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+LAG_BUCKETS: Tuple[float, ...] = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def escape_label_value(value: str) -> str:
+    """Escape a label value for the Prometheus text format, device names and yang paths can hold any character"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """Base class of a metric keyed by the values of its labels
+
+    :param name: Name of the metric
+    :type name: str
+    :param documentation: Help text of the metric
+    :type documentation: str
+    :param label_names: Names of the labels of the metric
+    :type label_names: Tuple[str, ...]
+
+    """
+    kind: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.label_names: Tuple[str, ...] = label_names
+        self.values: Dict[Tuple[str, ...], Any] = {}
+        self.lock: Lock = Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs: List[str] = [f'{name}="{escape_label_value(value)}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(pairs) + "}"
+
+    def collect(self) -> Dict[Tuple[str, ...], Any]:
+        """Return the values recorded since the last collect and reset them"""
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values: Dict[Tuple[str, ...], Any]) -> None:
+        raise NotImplementedError("Can't call merge in base class")
+
+    def render(self) -> List[str]:
+        raise NotImplementedError("Can't call render in base class")
+
+
+class Counter(Metric):
+    kind: str = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key: Tuple[str, ...] = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values: Dict[Tuple[str, ...], float]) -> None:
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in values]
+
+
+class Gauge(Metric):
+    kind: str = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key: Tuple[str, ...] = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def merge(self, values: Dict[Tuple[str, ...], float]) -> None:
+        with self.lock:
+            self.values.update(values)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in values]
+
+
+class Histogram(Metric):
+    kind: str = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets: Tuple[float, ...] = buckets
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key: Tuple[str, ...] = self._key(labels)
+        with self.lock:
+            entry: Optional[List[Any]] = self.values.get(key)
+            if entry is None:
+                # Bucket counts followed by the sum and count of all observations
+                entry = self.values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def merge(self, values: Dict[Tuple[str, ...], List[Any]]) -> None:
+        with self.lock:
+            for key, other in values.items():
+                entry: Optional[List[Any]] = self.values.get(key)
+                if entry is None:
+                    self.values[key] = list(other)
+                else:
+                    for index, value in enumerate(other):
+                        entry[index] += value
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = [(key, list(entry)) for key, entry in self.values.items()]
+        lines: List[str] = []
+        for key, entry in values:
+            cumulative: int = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                bucket_labels: str = self._format_labels(key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels: str = self._format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {entry[-1]}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {entry[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Every metric of a process, worker processes ship what they recorded to the main process
+    through a queue where it is merged and rendered for scraping
+
+    """
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self.queue: Optional[Queue] = None
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def collect(self) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+        collected: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+        for name, metric in self.metrics.items():
+            values: Dict[Tuple[str, ...], Any] = metric.collect()
+            if values:
+                collected[name] = values
+        return collected
+
+    def merge(self, collected: Dict[str, Dict[Tuple[str, ...], Any]]) -> None:
+        for name, values in collected.items():
+            if name in self.metrics:
+                self.metrics[name].merge(values)
+
+    def flush(self) -> None:
+        """Ship the metrics recorded in this process to the main process, a no-op if metrics aren't exported"""
+        if self.queue is not None:
+            collected: Dict[str, Dict[Tuple[str, ...], Any]] = self.collect()
+            if collected:
+                self.queue.put(collected)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            rendered: List[str] = metric.render()
+            if rendered:
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(rendered)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY: MetricsRegistry = MetricsRegistry()
+
+MESSAGES_RECEIVED: Counter = REGISTRY.counter(
+    "rtnm_messages_received_total", "Telemetry messages received from devices", ("device",))
+BYTES_RECEIVED: Counter = REGISTRY.counter(
+    "rtnm_bytes_received_total", "Bytes of telemetry messages received from devices", ("device",))
+QUEUE_DEPTH: Gauge = REGISTRY.gauge(
+    "rtnm_queue_depth", "Messages waiting in the data queue of the dispatcher")
+QUEUE_BYTES: Gauge = REGISTRY.gauge(
+    "rtnm_queue_bytes", "Bytes of payloads waiting in the data queue of the dispatcher")
+FRAMES_DROPPED: Counter = REGISTRY.counter(
+    "rtnm_frames_dropped_total", "Frames dropped because the data queue was full", ("policy",))
+BYTES_DROPPED: Counter = REGISTRY.counter(
+    "rtnm_bytes_dropped_total", "Bytes of payloads dropped because the data queue was full", ("policy",))
+FRAMES_SPILLED: Counter = REGISTRY.counter(
+    "rtnm_frames_spilled_total", "Frames spilled to disk because the data queue was full", ("policy",))
+IN_FLIGHT_BATCHES: Gauge = REGISTRY.gauge(
+    "rtnm_in_flight_batches", "Batches dispatched to the worker pool that haven't finished")
+INPUT_UP: Gauge = REGISTRY.gauge(
+    "rtnm_input_up", "1 while the input of a device runs and streams from the device, 0 while it is down", ("input",))
+INPUT_RESTARTS: Counter = REGISTRY.counter(
+    "rtnm_input_restarts_total", "Times the supervisor restarted the input of a device after it exited", ("input",))
+BATCH_WAIT: Histogram = REGISTRY.histogram(
+    "rtnm_batch_wait_seconds", "Time from the first message of a batch until it is dispatched to the worker pool")
+BATCH_SIZE: Histogram = REGISTRY.histogram(
+    "rtnm_batch_messages", "Messages in a dispatched batch", buckets=(1, 10, 50, 100, 250, 500, 1000, 5000))
+STAGE_LATENCY: Histogram = REGISTRY.histogram(
+    "rtnm_stage_seconds", "Time spent per batch in a pipeline stage (decode, parse, encode, upload)", ("stage",))
+BYTES_SENT: Counter = REGISTRY.counter(
+    "rtnm_bytes_sent_total", "Bytes of request bodies posted to outputs", ("output",))
+UPLOAD_ERRORS: Counter = REGISTRY.counter(
+    "rtnm_upload_errors_total", "Failed upload requests", ("output",))
+UPLOAD_RETRIES: Counter = REGISTRY.counter(
+    "rtnm_upload_retries_total", "Upload requests or bulk items that were resent", ("output",))
+COMPRESSION_RATIO: Histogram = REGISTRY.histogram(
+    "rtnm_compression_ratio", "Uncompressed to compressed size of request bodies", ("output",), RATIO_BUCKETS)
+COMPRESSION_CPU: Counter = REGISTRY.counter(
+    "rtnm_compression_cpu_seconds_total", "CPU time spent encoding and compressing request bodies", ("output",))
+
+DEVICE_LAG: Histogram = REGISTRY.histogram(
+    "rtnm_device_to_collector_seconds", "Time from the device timestamp of a message until it arrived at the collector",
+    ("device", "path"), LAG_BUCKETS)
+UPLOAD_LAG: Histogram = REGISTRY.histogram(
+    "rtnm_collector_to_upload_seconds",
+    "Time from the arrival of the oldest message of a device and path in a batch until the batch was uploaded",
+    ("device", "path"), LAG_BUCKETS)
+LAST_SEEN: Gauge = REGISTRY.gauge(
+    "rtnm_last_seen_timestamp_seconds", "Unix time a message of a device and path last arrived", ("device", "path"))
+
+
+def observe_upload_lag(arrivals: Dict[Tuple[str, str], float]) -> None:
+    """Record the lag between arrival and upload completion of a batch
+
+    :param arrivals: Arrival time of the oldest message in the batch keyed by device and path
+    :type arrivals: Dict[Tuple[str, str], float]
+
+    """
+    now: float = time()
+    for (device, path), arrival in arrivals.items():
+        UPLOAD_LAG.observe(now - arrival, device=device, path=path)
+
+
+def init_metrics(queue: Optional[Queue]) -> None:
+    """Send the metrics recorded in this process to the main process through a queue
+
+    :param queue: The queue the metrics server reads from, None if metrics aren't exported
+    :type queue: Optional[Queue]
+
+    """
+    REGISTRY.queue = queue
+
+
+class MetricsServer(Thread):
+    """Thread in the main process merging the metrics of the worker processes and serving
+    them over HTTP in the Prometheus text format
+
+    :param queue: The queue worker processes flush their metrics to
+    :type queue: Queue
+    :param port: The port to serve /metrics on
+    :type port: int
+    :param address: The address to bind to
+    :type address: str
+    :param routes: Extra paths to serve, each handler gets the query string and returns a status code and text
+    :type routes: Optional[Dict[str, Callable[[Dict[str, List[str]]], Tuple[int, str]]]]
+
+    """
+
+    def __init__(self, queue: Queue, port: int, address: str = "0.0.0.0",
+                 routes: Optional[Dict[str, Callable[[Dict[str, List[str]]], Tuple[int, str]]]] = None) -> None:
+        super().__init__(name="metrics-server", daemon=True)
+        self.queue: Queue = queue
+        extra_routes: Dict[str, Callable[[Dict[str, List[str]]], Tuple[int, str]]] = routes or {}
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def _reply(self, code: int, text: str) -> None:
+                body: bytes = text.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                url = urlsplit(self.path)
+                if url.path in ["/", "/metrics"]:
+                    self._reply(200, REGISTRY.render())
+                elif url.path in extra_routes:
+                    self._reply(*extra_routes[url.path](parse_qs(url.query)))
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.http_server: ThreadingHTTPServer = ThreadingHTTPServer((address, port), MetricsHandler)
+        self.http_thread: Thread = Thread(target=self.http_server.serve_forever, name="metrics-http", daemon=True)
+
+    def run(self) -> None:
+        self.http_thread.start()
+        while True:
+            collected: Optional[Dict[str, Dict[Tuple[str, ...], Any]]] = self.queue.get()
+            if collected is None:
+                break
+            REGISTRY.merge(collected)
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self.http_server.shutdown()
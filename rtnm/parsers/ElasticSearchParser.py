@@ -10,6 +10,7 @@ from parsers.Parsers import RTNMParser, ParsedResponse
 from protos.gnmi_pb2 import SubscribeResponse, TypedValue, Update
 from protos.telemetry_pb2 import Telemetry, TelemetryField
 from utils.utils import yang_path_to_es_index
+from framing.framing import unpack_batch
 
 
 class ElasticSearchParser(RTNMParser):
@@ -238,7 +239,7 @@ class ElasticSearchParser(RTNMParser):
         self.log.debug("In decode and parse")
         parsed_list: List[ParsedResponse] = []
         try:
-            for response in self.raw_responses:
+            for response in unpack_batch(self.raw_responses):
                 gpb_encoding = response[0]
                 decoded_response = self._decode(response)
                 self.log.debug(decoded_response)
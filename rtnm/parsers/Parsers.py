@@ -5,11 +5,20 @@
 .. moduleauthor:: Greg Brown <gsb5067@gmail.com>
 """
 
-import json
+from time import perf_counter
 from typing import List, Union, Optional, Tuple, Dict, Any
 from logging import getLogger, Logger
 from protos.gnmi_pb2 import SubscribeResponse, TypedValue, Update
 from protos.telemetry_pb2 import Telemetry, TelemetryField
+from metrics.metrics import STAGE_LATENCY, DEVICE_LAG, LAST_SEEN
+from framing.framing import unpack_batch
+from flattening.flattening import json_loads, is_subtree, flatten, register_list_keys
+from interning.interning import PATHS, InternedPath
+
+# Keys and interned yang path of the prefixes of aliased notifications, keyed by device and the alias the dial in
+# client tagged the notification with, cleared when it reaches PREFIX_CACHE_SIZE
+PREFIX_CACHE: Dict[Tuple[str, str], Tuple[Dict[str, str], InternedPath]] = {}
+PREFIX_CACHE_SIZE: int = 65536
 
 
 class ParsedResponse:
@@ -31,9 +40,10 @@ class RTNMParser:
                  log_name: str) -> None:
         self.raw_responses: List[Tuple[str, str, Optional[str], Optional[str], str]] = batch_list
         self.log: Logger = getLogger(log_name)
+        self.arrivals: Dict[Tuple[str, str], float] = {}
 
     @staticmethod
-    def process_header(header: Update) -> Tuple[Dict[str, str], str]:
+    def process_header(header: Update) -> Tuple[Dict[str, str], InternedPath]:
         """Separate the update header into keys and the starting yang path
 
         :param header: The top level update of the gNMI response that has the keys and yang path
@@ -47,7 +57,26 @@ class RTNMParser:
             yang_path.append(elem.name)
             if elem.key:
                 keys.update(elem.key)
-        return keys, f"{header.prefix.origin}:{'/'.join(yang_path)}"
+        return keys, PATHS.gnmi(header.prefix.origin, tuple(yang_path))
+
+    def cached_header(self, header: Update, ip: str) -> Tuple[Dict[str, str], InternedPath]:
+        """process_header of a notification, cached for notifications whose prefix came from an alias
+
+        :param header: The top level update of the gNMI response that has the keys and yang path
+        :type header: Update
+        :param ip: The address of the device
+        :type ip: str
+
+        """
+        if not header.alias:
+            return self.process_header(header)
+        key: Tuple[str, str] = (ip, header.alias)
+        cached: Optional[Tuple[Dict[str, str], InternedPath]] = PREFIX_CACHE.get(key)
+        if cached is None:
+            if len(PREFIX_CACHE) >= PREFIX_CACHE_SIZE:
+                PREFIX_CACHE.clear()
+            cached = PREFIX_CACHE[key] = self.process_header(header)
+        return cached
 
     @staticmethod
     def get_value(type_value: TypedValue):
@@ -79,8 +108,8 @@ class RTNMParser:
             "float_val": float,
             "decimal_val": decimal_parse,
             "leaflist_val": leaf_list_parse,
-            "json_val": json.loads,
-            "json_ietf_val": json.loads,
+            "json_val": json_loads,
+            "json_ietf_val": json_loads,
             "ascii_val": str,
             "proto_bytes": bytes,
         }
@@ -101,30 +130,68 @@ class RTNMParser:
             tele.ParseFromString(raw_message[1])
             return tele
 
+    def observe_lag(self, response: Union[SubscribeResponse, Telemetry], encoding: str, ip: str, arrival: float) -> None:
+        """Record how far behind the device a message arrived and keep the oldest arrival
+        of every device and path in the batch to measure upload lag
+
+        :param response: The decoded response
+        :type response: Union[SubscribeResponse, Telemetry]
+        :param encoding: gnmi or ems
+        :type encoding: str
+        :param ip: The address of the device
+        :type ip: str
+        :param arrival: Unix time the collector received the message
+        :type arrival: float
+
+        """
+        if encoding == "gnmi":
+            prefix = response.update.prefix
+            if response.update.alias:
+                path: str = self.cached_header(response.update, ip)[1].yang_path
+            else:
+                path = PATHS.gnmi(prefix.origin, tuple(elem.name for elem in prefix.elem)).yang_path
+            sent: float = response.update.timestamp / 1e9
+        else:
+            path = response.encoding_path
+            sent = response.msg_timestamp / 1e3
+        DEVICE_LAG.observe(arrival - sent, device=ip, path=path)
+        LAST_SEEN.set(arrival, device=ip, path=path)
+        key: Tuple[str, str] = (ip, path)
+        if arrival < self.arrivals.get(key, arrival + 1):
+            self.arrivals[key] = arrival
+
     def parse_gnmi(self, response: SubscribeResponse, hostname: str, version: str, ip: str) -> List[ParsedResponse]:
         self.log.debug("In parse_gnmi")
-        keys, start_yang_path = self.process_header(response.update)
-        content_list: List[Dict[str, Any]] = []
+        keys, prefix_path = self.cached_header(response.update, ip)
+        origin, prefix_names = prefix_path.key
+        rc_parsed_responses: List[ParsedResponse] = []
+        sorted_content: Dict[str, Dict[str, Any]] = {}
         for update in response.update.update:
-            yang_paths = []
             value = self.get_value(update.val)
-            for elem in update.path.elem:
-                yang_paths.append(elem.name)
-            leaf = yang_paths.pop()
-            end_yang_path = "/".join(yang_paths)
-            if yang_paths:
-                content_list.append({f"{start_yang_path}/{end_yang_path}": {leaf: value}})
-            else:
-                content_list.append({f"{start_yang_path}{end_yang_path}": {leaf: value}})
-        sorted_content: Dict[str, Any] = {}
-        for content_entry in content_list:
-            key = list(content_entry.keys())[0]
-            if key in sorted_content:
-                sorted_content[key].update(list(content_entry.values())[0])
-            else:
-                sorted_content[key] = {}
-                sorted_content[key].update(list(content_entry.values())[0])
-        rc_parsed_responses: List[ParsedResponse] = []
+            if is_subtree(value):
+                # A JSON_IETF container or list, its leaves become fields and its list keys become keys
+                update_keys: Dict[str, Any] = keys
+                names: Tuple[str, ...] = prefix_names + tuple(elem.name for elem in update.path.elem)
+                for index, elem in enumerate([*response.update.prefix.elem, *update.path.elem]):
+                    if elem.key:
+                        register_list_keys(PATHS.gnmi(origin, names[:index + 1]).yang_path, elem.key)
+                        if index >= len(prefix_names):
+                            update_keys = {**update_keys, **elem.key}
+                path: str = PATHS.gnmi(origin, names).yang_path
+                for yang_path, row_keys, leaves in flatten(value, path, update_keys):
+                    rc_parsed_responses.append(ParsedResponse(yang_path, {"keys": row_keys, "content": leaves},
+                                                              version, hostname, "gnmi",
+                                                              int(response.update.timestamp), ip))
+                continue
+            yang_paths: Tuple[str, ...] = tuple(elem.name for elem in update.path.elem)
+            leaf: str = yang_paths[-1]
+            # The containers of the leaf, if any, extend the yang path of the prefix
+            yang_path: str = (PATHS.gnmi(origin, prefix_names + yang_paths[:-1]).yang_path if len(yang_paths) > 1
+                              else prefix_path.yang_path)
+            content: Optional[Dict[str, Any]] = sorted_content.get(yang_path)
+            if content is None:
+                content = sorted_content[yang_path] = {}
+            content[leaf] = value
         for yang_path, content in sorted_content.items():
             rc_parsed_responses.append(ParsedResponse(yang_path, {"keys": keys, "content": content},
                                                       version, hostname, "gnmi", int(response.update.timestamp), ip))
@@ -185,8 +252,8 @@ class RTNMParser:
                         parsed_content: Dict[str, Dict[str, Any]] = {}
                         self.parse_content(telemetry_field, "", parsed_content)
             for pc_path, pc_data in parsed_content.items():
+                total_yang_path: str = PATHS.ems(start_yang_path, pc_path).yang_path
                 for data in pc_data:
-                    total_yang_path = f"{start_yang_path}{pc_path}"
                     parsed_list.append(ParsedResponse(total_yang_path, {"keys": keys, "content": data},
                                                       version, node_str, "grpc", timestamp * 1000000, ip))
         return parsed_list
@@ -194,18 +261,28 @@ class RTNMParser:
     def decode_and_parse_raw_responses(self) -> List[ParsedResponse]:
         self.log.debug("In decode and parse")
         parsed_list: List[ParsedResponse] = []
+        decode_time: float = 0.0
+        parse_time: float = 0.0
         try:
-            for response in self.raw_responses:
+            for response in unpack_batch(self.raw_responses):
                 gpb_encoding = response[0]
+                start: float = perf_counter()
                 decoded_response = self._decode(response)
+                decoded: float = perf_counter()
+                decode_time += decoded - start
                 self.log.debug(decoded_response)
+                if len(response) > 5:
+                    self.observe_lag(decoded_response, gpb_encoding, response[4], response[5])
                 if gpb_encoding == "gnmi":
                     parsed_list.extend(self.parse_gnmi(decoded_response,
                                                        response[2], response[3], response[4]))
                 else:
                     parsed_list.extend(self.parse_ems(decoded_response, response[3], response[4]))
+                parse_time += perf_counter() - decoded
         except Exception as error:
             self.log.error(error)
             import traceback
             self.log.error(traceback.print_exc())
+        STAGE_LATENCY.observe(decode_time, stage="decode")
+        STAGE_LATENCY.observe(parse_time, stage="parse")
         return parsed_list
@@ -0,0 +1,173 @@
+"""
+.. module:: polling
+   :platform: Unix, Windows
+   :synopsis: Timer wheel sending gNMI Poll requests on open POLL mode streams at the interval of their sensors
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import random
+from logging import Logger, getLogger
+from queue import Queue
+from threading import Thread, Event, Lock
+from time import time, monotonic
+from typing import List, Callable, Optional, Iterator
+from zlib import crc32
+
+from protos.gnmi_pb2 import SubscribeRequest, Poll
+
+
+class PollTimer:
+    """A stream polled every interval seconds, at offset seconds past every multiple of the interval
+    since the epoch, so the polls of a device land at the same point of the interval across restarts
+
+    :param key: Identifies the stream, the device address and interval
+    :type key: str
+    :param interval: Seconds between polls
+    :type interval: float
+    :param send: Sends a Poll request on the stream
+    :type send: Callable[[], None]
+    :param jitter: Extra random delay of every poll in seconds
+    :type jitter: float
+
+    """
+
+    def __init__(self, key: str, interval: float, send: Callable[[], None], jitter: float) -> None:
+        self.key: str = key
+        self.interval: float = interval
+        self.send: Callable[[], None] = send
+        self.jitter: float = jitter
+        # Spreads the fleet evenly over the interval without the devices coordinating
+        self.offset: float = crc32(key.encode("utf-8")) / 2 ** 32 * interval
+        self.deadline: float = 0.0
+        self.cancelled: bool = False
+
+    def next_deadline(self, now: float) -> float:
+        aligned: float = (now - self.offset) // self.interval * self.interval + self.offset + self.interval
+        return aligned + random.uniform(0, self.jitter)
+
+
+class PollScheduler:
+    """Hashed timer wheel of PollTimers, every tick the timers of one slot whose deadline passed are
+    fired and scheduled again for their next interval, so a tick costs the timers due instead of every stream
+
+    :param tick: Seconds per slot of the wheel
+    :type tick: float
+    :param slots: Slots of the wheel, timers further out than slots * tick stay in their slot for more turns
+    :type slots: int
+    :param max_jitter: Most random delay added to a poll, capped at a tenth of the interval
+    :type max_jitter: float
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 600, max_jitter: float = 1.0, log_name: str = "") -> None:
+        self.tick: float = tick
+        self.wheel: List[List[PollTimer]] = [[] for _ in range(slots)]
+        self.max_jitter: float = max_jitter
+        self.log: Logger = getLogger(log_name)
+        self.lock: Lock = Lock()
+        self.stopped: Event = Event()
+        self.current: int = int(time() / tick)
+        self.thread: Optional[Thread] = None
+
+    def _insert(self, timer: PollTimer) -> None:
+        self.wheel[int(timer.deadline / self.tick) % len(self.wheel)].append(timer)
+
+    def add(self, key: str, interval: float, send: Callable[[], None]) -> PollTimer:
+        """Poll a stream every interval seconds
+
+        :param key: Identifies the stream, the device address and interval
+        :type key: str
+        :param interval: Seconds between polls
+        :type interval: float
+        :param send: Sends a Poll request on the stream
+        :type send: Callable[[], None]
+        :return: The timer, pass it to remove when the stream closes
+        """
+        timer: PollTimer = PollTimer(key, interval, send, min(self.max_jitter, interval / 10))
+        timer.deadline = timer.next_deadline(time())
+        with self.lock:
+            self._insert(timer)
+        return timer
+
+    def remove(self, timer: PollTimer) -> None:
+        timer.cancelled = True
+
+    def start(self) -> None:
+        self.thread = Thread(target=self._run, name="poll-scheduler", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(max(0.0, (self.current + 1) * self.tick - time())):
+            now: float = time()
+            due: List[PollTimer] = []
+            with self.lock:
+                while (self.current + 1) * self.tick <= now:
+                    slot: List[PollTimer] = self.wheel[self.current % len(self.wheel)]
+                    waiting: List[PollTimer] = [timer for timer in slot if timer.deadline > now and not timer.cancelled]
+                    due.extend(timer for timer in slot if timer.deadline <= now and not timer.cancelled)
+                    slot[:] = waiting
+                    self.current += 1
+                for timer in due:
+                    timer.deadline = timer.next_deadline(now)
+                    self._insert(timer)
+            for timer in due:
+                try:
+                    timer.send()
+                except Exception as error:
+                    self.log.error(f"Unable to poll {timer.key}: {error}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+class PollRequests:
+    """Request iterator of a POLL mode Subscribe call, yields the subscribe request then a Poll request
+    every time poll is called, a poll is skipped while the previous one hasn't been answered for less
+    than timeout seconds, after that the previous poll is given up on
+
+    :param subscribe: The SubscribeRequest opening the stream
+    :type subscribe: SubscribeRequest
+    :param name: Name of the stream for logging
+    :type name: str
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+    :param timeout: Seconds to wait for the answer of a poll, the poll interval of the stream
+    :type timeout: float
+
+    """
+
+    def __init__(self, subscribe: SubscribeRequest, name: str, log_name: str = "", timeout: float = 60.0) -> None:
+        self.subscribe: SubscribeRequest = subscribe
+        self.name: str = name
+        self.log: Logger = getLogger(log_name)
+        self.timeout: float = timeout
+        self.requests: Queue = Queue()
+        self.outstanding: bool = False
+        self.sent: float = 0.0
+
+    def __iter__(self) -> Iterator[SubscribeRequest]:
+        yield self.subscribe
+        while True:
+            request: Optional[SubscribeRequest] = self.requests.get()
+            if request is None:
+                return
+            yield request
+
+    def poll(self) -> None:
+        now: float = monotonic()
+        if self.outstanding:
+            if now - self.sent < self.timeout:
+                self.log.debug(f"Skipping a poll of {self.name}, the last poll wasn't answered yet")
+                return
+            self.log.warning(f"The last poll of {self.name} wasn't answered within {self.timeout}s, polling again")
+        self.outstanding = True
+        self.sent = now
+        self.requests.put(SubscribeRequest(poll=Poll()))
+
+    def answered(self) -> None:
+        """Called on the sync_response that ends the updates of a poll"""
+        self.outstanding = False
+
+    def close(self) -> None:
+        self.requests.put(None)
@@ -0,0 +1,153 @@
+"""
+.. module:: profiling
+   :platform: Unix
+   :synopsis: On demand cProfile and sampling profilers for the dispatcher, dial in clients and pool workers
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import os
+import sys
+import signal
+import cProfile
+import threading
+from datetime import datetime
+from logging import Logger, getLogger
+from multiprocessing import Value
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Dict, List, Optional, Tuple
+
+CPROFILE: str = "cprofile"
+SAMPLE: str = "sample"
+MODE_SIGNALS: Dict[str, int] = {CPROFILE: signal.SIGUSR1, SAMPLE: signal.SIGUSR2}
+
+# Shared with processes forked after import so a request from the main process can set the duration
+REQUESTED_SECONDS = Value("d", 30.0)
+
+
+class ProcessProfiler:
+    """Profile the main thread of a process for a number of seconds when it receives a signal,
+    SIGUSR1 runs cProfile and writes a .prof file (viewable with snakeviz), SIGUSR2 runs a
+    low overhead sampling profiler and writes collapsed stacks (viewable with speedscope or flamegraph.pl)
+
+    cProfile only traces the thread that enabled it, so the profiled loop has to call poll
+    for it to start and stop, the sampling profiler runs on its own thread and needs no polling
+
+    :param name: Name of the process used in the file names of the profiles
+    :type name: str
+    :param path: Directory to write the profiles to
+    :type path: Path
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+    :param sample_interval: Seconds between samples of the sampling profiler
+    :type sample_interval: float
+
+    """
+
+    def __init__(self, name: str, path: Path, log_name: str, sample_interval: float = 0.01) -> None:
+        self.name: str = name
+        self.path: Path = path
+        self.log: Logger = getLogger(log_name)
+        self.sample_interval: float = sample_interval
+        self.thread_id: int = threading.main_thread().ident
+        self.pending: bool = False
+        self.profile: Optional[cProfile.Profile] = None
+        self.seconds: float = 0.0
+        self.deadline: float = 0.0
+        self.sampler: Optional[threading.Thread] = None
+
+    def install(self) -> None:
+        signal.signal(MODE_SIGNALS[CPROFILE], lambda signum, frame: self.request(CPROFILE))
+        signal.signal(MODE_SIGNALS[SAMPLE], lambda signum, frame: self.request(SAMPLE))
+
+    def _file_name(self, suffix: str) -> Path:
+        self.path.mkdir(exist_ok=True)
+        timestamp: str = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return self.path / f"{self.name}-{os.getpid()}-{timestamp}.{suffix}"
+
+    def request(self, mode: str, seconds: Optional[float] = None) -> None:
+        seconds = REQUESTED_SECONDS.value if seconds is None else seconds
+        if mode == CPROFILE:
+            if self.profile is None:
+                self.seconds = seconds
+                self.pending = True
+        elif self.sampler is None or not self.sampler.is_alive():
+            self.sampler = threading.Thread(target=self._sample, args=(seconds,),
+                                            name=f"{self.name}-sampler", daemon=True)
+            self.sampler.start()
+
+    def poll(self) -> None:
+        """Start or stop a requested cProfile run, called from the thread being profiled"""
+        if self.pending:
+            self.pending = False
+            self.log.info(f"Starting cProfile of {self.name} for {self.seconds}s")
+            self.deadline = monotonic() + self.seconds
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif self.profile is not None and monotonic() >= self.deadline:
+            self.profile.disable()
+            file_name: Path = self._file_name("prof")
+            self.profile.dump_stats(str(file_name))
+            self.profile = None
+            self.log.info(f"Wrote cProfile of {self.name} to {file_name}")
+
+    def _sample(self, seconds: float) -> None:
+        self.log.info(f"Starting sampling profile of {self.name} for {seconds}s")
+        stacks: Dict[Tuple[str, ...], int] = {}
+        deadline: float = monotonic() + seconds
+        while monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key: Tuple[str, ...] = tuple(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+            sleep(self.sample_interval)
+        file_name: Path = self._file_name("collapsed.txt")
+        with open(file_name, "w") as collapsed:
+            for stack_key, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                collapsed.write(f"{';'.join(stack_key)} {count}\n")
+        self.log.info(f"Wrote sampling profile of {self.name} to {file_name}")
+
+
+PROFILER: Optional[ProcessProfiler] = None
+
+
+def init_profiler(name: str, path: Path, log_name: str) -> ProcessProfiler:
+    """Create the profiler of this process and install its signal handlers
+
+    :param name: Name of the process used in the file names of the profiles
+    :type name: str
+    :param path: Directory to write the profiles to
+    :type path: Path
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+    global PROFILER
+    PROFILER = ProcessProfiler(name, path, log_name)
+    PROFILER.install()
+    return PROFILER
+
+
+def poll_profiler() -> None:
+    if PROFILER is not None:
+        PROFILER.poll()
+
+
+def trigger_profile(pids: List[int], mode: str, seconds: float) -> None:
+    """Ask other processes to profile themselves
+
+    :param pids: The processes to profile
+    :type pids: List[int]
+    :param mode: cprofile or sample
+    :type mode: str
+    :param seconds: How long to profile for
+    :type seconds: float
+
+    """
+    REQUESTED_SECONDS.value = seconds
+    for pid in pids:
+        os.kill(pid, MODE_SIGNALS[mode])
@@ -0,0 +1,243 @@
+"""
+.. module:: routing
+   :platform: Unix, Windows
+   :synopsis: Worker processes with a queue each and a consistent hash ring pinning every device to one of them
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+from bisect import bisect
+from hashlib import md5
+from logging import Logger, getLogger
+from multiprocessing import Process, Queue
+from threading import Lock
+from time import perf_counter
+from typing import List, Dict, Tuple, Callable, Any, Optional
+
+from framing.framing import frame_count
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring of worker indexes, adding a worker only moves the devices that land on its
+    points instead of reshuffling every device
+
+    :param nodes: Number of workers
+    :type nodes: int
+    :param replicas: Points per worker on the ring, more points spread devices more evenly
+    :type replicas: int
+
+    """
+
+    def __init__(self, nodes: int, replicas: int = 64) -> None:
+        self.replicas: int = replicas
+        self.points: List[Tuple[int, int]] = []
+        self.hashes: List[int] = []
+        self.assigned: Dict[str, int] = {}
+        self.resize(nodes)
+
+    def resize(self, nodes: int) -> None:
+        self.points = sorted((ring_hash(f"worker-{node}-{replica}"), node)
+                             for node in range(nodes) for replica in range(self.replicas))
+        self.hashes = [point for point, _ in self.points]
+        self.assigned = {}
+
+    def node(self, key: str) -> int:
+        node: Optional[int] = self.assigned.get(key)
+        if node is None:
+            node = self.assigned[key] = self.points[bisect(self.hashes, ring_hash(key)) % len(self.points)][1]
+        return node
+
+
+class AffinityWorker(Process):
+    """Worker process running every job put on its own queue, the jobs of a device always land on
+    the same worker so whatever the worker caches about a device stays in one process
+
+    :param index: Index of the worker on the hash ring
+    :type index: int
+    :param queue: The queue of jobs of this worker
+    :type queue: Queue
+    :param target: The function run with the arguments of every job
+    :type target: Callable[..., Any]
+    :param initializer: Called once when the worker starts
+    :type initializer: Optional[Callable[..., None]]
+    :param initargs: Arguments of the initializer
+    :type initargs: Tuple[Any, ...]
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+
+    def __init__(self, index: int, queue: Queue, target: Callable[..., Any],
+                 initializer: Optional[Callable[..., None]], initargs: Tuple[Any, ...], log_name: str) -> None:
+        super().__init__(name=f"affinity-worker-{index}", daemon=True)
+        self.index: int = index
+        self.queue: Queue = queue
+        self.target: Callable[..., Any] = target
+        self.initializer: Optional[Callable[..., None]] = initializer
+        self.initargs: Tuple[Any, ...] = initargs
+        self.log_name: str = log_name
+
+    def run(self) -> None:
+        if self.initializer is not None:
+            self.initializer(*self.initargs)
+        log: Logger = getLogger(self.log_name)
+        while True:
+            job: Optional[Tuple[Any, ...]] = self.queue.get()
+            if job is None:
+                break
+            try:
+                self.target(*job)
+            except Exception as error:
+                log.error(f"Batch failed in {self.name}: {error}")
+
+
+class AffinityPool:
+    """Fixed workers fed through a bounded queue each, the dispatcher routes every frame to the batch
+    of the worker its device hashes to and the batch is queued on that worker once it is full,
+    a full worker queue blocks the dispatcher
+
+    :param processes: Number of workers
+    :type processes: int
+    :param target: The function workers run for every batch, called with the batch followed by job_args
+    :type target: Callable[..., Any]
+    :param job_args: Arguments passed to target after the batch
+    :type job_args: Tuple[Any, ...]
+    :param batch_size: Messages per batch
+    :type batch_size: int
+    :param initializer: Called once in every worker when it starts
+    :type initializer: Optional[Callable[..., None]]
+    :param initargs: Arguments of the initializer
+    :type initargs: Tuple[Any, ...]
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+    :param max_queued: Batches waiting in the queue of a worker before the dispatcher blocks
+    :type max_queued: int
+    :param observe: Called with every batch and the perf_counter() of its first message before it is queued
+    :type observe: Optional[Callable[[List[Tuple[Any, ...]], float], None]]
+
+    """
+
+    def __init__(self, processes: int, target: Callable[..., Any], job_args: Tuple[Any, ...], batch_size: int,
+                 initializer: Optional[Callable[..., None]], initargs: Tuple[Any, ...], log_name: str,
+                 max_queued: int = 2, observe: Optional[Callable[[List[Tuple[Any, ...]], float], None]] = None) -> None:
+        self.target: Callable[..., Any] = target
+        self.job_args: Tuple[Any, ...] = job_args
+        self.batch_size: int = batch_size
+        self.initializer: Optional[Callable[..., None]] = initializer
+        self.initargs: Tuple[Any, ...] = initargs
+        self.log: Logger = getLogger(log_name)
+        self.log_name: str = log_name
+        self.max_queued: int = max_queued
+        self.observe: Optional[Callable[[List[Tuple[Any, ...]], float], None]] = observe
+        self.queues: List[Queue] = []
+        self.workers: List[AffinityWorker] = []
+        self.batches: List[List[Tuple[Any, ...]]] = []
+        self.batch_messages: List[int] = []
+        self.batch_starts: List[float] = []
+        self.ring: HashRing = HashRing(processes)
+        # Held over the ring, workers and batches, add_workers is called from the metrics server thread
+        self.lock: Lock = Lock()
+        with self.lock:
+            for _ in range(processes):
+                self._add_worker()
+
+    def _add_worker(self) -> None:
+        """Start a worker, called with the lock held, the worker is appended last since
+        the number of workers is the number of batches and queues the ring can route to
+
+        """
+        index: int = len(self.workers)
+        self.queues.append(Queue(self.max_queued))
+        self.batches.append([])
+        self.batch_messages.append(0)
+        self.batch_starts.append(0.0)
+        worker: AffinityWorker = AffinityWorker(index, self.queues[index], self.target, self.initializer,
+                                                self.initargs, self.log_name)
+        worker.start()
+        self.workers.append(worker)
+
+    def add_workers(self, count: int) -> int:
+        """Start more workers and rebalance the ring, about count / total of the devices move to the new
+        workers and every other device stays on its worker
+
+        :param count: Number of workers to add
+        :type count: int
+        :return: The number of workers afterwards
+        """
+        with self.lock:
+            for _ in range(count):
+                self._add_worker()
+            self.ring.resize(len(self.workers))
+            self.log.info(f"Rebalanced devices across {len(self.workers)} affinity workers")
+            return len(self.workers)
+
+    def route(self, frame: Tuple[Any, ...]) -> None:
+        """Add a frame or framed batch to the batch of the worker of its device, queueing the batch once it is full
+
+        :param frame: A frame or framed batch taken off the data queue
+        :type frame: Tuple[Any, ...]
+
+        """
+        with self.lock:
+            index: int = self.ring.node(frame[4])
+            if not self.batches[index]:
+                self.batch_starts[index] = perf_counter()
+            self.batches[index].append(frame)
+            self.batch_messages[index] += frame_count(frame)
+            ready: bool = self.batch_messages[index] >= self.batch_size
+        if ready:
+            self._submit(index)
+
+    def flush(self, max_age: float = 0.0) -> None:
+        """Queue every batch whose first message is at least max_age seconds old"""
+        now: float = perf_counter()
+        with self.lock:
+            due: List[int] = [index for index in range(len(self.workers))
+                              if self.batches[index] and now - self.batch_starts[index] >= max_age]
+        for index in due:
+            self._submit(index)
+
+    def _submit(self, index: int) -> None:
+        with self.lock:
+            batch: List[Tuple[Any, ...]] = self.batches[index]
+            batch_start: float = self.batch_starts[index]
+            self.batches[index] = []
+            self.batch_messages[index] = 0
+            if not self.workers[index].is_alive():
+                self.log.error(f"{self.workers[index].name} died, restarting it")
+                self.workers[index] = AffinityWorker(index, self.queues[index], self.target, self.initializer,
+                                                     self.initargs, self.log_name)
+                self.workers[index].start()
+            queue: Queue = self.queues[index]
+        if not batch:
+            return
+        if self.observe is not None:
+            self.observe(batch, batch_start)
+        queue.put((batch, *self.job_args))
+
+    def __enter__(self) -> "AffinityPool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.terminate()
+
+    def pids(self) -> List[int]:
+        with self.lock:
+            return [worker.pid for worker in self.workers]
+
+    def close(self) -> None:
+        """Queue the remaining batches and tell every worker to exit once its queue is empty"""
+        self.flush()
+        for queue in self.queues:
+            queue.put(None)
+
+    def join(self) -> None:
+        for worker in self.workers:
+            worker.join()
+
+    def terminate(self) -> None:
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
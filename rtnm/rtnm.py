@@ -6,47 +6,181 @@
 """
 from argparse import ArgumentParser
 from copy import deepcopy
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Union, Tuple, Optional
-from multiprocessing import Pool, Queue
+from collections import deque
+from typing import List, Dict, Union, Tuple, Optional, Callable, Deque, Any
+from multiprocessing import Pool, Queue, Process
+from multiprocessing.pool import AsyncResult
 from queue import Empty
+from threading import Event
 from logging import getLogger, Logger
 
 from parsers.ElasticSearchParser import ParsedResponse
 from parsers.Parsers import RTNMParser
 from loggers.loggers import init_logs
 from databases.databases import InfluxdbUploader
+from databases.executors import AsyncUploadExecutor, UploadJob
 from errors.errors import IODefinedError
-from connectors.DialInClients import DialInClient, TLSDialInClient
+from connectors.DialInClients import DialInClient, TLSDialInClient, ConnectScheduler, DeviceGroup
 from utils.utils import generate_clients
+from metrics.metrics import (
+    REGISTRY,
+    MESSAGES_RECEIVED,
+    BYTES_RECEIVED,
+    QUEUE_DEPTH,
+    IN_FLIGHT_BATCHES,
+    BATCH_WAIT,
+    BATCH_SIZE,
+    STAGE_LATENCY,
+    MetricsServer,
+    init_metrics,
+    observe_upload_lag
+)
+from capture.capture import CaptureWriter, CaptureReplayer
+from cache.cache import DeviceMetadataCache
+from backpressure.backpressure import FrameQueue, POLICIES, BLOCK
+from framing.framing import frame_count, unpack_frames
+from routing.routing import AffinityPool
+from supervisor.supervisor import Supervisor
+from profiling.profiling import CPROFILE, MODE_SIGNALS, init_profiler, poll_profiler, trigger_profile
 from datetime import datetime
+from time import perf_counter
 
 import os
 import gc
 
+upload_queue: Optional[Queue] = None
 
-def process_and_upload_data(batch_list: List[Tuple[str, str, Optional[str], Optional[str]]],
+
+def init_worker(queue: Optional[Queue], metrics_queue: Optional[Queue], log_path: Path, log_name: str) -> None:
+    """Initialize a worker pool process with the queue of the upload executor and metrics server
+
+    :param queue: The queue the upload executor reads jobs from, None to upload from the worker
+    :type queue: Optional[Queue]
+    :param metrics_queue: The queue the metrics server reads from, None if metrics aren't exported
+    :type metrics_queue: Optional[Queue]
+    :param log_path: The directory profiles are written to
+    :type log_path: Path
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+    global upload_queue
+    upload_queue = queue
+    init_metrics(metrics_queue)
+    init_profiler("worker", log_path, log_name)
+
+
+def process_and_upload_data(batch_list: List[Tuple[str, bytes, Optional[str], Optional[str], str, float]],
                             log_name: str, tsdb_args: Dict[str, str]):
     """Process the raw responses from gRPC/gNMI client and upload to a TSDB
 
-    :param batch_list: The raw responses from either Cisco gRPC or gNMI clients or from both.
-    :type batch_list: List[Tuple[str, str, Optional[str], Optional[str]]]
+    :param batch_list: The raw responses from either Cisco gRPC or gNMI clients or from both,
+                       with the address of the device and the time they arrived
+    :type batch_list: List[Tuple[str, bytes, Optional[str], Optional[str], str, float]]
     :param log_name: Name of the logger used in RTNM to acquire
     :type log_name: str
     :param tsdb_args: The arguments of the TSDB (username, port, password, etc.)
     :type tsdb_args: Dict[str, str]
 
     """
+    poll_profiler()
     start = datetime.now()
     processor_log: Logger = getLogger(log_name)
     processor_log.debug("Creating Uploader and parser")
     parser = RTNMParser(batch_list, log_name)
     pr: List[ParsedResponse] = parser.decode_and_parse_raw_responses()
-    uploader = InfluxdbUploader("2.2.2.54", "8086", log_name)
-    uploader.upload(pr)
+    uploader = InfluxdbUploader(tsdb_args["address"], tsdb_args["port"], log_name,
+                                compression_level=tsdb_args.get("compression-level", 9), name=tsdb_args["name"])
+    encode_start: float = perf_counter()
+    body: bytes = uploader.prepare_data(uploader.encode(pr))
+    encode_end: float = perf_counter()
+    STAGE_LATENCY.observe(encode_end - encode_start, stage="encode")
+    if upload_queue is None:
+        uploader.post_body(body)
+        STAGE_LATENCY.observe(perf_counter() - encode_end, stage="upload")
+        observe_upload_lag(parser.arrivals)
+    else:
+        upload_queue.put(UploadJob(tsdb_args["name"], uploader.write_url, body, uploader.headers, parser.arrivals))
     end = datetime.now()
     total_time = end - start
     processor_log.info(f"Total Batch time took {total_time}")
+    REGISTRY.flush()
+    poll_profiler()
+
+
+def observe_batch(batch_list: List[Tuple[str, str, Optional[str], Optional[str], str]], batch_start: float,
+                  data_queue: FrameQueue) -> None:
+    """Record the metrics of a batch the dispatcher is handing to the worker pool
+
+    :param batch_list: The batch being dispatched
+    :type batch_list: List[Tuple[str, str, Optional[str], Optional[str], str]]
+    :param batch_start: perf_counter() of when the first message of the batch was received
+    :type batch_start: float
+    :param data_queue: The queue the dial in clients put messages on
+    :type data_queue: FrameQueue
+
+    """
+    BATCH_WAIT.observe(perf_counter() - batch_start)
+    BATCH_SIZE.observe(sum(frame_count(frame) for frame in batch_list))
+    try:
+        QUEUE_DEPTH.set(data_queue.qsize())
+    except NotImplementedError:
+        pass
+    data_queue.export_metrics()
+
+
+def reap_batches(in_flight: Deque[AsyncResult], max_in_flight: int, log_name: str) -> None:
+    """Forget batches the worker pool finished, logging the ones that failed, and wait for the
+    oldest while max_in_flight batches are still running
+
+    :param in_flight: Results of the dispatched batches, oldest first
+    :type in_flight: Deque[AsyncResult]
+    :param max_in_flight: Batches allowed in the worker pool at once
+    :type max_in_flight: int
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+    while in_flight and (in_flight[0].ready() or len(in_flight) >= max_in_flight):
+        result: AsyncResult = in_flight.popleft()
+        try:
+            result.get()
+        except Exception as error:
+            getLogger(log_name).error(f"Batch failed: {error}")
+    IN_FLIGHT_BATCHES.set(len(in_flight))
+
+
+def dispatch_batch(worker_pool: Pool, batch_list: List[Tuple[str, bytes, Optional[str], Optional[str], str, float]],
+                   batch_start: float, data_queue: FrameQueue, log_name: str, output: Dict[str, str],
+                   in_flight: Deque[AsyncResult], max_in_flight: int) -> None:
+    """Hand a copy of a batch to the worker pool and clear it, waiting first if max_in_flight
+    batches are already in the pool so a slow TSDB backs up into the data queue
+
+    :param worker_pool: The pool processing and uploading batches
+    :type worker_pool: Pool
+    :param batch_list: The batch to dispatch, cleared afterwards
+    :type batch_list: List[Tuple[str, bytes, Optional[str], Optional[str], str, float]]
+    :param batch_start: perf_counter() of when the first message of the batch was received
+    :type batch_start: float
+    :param data_queue: The queue the dial in clients put messages on
+    :type data_queue: FrameQueue
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+    :param output: The arguments of the TSDB
+    :type output: Dict[str, str]
+    :param in_flight: Results of the dispatched batches, oldest first
+    :type in_flight: Deque[AsyncResult]
+    :param max_in_flight: Batches allowed in the worker pool at once
+    :type max_in_flight: int
+
+    """
+    observe_batch(batch_list, batch_start, data_queue)
+    reap_batches(in_flight, max_in_flight, log_name)
+    in_flight.append(worker_pool.apply_async(process_and_upload_data, (deepcopy(batch_list), log_name, output)))
+    IN_FLIGHT_BATCHES.set(len(in_flight))
+    batch_list.clear()
 
 
 def cleanup(log: Queue) -> None:
@@ -64,6 +198,45 @@ def worker_callback(rc):
     del rc
 
 
+def profile_route(pids: Dict[str, Callable[[], List[int]]]) -> Callable[[Dict[str, List[str]]], Tuple[int, str]]:
+    """Create the handler of the /profile path of the metrics server, which signals the processes
+    of a target to profile themselves, for example /profile?target=workers&seconds=30&mode=sample
+
+    :param pids: Functions returning the pids of each target, keyed by target name
+    :type pids: Dict[str, Callable[[], List[int]]]
+
+    """
+    def handle_profile(query: Dict[str, List[str]]) -> Tuple[int, str]:
+        target: str = query.get("target", ["dispatcher"])[0]
+        mode: str = query.get("mode", [CPROFILE])[0]
+        if target not in pids or mode not in MODE_SIGNALS:
+            return 400, f"Unknown target or mode, targets are {', '.join(pids)} and modes are {', '.join(MODE_SIGNALS)}\n"
+        seconds: float = float(query.get("seconds", ["30"])[0])
+        target_pids: List[int] = pids[target]()
+        trigger_profile(target_pids, mode, seconds)
+        return 200, f"Profiling {target} ({', '.join(str(pid) for pid in target_pids)}) with {mode} for {seconds}s\n"
+    return handle_profile
+
+
+def workers_route(pool: AffinityPool) -> Callable[[Dict[str, List[str]]], Tuple[int, str]]:
+    """Create the handler of the /workers path of the metrics server, which starts more affinity
+    workers and rebalances the devices across them, for example /workers?add=2
+
+    :param pool: The affinity worker pool
+    :type pool: AffinityPool
+
+    """
+    def handle_workers(query: Dict[str, List[str]]) -> Tuple[int, str]:
+        try:
+            count: int = int(query.get("add", ["0"])[0])
+        except ValueError:
+            return 400, "add must be a number of workers\n"
+        if count > 0:
+            return 200, f"Rebalanced devices across {pool.add_workers(count)} workers\n"
+        return 200, f"{len(pool.workers)} workers\n"
+    return handle_workers
+
+
 def main():
     """RTNM main function used for getting the users arguements and spawns processes for each
     connection and handles dispatching of responses into a worker pool for processing
@@ -78,68 +251,236 @@ def main():
                         help="Number of workers in the worker pool used for uploading")
     parser.add_argument("-v", "--verbose", dest="debug", help="Enable debugging", action="store_true")
     parser.add_argument("-r", "--retry", dest="retry", help="Enable retrying", action="store_true")
+    parser.add_argument("-a", "--async-upload", dest="async_upload", action="store_true",
+                        help="Upload from an asyncio executor instead of from the worker pool")
+    parser.add_argument("-m", "--metrics-port", dest="metrics_port", type=int,
+                        help="Port to serve internal metrics on in the Prometheus text format")
+    parser.add_argument("--connect-rate", dest="connect_rate", type=float, default=20.0,
+                        help="Device connection setups started per second across all inputs, 0 for no limit")
+    parser.add_argument("--connect-burst", dest="connect_burst", type=int, default=20,
+                        help="Device connection setups that can start back to back")
+    parser.add_argument("--max-connecting", dest="max_connecting", type=int, default=50,
+                        help="Device connection setups in progress at once, 0 for no limit")
+    parser.add_argument("--metadata-cache", dest="metadata_cache", type=Path, default=Path("metadata-cache"),
+                        help="Directory caching the hostname and version of every device across restarts")
+    parser.add_argument("--metadata-ttl", dest="metadata_ttl", type=float, default=86400.0,
+                        help="Seconds before cached device metadata is refreshed in the background")
+    parser.add_argument("--source-batch-frames", dest="source_batch_frames", type=int, default=100,
+                        help="Messages a dial in client packs into one framed batch for the dispatcher, 1 to disable")
+    parser.add_argument("--source-batch-bytes", dest="source_batch_bytes", type=int, default=1048576,
+                        help="Bytes of messages a dial in client packs into one framed batch")
+    parser.add_argument("--source-batch-delay", dest="source_batch_delay", type=float, default=0.05,
+                        help="Seconds a message waits in a framed batch of a dial in client before it is sent")
+    parser.add_argument("--queue-bytes", dest="queue_bytes", type=int, default=268435456,
+                        help="Bytes of payloads the data queue holds before the backpressure policy applies")
+    parser.add_argument("--backpressure", dest="backpressure", choices=POLICIES, default=BLOCK,
+                        help="What inputs do when the data queue is full, block slows down reading from the devices")
+    parser.add_argument("--spill-dir", dest="spill_dir", type=Path, default=Path("spill"),
+                        help="Directory the spill policy writes frames to")
+    parser.add_argument("--max-in-flight", dest="max_in_flight", type=int,
+                        help="Batches dispatched to the worker pool at once, defaults to twice the pool size")
+    parser.add_argument("--affinity", dest="affinity", action="store_true",
+                        help="Send the batches of a device to the same worker every time instead of any free worker")
+    parser.add_argument("--separate-channels", dest="separate_channels", action="store_true",
+                        help="Give every input its own connection instead of sharing one per device")
+    parser.add_argument("--max-restarts", dest="max_restarts", type=int, default=0,
+                        help="Restarts of the input of a device before it is left down, 0 for no limit")
+    parser.add_argument("--record", dest="record", type=Path,
+                        help="Directory to record every raw frame entering the pipeline to")
+    parser.add_argument("--record-max-bytes", dest="record_max_bytes", type=int, default=268435456,
+                        help="Size of a capture file before rotating to a new one")
+    parser.add_argument("--record-files", dest="record_files", type=int, default=10,
+                        help="Number of capture files to keep, 0 to keep all of them")
+    parser.add_argument("--replay", dest="replay", type=Path,
+                        help="Capture file or directory to replay instead of connecting to the configured inputs")
+    parser.add_argument("--replay-speed", dest="replay_speed", type=float, default=1.0,
+                        help="Multiple of the captured rate to replay at, 0 for as fast as possible")
+    parser.add_argument("--replay-loop", dest="replay_loop", type=int, default=1,
+                        help="Number of times to replay the capture")
     args = parser.parse_args()
     try:
-        inputs, outputs = generate_clients(args.config)
+        inputs, outputs = generate_clients(args.config, require_input=args.replay is None)
     except IODefinedError:
         parser.error("Need to define both an input and output in the configuraiton")
     except KeyError as error:
         parser.error(f"Error in the configuration file: No key for {error}.\nCan't parse the config file")
     except Exception as error:
         parser.error(f"Error {error}")
-    output: Dict[str, str] = outputs[next(iter(outputs))]
+    output_name: str = next(iter(outputs))
+    output: Dict[str, str] = outputs[output_name]
+    output["name"] = output_name
     path: Path = Path().absolute() / "logs"
     log_queue: Queue = Queue()
     log_name: str = f"rtnm-{args.config.strip('ini').strip('.')}"
     log_listener, rtnm_log = init_logs(log_name, path, log_queue, args.debug)
+    init_profiler("dispatcher", path, log_name)
+    max_in_flight: int = args.max_in_flight or 2 * (args.worker_pool_size or os.cpu_count())
+    profile_targets: Dict[str, Callable[[], List[int]]] = {"dispatcher": lambda: [os.getpid()]}
+    client_factories: List[Tuple[str, Callable[[], Process], bool]] = []
+    recorder: Optional[CaptureWriter] = None
+    upload_executor: Optional[AsyncUploadExecutor] = None
+    executor_queue: Optional[Queue] = None
+    metrics_server: Optional[MetricsServer] = None
+    metrics_queue: Optional[Queue] = None
+    supervisor: Optional[Supervisor] = None
+    metrics_routes: Dict[str, Callable[[Dict[str, List[str]]], Tuple[int, str]]] = {
+        "/profile": profile_route(profile_targets)}
     try:
-        rtnm_log.logger.info("Creating worker pool")
-        with Pool(processes=args.worker_pool_size) as worker_pool:
-            client_conns: List[Union[DialInClient, TLSDialInClient]] = []
-            data_queue: Queue = Queue()
+        if args.metrics_port:
+            rtnm_log.logger.info(f"Serving metrics on port {args.metrics_port}")
+            metrics_queue = Queue()
+            metrics_server = MetricsServer(metrics_queue, args.metrics_port, routes=metrics_routes)
+            metrics_server.start()
+        if args.async_upload:
+            rtnm_log.logger.info("Starting upload executor")
+            executor_queue = Queue(max_in_flight)
+            upload_executor = AsyncUploadExecutor(executor_queue, log_name, {output_name: output}, metrics_queue)
+            upload_executor.start()
+        data_queue: FrameQueue = FrameQueue(args.queue_bytes, args.backpressure, args.spill_dir, log_name)
+        worker_pool: Union[Pool, AffinityPool]
+        affinity_pool: Optional[AffinityPool] = None
+        if args.affinity:
+            rtnm_log.logger.info("Creating affinity workers")
+            workers: int = args.worker_pool_size or os.cpu_count()
+            worker_pool = affinity_pool = AffinityPool(
+                workers, process_and_upload_data, (log_name, output), args.batch_size, init_worker,
+                (executor_queue, metrics_queue, path, log_name), log_name, max(1, max_in_flight // workers),
+                lambda batch, start: observe_batch(batch, start, data_queue))
+            profile_targets["workers"] = affinity_pool.pids
+            metrics_routes["/workers"] = workers_route(affinity_pool)
+        else:
+            rtnm_log.logger.info("Creating worker pool")
+            worker_pool = Pool(processes=args.worker_pool_size, initializer=init_worker,
+                               initargs=(executor_queue, metrics_queue, path, log_name))
+            profile_targets["workers"] = lambda: [worker.pid for worker in worker_pool._pool]
+        with worker_pool:
+            in_flight: Deque[AsyncResult] = deque()
+            connect_scheduler: ConnectScheduler = ConnectScheduler(args.connect_rate, args.connect_burst,
+                                                                   args.max_connecting)
+            metadata_cache: DeviceMetadataCache = DeviceMetadataCache(args.metadata_cache, args.metadata_ttl, log_name)
             rtnm_log.logger.info("Starting inputs and outputs")
+            if args.record is not None:
+                rtnm_log.logger.info(f"Recording raw frames to {args.record}")
+                recorder = CaptureWriter(args.record, args.record_max_bytes, args.record_files)
+            if args.replay is not None:
+                rtnm_log.logger.info(f"Replaying {args.replay} at {args.replay_speed}x")
+                client_factories.append((f"replay-{args.replay.name}",
+                                         partial(CaptureReplayer, args.replay, data_queue, log_name,
+                                                 args.replay_speed, args.replay_loop), False))
+                inputs = {}
+            # Inputs connecting to the same target with the same channel credentials share a process and channel
+            device_clients: Dict[Tuple[Any, ...], List[Tuple[str, Callable[[], Process]]]] = {}
             for client in inputs:
                 if inputs[client]["io"] == "out":
                     raise NotImplementedError("Dial Out is not implemented")
                 else:
                     inputs[client]["debug"] = args.debug
                     inputs[client]["retry"] = args.retry
+                    inputs[client]["batch_frames"] = args.source_batch_frames
+                    inputs[client]["batch_bytes"] = args.source_batch_bytes
+                    inputs[client]["batch_delay"] = args.source_batch_delay
                     if "pem-file" in inputs[client]:
                         with open(inputs[client]["pem-file"], "rb") as file_desc:
                             pem = file_desc.read()
                         rtnm_log.logger.info(f"Creating TLS Connector for {client}")
-                        client_conns.append(TLSDialInClient(pem, data_queue,
-                                                            log_name, **inputs[client],
-                                                            name=client))
+                        factory: Callable[[], Process] = partial(TLSDialInClient, pem, data_queue,
+                                                                 log_name, inputs[client]["channel-options"],
+                                                                 **inputs[client],
+                                                                 scheduler=connect_scheduler,
+                                                                 metadata_cache=metadata_cache, name=client)
                     else:
                         rtnm_log.logger.info(f"Creating Connector for {client}")
-                        client_conns.append(DialInClient(data_queue,
-                                                         log_name, **inputs[client], name=client))
-            for client in client_conns:
-                rtnm_log.logger.info(f"Starting dial in client [{client.name}]")
-                client.start()
-            batch_list: List[Tuple[str, str, Optional[str], Optional[str], str]] = []
-            while all([client.is_alive() for client in client_conns]):
+                        factory = partial(DialInClient, data_queue,
+                                          log_name, inputs[client]["channel-options"], **inputs[client],
+                                          scheduler=connect_scheduler,
+                                          metadata_cache=metadata_cache, name=client)
+                    device: Tuple[Any, ...] = (inputs[client]["address"], inputs[client]["port"],
+                                               inputs[client].get("pem-file"), inputs[client]["compression"],
+                                               inputs[client]["channel-profile"])
+                    if args.separate_channels:
+                        device = (client,)
+                    device_clients.setdefault(device, []).append((client, factory))
+            for clients in device_clients.values():
+                if len(clients) == 1:
+                    client_factories.append((*clients[0], True))
+                else:
+                    group: str = "+".join(client for client, _ in clients)
+                    rtnm_log.logger.info(f"Sharing one channel between {', '.join(client for client, _ in clients)}")
+                    client_factories.append((group, partial(DeviceGroup, group, [factory for _, factory in clients],
+                                                            log_name), True))
+            inputs_stopped: Event = Event()
+
+            def on_inputs_stopped() -> None:
+                inputs_stopped.set()
+                data_queue.wake()
+
+            supervisor = Supervisor(on_inputs_stopped, args.max_restarts, log_name)
+            supervisor.start()
+            for name, factory, restart in client_factories:
+                rtnm_log.logger.info(f"Starting dial in client [{name}]")
+                supervisor.add(name, factory, restart)
+                profile_targets[name] = lambda name=name: [supervisor.process(name).pid]
+            batch_list: List[Tuple[str, bytes, Optional[str], Optional[str], str, float]] = []
+            batch_messages: int = 0
+            batch_start: float = perf_counter()
+            while not inputs_stopped.is_set():
                 try:
-                    worker_pool._cache = {}
-                    data: Tuple[str, str, Optional[str], Optional[str], str] = data_queue.get(timeout=10)
+                    poll_profiler()
+                    data: Tuple[str, bytes, Optional[str], Optional[str], str, float] = data_queue.get(timeout=10)
                     if data is not None:
+                        if not batch_list:
+                            batch_start = perf_counter()
+                        MESSAGES_RECEIVED.inc(frame_count(data), device=data[4])
+                        BYTES_RECEIVED.inc(len(data[1]), device=data[4])
+                        if recorder is not None:
+                            for frame in unpack_frames(data):
+                                recorder.write_frame(frame)
+                        if affinity_pool is not None:
+                            affinity_pool.route(data)
+                            affinity_pool.flush(10)
+                            continue
                         batch_list.append(data)
-                        if len(batch_list) >= args.batch_size:
+                        batch_messages += frame_count(data)
+                        if batch_messages >= args.batch_size:
                             rtnm_log.logger.debug("Uploading full batch size")
-                            result = worker_pool.apply_async(process_and_upload_data,
-                                                             (deepcopy(batch_list), log_name, output))
-                            del result
-                            batch_list.clear()
+                            dispatch_batch(worker_pool, batch_list, batch_start, data_queue, log_name, output,
+                                           in_flight, max_in_flight)
+                            batch_messages = 0
                 except Empty:
-                    if len(batch_list) != 0:
-                        rtnm_log.logger.debug(f"Uploading data of length {len(batch_list)}")
-                        result = worker_pool.apply_async(process_and_upload_data,
-                                                         (deepcopy(batch_list), log_name, output))
-                        del result
-                        batch_list.clear()
+                    data_queue.export_metrics()
+                    if affinity_pool is not None:
+                        affinity_pool.flush()
+                    elif len(batch_list) != 0:
+                        rtnm_log.logger.debug(f"Uploading data of length {batch_messages}")
+                        dispatch_batch(worker_pool, batch_list, batch_start, data_queue, log_name, output,
+                                       in_flight, max_in_flight)
+                        batch_messages = 0
                 except Exception as error:
                     rtnm_log.logger.error(error)
+            rtnm_log.logger.info("The inputs stopped, draining the data queue and worker pool")
+            try:
+                while True:
+                    data = data_queue.get(timeout=1)
+                    if data is not None:
+                        if recorder is not None:
+                            for frame in unpack_frames(data):
+                                recorder.write_frame(frame)
+                        if affinity_pool is not None:
+                            affinity_pool.route(data)
+                            continue
+                        batch_list.append(data)
+                        batch_messages += frame_count(data)
+                        if batch_messages >= args.batch_size:
+                            dispatch_batch(worker_pool, batch_list, batch_start, data_queue, log_name, output,
+                                           in_flight, max_in_flight)
+                            batch_messages = 0
+            except Empty:
+                if batch_list:
+                    dispatch_batch(worker_pool, batch_list, batch_start, data_queue, log_name, output,
+                                   in_flight, max_in_flight)
+            reap_batches(in_flight, 0, log_name)
+            worker_pool.close()
+            worker_pool.join()
 
     except NotImplementedError as error:
         rtnm_log.logger.error(error)
@@ -149,9 +490,17 @@ def main():
         rtnm_log.logger.error(error)
     finally:
         rtnm_log.logger.info("In cleanup")
+        if supervisor is not None:
+            supervisor.stop()
+            supervisor.terminate()
+        if recorder is not None:
+            recorder.close()
+        if upload_executor is not None:
+            executor_queue.put(None)
+            upload_executor.join()
+        if metrics_server is not None:
+            metrics_server.stop()
         cleanup(log_listener)
-        for client in client_conns:
-            client.terminate()
 
 
 if __name__ == "__main__":
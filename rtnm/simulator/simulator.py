@@ -0,0 +1,364 @@
+"""
+.. module:: simulator
+   :platform: Unix
+   :synopsis: Simulated IOS-XR devices serving gNMI and EMS dial in and dialing out over TCP and gRPC
+              with synthetic interface counters, used to load test RTNM without routers
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+
+Run from the rtnm directory, for example to serve 100 dial in devices on ports 57400-57499
+and write a matching RTNM configuration::
+
+    python -m simulator.simulator dial-in --devices 100 --rate 10 --write-config sim.ini
+
+"""
+import json
+import random
+import socket
+import grpc
+from argparse import ArgumentParser, Namespace
+from concurrent import futures
+from configparser import ConfigParser
+from multiprocessing import Process
+from struct import Struct
+from threading import Event
+from time import time, sleep, monotonic
+from typing import List, Dict, Iterator
+
+from protos.cisco_mdt_dial_in_pb2 import CreateSubsArgs, CreateSubsReply
+from protos.cisco_mdt_dial_in_pb2_grpc import gRPCConfigOperServicer, add_gRPCConfigOperServicer_to_server
+from protos.cisco_mdt_dial_out_pb2 import MdtDialoutArgs
+from protos.cisco_mdt_dial_out_pb2_grpc import gRPCMdtDialoutStub
+from protos.gnmi_pb2 import (
+    CapabilityRequest,
+    CapabilityResponse,
+    Encoding,
+    GetRequest,
+    GetResponse,
+    ModelData,
+    Notification,
+    Path,
+    PathElem,
+    SubscribeRequest,
+    SubscribeResponse,
+    SubscriptionList,
+    TypedValue,
+    Update
+)
+from protos.gnmi_pb2_grpc import gNMIServicer, add_gNMIServicer_to_server
+from protos.telemetry_pb2 import Telemetry, TelemetryField
+
+COUNTER_LEAVES: List[str] = [
+    "in-octets", "in-unicast-pkts", "in-broadcast-pkts", "in-multicast-pkts", "in-discards", "in-errors",
+    "in-unknown-protos", "in-fcs-errors", "out-octets", "out-unicast-pkts", "out-broadcast-pkts",
+    "out-multicast-pkts", "out-discards", "out-errors", "carrier-transitions", "last-clear",
+]
+EMS_ENCODING_PATH: str = "Cisco-IOS-XR-infra-statsd-oper:infra-statistics/interfaces/interface/latest/generic-counters"
+GNMI_ORIGIN: str = "openconfig-interfaces"
+GNMI_PREFIX: List[str] = ["interfaces", "interface", "state", "counters"]
+DIAL_OUT_HEADER: Struct = Struct(">hhhhi")
+
+
+class InterfaceCounterGenerator:
+    """Generate monotonically increasing interface counters of a device as gNMI and EMS messages
+
+    :param hostname: Hostname of the device
+    :type hostname: str
+    :param interfaces: Number of interfaces on the device
+    :type interfaces: int
+    :param counters: Number of counter leaves per interface, leaves past the standard ones are synthetic
+    :type counters: int
+    :param seed: Seed of the counter values so runs are reproducible
+    :type seed: int
+
+    """
+
+    def __init__(self, hostname: str, interfaces: int = 16, counters: int = 16, seed: int = 0) -> None:
+        self.hostname: str = hostname
+        self.interfaces: List[str] = [f"HundredGigE0/0/0/{index}" for index in range(interfaces)]
+        self.leaves: List[str] = (COUNTER_LEAVES + [f"counter-{index}" for index in range(len(COUNTER_LEAVES),
+                                                                                            counters)])[:counters]
+        self.random: random.Random = random.Random(seed)
+        self.values: Dict[str, List[int]] = {
+            interface: [self.random.randint(0, 1 << 40) for _ in self.leaves] for interface in self.interfaces
+        }
+
+    def tick(self) -> None:
+        for values in self.values.values():
+            for index in range(len(values)):
+                values[index] += self.random.randint(0, 1 << 20)
+
+    def gnmi_prefix(self, interface: str) -> Path:
+        prefix_elems: List[PathElem] = [PathElem(name=name) for name in GNMI_PREFIX]
+        prefix_elems[1].key["name"] = interface
+        return Path(origin=GNMI_ORIGIN, elem=prefix_elems)
+
+    def gnmi_aliases(self) -> Iterator[SubscribeResponse]:
+        """Notifications defining an alias for the prefix of every interface"""
+        timestamp: int = int(time() * 1e9)
+        for index, interface in enumerate(self.interfaces):
+            yield SubscribeResponse(update=Notification(timestamp=timestamp, alias=f"#if{index}",
+                                                        prefix=self.gnmi_prefix(interface)))
+
+    def gnmi_responses(self, encoding: int = Encoding.Value("PROTO"),
+                       aliases: bool = False) -> Iterator[SubscribeResponse]:
+        timestamp: int = int(time() * 1e9)
+        for index, (interface, values) in enumerate(self.values.items()):
+            prefix: Path = Path(elem=[PathElem(name=f"#if{index}")]) if aliases else self.gnmi_prefix(interface)
+            notification: Notification = Notification(timestamp=timestamp, prefix=prefix)
+            if encoding == Encoding.Value("JSON_IETF"):
+                counters: Dict[str, int] = dict(zip(self.leaves, values))
+                notification.update.append(Update(path=Path(elem=[PathElem(name="counters")]),
+                                                  val=TypedValue(json_ietf_val=json.dumps(counters).encode())))
+            else:
+                for leaf, value in zip(self.leaves, values):
+                    notification.update.append(Update(path=Path(elem=[PathElem(name=leaf)]),
+                                                      val=TypedValue(uint_val=value)))
+            yield SubscribeResponse(update=notification)
+
+    def ems_message(self, subscription: str = "") -> Telemetry:
+        timestamp: int = int(time() * 1e3)
+        telemetry: Telemetry = Telemetry(node_id_str=self.hostname, subscription_id_str=subscription,
+                                         encoding_path=EMS_ENCODING_PATH, collection_id=int(timestamp),
+                                         collection_start_time=timestamp, msg_timestamp=timestamp,
+                                         collection_end_time=timestamp)
+        for interface, values in self.values.items():
+            keys: TelemetryField = TelemetryField(name="keys",
+                                                  fields=[TelemetryField(name="interface-name",
+                                                                         string_value=interface)])
+            content: TelemetryField = TelemetryField(name="content",
+                                                     fields=[TelemetryField(name=leaf, uint64_value=value)
+                                                             for leaf, value in zip(self.leaves, values)])
+            telemetry.data_gpbkv.append(TelemetryField(timestamp=timestamp, fields=[keys, content]))
+        return telemetry
+
+
+class SimulatedGNMIServicer(gNMIServicer):
+    """gNMI service of a simulated device, answering the Gets RTNM uses for the hostname and version
+
+    :param generator: The counter generator of the device
+    :type generator: InterfaceCounterGenerator
+    :param version: Software version reported by the device
+    :type version: str
+    :param rate: Rounds of counters per second, 0 to use the sample interval of the subscription
+    :type rate: float
+
+    """
+
+    def __init__(self, generator: InterfaceCounterGenerator, version: str, rate: float) -> None:
+        self.generator: InterfaceCounterGenerator = generator
+        self.version: str = version
+        self.rate: float = rate
+
+    def Capabilities(self, request: CapabilityRequest, context) -> CapabilityResponse:
+        return CapabilityResponse(
+            supported_models=[ModelData(name=GNMI_ORIGIN, organization="OpenConfig working group", version="2.4.3")],
+            supported_encodings=[Encoding.Value("JSON_IETF"), Encoding.Value("ASCII"), Encoding.Value("PROTO")],
+            gNMI_version="0.7.0")
+
+    def Get(self, request: GetRequest, context) -> GetResponse:
+        response: GetResponse = GetResponse()
+        for path in request.path:
+            name: str = path.elem[0].name if path.elem else ""
+            if name == "Cisco-IOS-XR-shellutil-cfg:host-names":
+                value: Dict = {"host-name": self.generator.hostname}
+            elif name == "openconfig-platform:components":
+                value = {"component": [{"name": "Rack 0", "state": {"type": "CHASSIS"}},
+                                       {"name": "0/RP0/CPU0", "state": {"software-version": self.version}}]}
+            else:
+                context.abort(grpc.StatusCode.NOT_FOUND, f"Simulator has no data for {name}")
+            response.notification.append(Notification(
+                timestamp=int(time() * 1e9),
+                update=[Update(path=path, val=TypedValue(json_ietf_val=json.dumps(value).encode()))]))
+        return response
+
+    def _round(self, subscribe: SubscriptionList) -> Iterator[SubscribeResponse]:
+        self.generator.tick()
+        yield from self.generator.gnmi_responses(subscribe.encoding, subscribe.use_aliases)
+
+    def Subscribe(self, request_iterator: Iterator[SubscribeRequest], context) -> Iterator[SubscribeResponse]:
+        subscribe: SubscriptionList = next(request_iterator).subscribe
+        interval: float = 1 / self.rate if self.rate else max(
+            [subscription.sample_interval for subscription in subscribe.subscription] + [1]) / 1e9
+        if subscribe.use_aliases:
+            yield from self.generator.gnmi_aliases()
+        yield from self._round(subscribe)
+        yield SubscribeResponse(sync_response=True)
+        if subscribe.mode == SubscriptionList.Mode.Value("ONCE"):
+            return
+        if subscribe.mode == SubscriptionList.Mode.Value("POLL"):
+            for request in request_iterator:
+                if request.HasField("poll"):
+                    yield from self._round(subscribe)
+                    yield SubscribeResponse(sync_response=True)
+            return
+        next_round: float = monotonic() + interval
+        while context.is_active():
+            delay: float = next_round - monotonic()
+            if delay > 0:
+                sleep(delay)
+            next_round += interval
+            yield from self._round(subscribe)
+
+
+class SimulatedEMSServicer(gRPCConfigOperServicer):
+    """Cisco EMS service of a simulated device streaming interface counters from CreateSubs
+
+    :param generator: The counter generator of the device
+    :type generator: InterfaceCounterGenerator
+    :param rate: Messages per second
+    :type rate: float
+
+    """
+
+    def __init__(self, generator: InterfaceCounterGenerator, rate: float) -> None:
+        self.generator: InterfaceCounterGenerator = generator
+        self.rate: float = rate or 1.0
+
+    def CreateSubs(self, request: CreateSubsArgs, context) -> Iterator[CreateSubsReply]:
+        subscription: str = ",".join(request.Subscriptions)
+        interval: float = 1 / self.rate
+        next_message: float = monotonic()
+        while context.is_active():
+            delay: float = next_message - monotonic()
+            if delay > 0:
+                sleep(delay)
+            next_message += interval
+            self.generator.tick()
+            yield CreateSubsReply(ResReqId=request.ReqId,
+                                  data=self.generator.ems_message(subscription).SerializeToString())
+
+
+def serve_dial_in(generators: List[InterfaceCounterGenerator], ports: List[int], version: str, rate: float,
+                  workers: int) -> None:
+    """Serve gNMI and EMS for every simulated device on its own port until interrupted"""
+    servers: List[grpc.Server] = []
+    for generator, port in zip(generators, ports):
+        server: grpc.Server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers))
+        add_gNMIServicer_to_server(SimulatedGNMIServicer(generator, version, rate), server)
+        add_gRPCConfigOperServicer_to_server(SimulatedEMSServicer(generator, rate), server)
+        server.add_insecure_port(f"[::]:{port}")
+        server.start()
+        servers.append(server)
+    print(f"Serving {len(servers)} simulated devices on ports {ports[0]}-{ports[-1]}")
+    try:
+        Event().wait()
+    finally:
+        for server in servers:
+            server.stop(0)
+
+
+def _paced(rate: float, generator: InterfaceCounterGenerator, stop: Event) -> Iterator[Telemetry]:
+    interval: float = 1 / (rate or 1.0)
+    next_message: float = monotonic()
+    while not stop.is_set():
+        delay: float = next_message - monotonic()
+        if delay > 0:
+            sleep(delay)
+        next_message += interval
+        generator.tick()
+        yield generator.ems_message()
+
+
+def dial_out_tcp(generator: InterfaceCounterGenerator, address: str, port: int, rate: float, stop: Event) -> None:
+    """Dial out to a TCP collector and stream framed EMS messages"""
+    with socket.create_connection((address, port)) as connection:
+        for telemetry in _paced(rate, generator, stop):
+            data: bytes = telemetry.SerializeToString()
+            connection.sendall(DIAL_OUT_HEADER.pack(1, 1, 1, 0, len(data)) + data)
+
+
+def dial_out_grpc(generator: InterfaceCounterGenerator, address: str, port: int, rate: float, stop: Event) -> None:
+    """Dial out to a gRPC MdtDialout collector and stream EMS messages"""
+    with grpc.insecure_channel(f"{address}:{port}") as channel:
+        stub: gRPCMdtDialoutStub = gRPCMdtDialoutStub(channel)
+        requests: Iterator[MdtDialoutArgs] = (MdtDialoutArgs(ReqId=index, data=telemetry.SerializeToString())
+                                              for index, telemetry in enumerate(_paced(rate, generator, stop)))
+        for _ in stub.MdtDialout(requests):
+            pass
+
+
+def run_devices(args: Namespace, indexes: List[int]) -> None:
+    generators: List[InterfaceCounterGenerator] = [
+        InterfaceCounterGenerator(f"{args.hostname_prefix}-{index}", args.interfaces, args.counters, args.seed + index)
+        for index in indexes
+    ]
+    if args.mode == "dial-in":
+        serve_dial_in(generators, [args.port + index for index in indexes], args.version, args.rate, args.workers)
+        return
+    dial_out = dial_out_tcp if args.mode == "dial-out-tcp" else dial_out_grpc
+    stop: Event = Event()
+    with futures.ThreadPoolExecutor(max_workers=len(generators)) as executor:
+        tasks = [executor.submit(dial_out, generator, args.address, args.port, args.rate, stop)
+                 for generator in generators]
+        try:
+            for task in futures.as_completed(tasks):
+                task.result()
+        finally:
+            stop.set()
+
+
+def write_config(file_name: str, args: Namespace) -> None:
+    """Write an RTNM configuration with one input per simulated dial in device
+
+    :param file_name: The configuration file to write
+    :type file_name: str
+    :param args: The arguments of the simulator
+    :type args: Namespace
+
+    """
+    config: ConfigParser = ConfigParser()
+    for index in range(args.devices):
+        section: Dict[str, str] = {
+            "io": "input", "dial": "in", "address": args.address, "port": str(args.port + index),
+            "username": "simulator", "password": "simulator", "compression": "False",
+        }
+        if args.format == "gnmi":
+            section.update({"format": "gnmi", "encoding": "auto", "sensors": f"{GNMI_ORIGIN}:interfaces",
+                            "sample-interval": "10", "subscription-mode": "SAMPLE", "stream-mode": "STREAM"})
+        else:
+            section.update({"format": "cisco-ems", "encoding": "self-describing-gpb", "subscriptions": "simulator"})
+        config[f"{args.hostname_prefix}-{index}"] = section
+    config["output"] = {"io": "output", "address": args.output_address, "port": str(args.output_port)}
+    with open(file_name, "w") as config_file:
+        config.write(config_file)
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Simulate IOS-XR devices streaming interface counters")
+    parser.add_argument("mode", choices=["dial-in", "dial-out-tcp", "dial-out-grpc"])
+    parser.add_argument("-d", "--devices", dest="devices", type=int, default=1, help="Number of simulated devices")
+    parser.add_argument("-a", "--address", dest="address", default="127.0.0.1",
+                        help="Address the devices listen on, or the collector to dial out to")
+    parser.add_argument("-p", "--port", dest="port", type=int, default=57400,
+                        help="First port of the dial in devices, or the port of the collector to dial out to")
+    parser.add_argument("-r", "--rate", dest="rate", type=float, default=1.0,
+                        help="Rounds of counters per second per device, 0 uses the sample interval for gNMI")
+    parser.add_argument("-i", "--interfaces", dest="interfaces", type=int, default=16,
+                        help="Interfaces per device, EMS messages carry all of them")
+    parser.add_argument("-n", "--counters", dest="counters", type=int, default=16, help="Counter leaves per interface")
+    parser.add_argument("--version", dest="version", default="7.3.1", help="Software version reported by devices")
+    parser.add_argument("--hostname-prefix", dest="hostname_prefix", default="sim")
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    parser.add_argument("--processes", dest="processes", type=int, default=1,
+                        help="Processes to spread the devices across")
+    parser.add_argument("--workers", dest="workers", type=int, default=4, help="gRPC threads per dial in device")
+    parser.add_argument("--write-config", dest="write_config", help="Write an RTNM configuration for the devices")
+    parser.add_argument("--format", dest="format", choices=["gnmi", "cisco-ems"], default="gnmi",
+                        help="Input format used in the written configuration")
+    parser.add_argument("--output-address", dest="output_address", default="127.0.0.1")
+    parser.add_argument("--output-port", dest="output_port", type=int, default=8086)
+    args = parser.parse_args()
+    if args.write_config:
+        write_config(args.write_config, args)
+    device_indexes: List[List[int]] = [list(range(args.devices))[start::args.processes]
+                                       for start in range(args.processes)]
+    processes: List[Process] = [Process(target=run_devices, args=(args, indexes))
+                                for indexes in device_indexes if indexes]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+.. module:: supervisor
+   :platform: Unix, Windows
+   :synopsis: Restart the input of a device that exited with backoff while the rest of the pipeline keeps running
+.. moduleauthor:: Greg Brown <gsb5067@gmail.com>
+"""
+import random
+from logging import Logger, getLogger
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait, Connection
+from threading import Thread, Event, Lock
+from time import monotonic
+from typing import Dict, List, Callable, Any, Optional
+
+from metrics.metrics import INPUT_UP, INPUT_RESTARTS
+
+
+class ProcessWatcher(Thread):
+    """Thread blocked on the sentinels of the watched processes that calls on_exit with every process
+    as soon as it exits, so the cost of watching doesn't grow with the number of processes
+
+    :param on_exit: Called from the watcher thread with every watched process that exited
+    :type on_exit: Callable[[Process], None]
+
+    """
+
+    def __init__(self, on_exit: Callable[[Process], None]) -> None:
+        super().__init__(name="process-watcher", daemon=True)
+        self.on_exit: Callable[[Process], None] = on_exit
+        self.processes: Dict[Any, Process] = {}
+        self.lock: Lock = Lock()
+        self.stopped: Event = Event()
+        self.wake_reader, self.wake_writer = Pipe(duplex=False)
+        self.woken: bool = False
+
+    def _wake(self) -> None:
+        """Wake the watcher thread to wait on the current processes, at most one wake is pending in the pipe so
+        watching thousands of processes before the thread runs doesn't fill the pipe and block"""
+        with self.lock:
+            if self.woken:
+                return
+            self.woken = True
+            self.wake_writer.send(None)
+
+    def watch(self, process: Process) -> None:
+        """Watch a started process"""
+        with self.lock:
+            self.processes[process.sentinel] = process
+        self._wake()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            with self.lock:
+                handles: List[Any] = [*self.processes, self.wake_reader]
+            for handle in wait(handles):
+                if isinstance(handle, Connection):
+                    with self.lock:
+                        handle.recv()
+                        self.woken = False
+                    continue
+                with self.lock:
+                    process: Process = self.processes.pop(handle, None)
+                if process is not None:
+                    process.join()
+                    self.on_exit(process)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self._wake()
+
+
+class SupervisedInput:
+    """State of an input process the supervisor restarts
+
+    :param name: Name of the input in the configuration
+    :type name: str
+    :param factory: Creates a new, not yet started, process of the input
+    :type factory: Callable[[], Process]
+    :param restart: Restart the input when it exits, False stops the pipeline instead
+    :type restart: bool
+
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Process], restart: bool) -> None:
+        self.name: str = name
+        self.factory: Callable[[], Process] = factory
+        self.restart: bool = restart
+        self.process: Optional[Process] = None
+        self.started: float = 0.0
+        self.restarts: int = 0
+        self.backoff: float = 0.0
+        self.restart_at: Optional[float] = None
+        self.failed: bool = False
+
+    def is_up(self) -> bool:
+        """True while the process runs and, for a dial in client, streams from its device"""
+        if self.process is None or self.restart_at is not None or self.failed:
+            return False
+        connected = getattr(self.process, "connected", None)
+        return connected is None or bool(connected.value)
+
+
+class Supervisor:
+    """Start the inputs and restart only the input that exited, waiting a decorrelated jitter backoff
+    that resets once the input ran for HEALTHY_SECONDS, the dispatcher, worker pool and outputs keep running
+
+    on_stop is called when an input that isn't restarted exits, for example a replay that finished,
+    or when every restarted input gave up after max_restarts
+
+    :param on_stop: Called from the watcher thread when the pipeline should stop
+    :type on_stop: Callable[[], None]
+    :param max_restarts: Restarts of an input before it is left down, 0 restarts it forever
+    :type max_restarts: int
+    :param log_name: Name of the logger used in RTNM to acquire
+    :type log_name: str
+
+    """
+    MIN_BACKOFF_SECONDS: float = 1.0
+    MAX_BACKOFF_SECONDS: float = 300.0
+    HEALTHY_SECONDS: float = 60.0
+
+    def __init__(self, on_stop: Callable[[], None], max_restarts: int = 0, log_name: str = "") -> None:
+        self.on_stop: Callable[[], None] = on_stop
+        self.max_restarts: int = max_restarts
+        self.log: Logger = getLogger(log_name)
+        self.inputs: Dict[str, SupervisedInput] = {}
+        self.lock: Lock = Lock()
+        self.stopped: Event = Event()
+        self.watcher: ProcessWatcher = ProcessWatcher(self._exited)
+        self.monitor: Thread = Thread(target=self._monitor, name="supervisor", daemon=True)
+
+    def add(self, name: str, factory: Callable[[], Process], restart: bool = True) -> Process:
+        """Start an input and supervise it
+
+        :param name: Name of the input in the configuration
+        :type name: str
+        :param factory: Creates a new, not yet started, process of the input
+        :type factory: Callable[[], Process]
+        :param restart: Restart the input when it exits, False stops the pipeline instead
+        :type restart: bool
+        :return: The started process
+        """
+        supervised: SupervisedInput = SupervisedInput(name, factory, restart)
+        with self.lock:
+            self.inputs[name] = supervised
+            self._start(supervised)
+        return supervised.process
+
+    def _start(self, supervised: SupervisedInput) -> None:
+        supervised.process = supervised.factory()
+        supervised.process.start()
+        supervised.started = monotonic()
+        supervised.restart_at = None
+        self.watcher.watch(supervised.process)
+
+    def start(self) -> None:
+        self.watcher.start()
+        self.monitor.start()
+
+    def _exited(self, process: Process) -> None:
+        stop: bool = False
+        with self.lock:
+            supervised: Optional[SupervisedInput] = next(
+                (supervised for supervised in self.inputs.values() if supervised.process is process), None)
+            if supervised is None or self.stopped.is_set():
+                return
+            INPUT_UP.set(0, input=supervised.name)
+            if not supervised.restart:
+                self.log.info(f"Input [{supervised.name}] exited with code {process.exitcode}")
+                stop = True
+            elif self.max_restarts and supervised.restarts >= self.max_restarts:
+                self.log.error(f"Input [{supervised.name}] exited with code {process.exitcode}, "
+                               f"giving up after {supervised.restarts} restarts")
+                supervised.failed = True
+                stop = all(other.failed for other in self.inputs.values() if other.restart)
+            else:
+                if supervised.backoff == 0 or monotonic() - supervised.started >= self.HEALTHY_SECONDS:
+                    supervised.backoff = self.MIN_BACKOFF_SECONDS
+                else:
+                    supervised.backoff = min(self.MAX_BACKOFF_SECONDS,
+                                             random.uniform(self.MIN_BACKOFF_SECONDS, supervised.backoff * 3))
+                supervised.restart_at = monotonic() + supervised.backoff
+                self.log.error(f"Input [{supervised.name}] exited with code {process.exitcode}, "
+                               f"restarting it in {supervised.backoff:.1f}s")
+        if stop:
+            self.on_stop()
+
+    def _monitor(self) -> None:
+        """Restart inputs whose backoff passed and export the state of every input once a second"""
+        while not self.stopped.wait(1):
+            now: float = monotonic()
+            with self.lock:
+                for supervised in self.inputs.values():
+                    if supervised.restart_at is not None and now >= supervised.restart_at:
+                        supervised.restarts += 1
+                        INPUT_RESTARTS.inc(input=supervised.name)
+                        try:
+                            self._start(supervised)
+                        except Exception as error:
+                            self.log.error(f"Unable to restart input [{supervised.name}]: {error}")
+                            supervised.restart_at = now + supervised.backoff
+                    INPUT_UP.set(int(supervised.is_up()), input=supervised.name)
+
+    def process(self, name: str) -> Optional[Process]:
+        return self.inputs[name].process
+
+    def processes(self) -> List[Process]:
+        with self.lock:
+            return [supervised.process for supervised in self.inputs.values() if supervised.process is not None]
+
+    def stop(self) -> None:
+        """Stop restarting inputs, the processes keep running until terminate"""
+        self.stopped.set()
+        self.watcher.stop()
+
+    def terminate(self) -> None:
+        for process in self.processes():
+            process.terminate()
@@ -1,9 +1,7 @@
-import sys
-from datetime import datetime
 from distutils.util import strtobool
 import re
-from typing import Tuple, Dict, Any, List
-from configparser import ConfigParser
+from typing import Tuple, Dict, Any, List, Optional, Callable
+from configparser import ConfigParser, SectionProxy
 from protos.gnmi_pb2 import (
     PathElem,
     Path,
@@ -12,9 +10,80 @@ from protos.gnmi_pb2 import (
     SubscriptionList
 )
 from errors.errors import IODefinedError
+from interning.interning import PATHS, TODAY
+from channels.channels import DEFAULT_CHANNEL_OPTIONS, channel_options
 
+# Paths of counters change every sample, suppressing redundant samples of them only costs the device CPU
+COUNTER_PATH: re.Pattern = re.compile(r"counters|statistics|stats|rate|utilization", re.IGNORECASE)
 
-def generate_clients(in_file: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+
+def per_sensor(section: SectionProxy, key: str, sensors: int, convert: Callable[[str], Any]) -> Optional[List[Any]]:
+    """The values of an optional per sensor option, given once for every sensor or once per sensor
+
+    :param section: The section of the input
+    :type section: SectionProxy
+    :param key: The option
+    :type key: str
+    :param sensors: The number of sensors of the input
+    :type sensors: int
+    :param convert: Converts every comma separated value
+    :type convert: Callable[[str], Any]
+    :raises: ValueError
+
+    """
+    if key not in section:
+        return None
+    values: List[Any] = [convert(x.strip()) for x in section[key].split(",")]
+    if len(values) == 1:
+        values *= sensors
+    if len(values) != sensors:
+        raise ValueError(f"{section.name} needs one {key} or one per sensor")
+    return values
+
+
+def sensor_options(path: str, mode: int, sample_interval: int, suppress_redundant: Optional[bool] = None,
+                   heartbeat_interval: Optional[int] = None) -> Dict[str, Any]:
+    """Subscription options of a sensor, defaults for the options that aren't configured:
+
+    * ON_CHANGE and TARGET_DEFINED sensors send a heartbeat every 10 sample intervals so their
+      last seen time stays fresh while nothing changes
+    * TARGET_DEFINED sensors suppress redundant samples unless they are counters
+
+    :param path: The sensor path
+    :type path: str
+    :param mode: The SubscriptionMode of the sensor
+    :type mode: int
+    :param sample_interval: Nanoseconds between samples
+    :type sample_interval: int
+    :param suppress_redundant: Only send sampled leaves that changed
+    :type suppress_redundant: Optional[bool]
+    :param heartbeat_interval: Nanoseconds after which unchanged leaves are sent anyway, 0 for never
+    :type heartbeat_interval: Optional[int]
+
+    """
+    event_driven: bool = mode in (SubscriptionMode.Value("ON_CHANGE"), SubscriptionMode.Value("TARGET_DEFINED"))
+    if heartbeat_interval is None:
+        heartbeat_interval = 10 * sample_interval if event_driven else 0
+    if suppress_redundant is None:
+        suppress_redundant = mode == SubscriptionMode.Value("TARGET_DEFINED") and not COUNTER_PATH.search(path)
+    return {"mode": mode, "suppress_redundant": suppress_redundant, "heartbeat_interval": heartbeat_interval}
+
+
+def channel_profiles(config: ConfigParser) -> Dict[str, List[Tuple[str, Any]]]:
+    """The gRPC channel options of every profile, sections with io = channel-profile, and of the default profile
+
+    :param config: The configuration
+    :type config: ConfigParser
+
+    """
+    profiles: Dict[str, List[Tuple[str, Any]]] = {"default": list(DEFAULT_CHANNEL_OPTIONS)}
+    for section in config.sections():
+        if config[section]["io"] == "channel-profile":
+            profiles[section] = channel_options(config[section])
+    return profiles
+
+
+def generate_clients(in_file: str, require_input: bool = True) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     config: ConfigParser = ConfigParser()
     config.read(in_file)
     input_defined: List[bool] = []
@@ -22,13 +91,16 @@ def generate_clients(in_file: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     for section in config.sections():
         input_defined.append(config[section]["io"] == "input")
         output_defined.append(config[section]["io"] == "output")
-    io_defined = any(input_defined) and any(output_defined)
+    io_defined = (any(input_defined) or not require_input) and any(output_defined)
     if not io_defined:
         raise IODefinedError
     else:
         input_clients: Dict[str, Dict[str, Any]] = {}
         output_clients: Dict[str, Dict[str, Any]] = {}
+        profiles: Dict[str, List[Tuple[str, Any]]] = channel_profiles(config)
         for section in config.sections():
+            if config[section]["io"] == "channel-profile":
+                continue
             if config[section]["io"] == "input":
                 input_clients[section] = {}
                 if config[section]["dial"] == "in":
@@ -38,6 +110,11 @@ def generate_clients(in_file: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
                     input_clients[section]["username"] = config[section]["username"]
                     input_clients[section]["password"] = config[section]["password"]
                     input_clients[section]["compression"] = bool(strtobool(config[section]["compression"]))
+                    profile: str = config[section].get("channel-profile", "default")
+                    if profile not in profiles:
+                        raise ValueError(f"Input {section} uses the undefined channel profile {profile}")
+                    input_clients[section]["channel-profile"] = profile
+                    input_clients[section]["channel-options"] = profiles[profile]
                     if config[section]["format"] == "gnmi":
                         input_clients[section]["format"] = "gnmi"
                         input_clients[section]["sensors"] = [
@@ -46,9 +123,40 @@ def generate_clients(in_file: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
                         input_clients[section]["sample-interval"] = int(config[section]["sample-interval"]) * 1000000000
                         input_clients[section]["subscription-mode"] = SubscriptionMode.Value(
                             config[section]["subscription-mode"])
-                        input_clients[section]["encoding"] = Encoding.Value(config[section]["encoding"])
+                        sensors: List[str] = input_clients[section]["sensors"]
+                        modes: List[int] = per_sensor(config[section], "subscription-modes", len(sensors),
+                                                      SubscriptionMode.Value) or [
+                            input_clients[section]["subscription-mode"]] * len(sensors)
+                        suppress: List[Optional[bool]] = per_sensor(
+                            config[section], "suppress-redundant", len(sensors),
+                            lambda value: bool(strtobool(value))) or [None] * len(sensors)
+                        heartbeats: List[Optional[int]] = per_sensor(
+                            config[section], "heartbeat-interval", len(sensors),
+                            lambda value: int(float(value) * 1000000000)) or [None] * len(sensors)
+                        input_clients[section]["sensor-options"] = {
+                            sensor: sensor_options(sensor, mode, input_clients[section]["sample-interval"],
+                                                   suppress_redundant, heartbeat_interval)
+                            for sensor, mode, suppress_redundant, heartbeat_interval
+                            in zip(sensors, modes, suppress, heartbeats)
+                        }
+                        input_clients[section]["updates-only"] = bool(strtobool(
+                            config[section].get("updates-only", "false")))
+                        input_clients[section]["use-aliases"] = bool(strtobool(
+                            config[section].get("use-aliases", "false")))
+                        # auto picks the cheapest encoding the device advertises in its capabilities
+                        encoding: str = config[section].get("encoding", "auto")
+                        input_clients[section]["encoding"] = None if encoding == "auto" else Encoding.Value(encoding)
                         input_clients[section]["stream-mode"] = SubscriptionList.Mode.Value(
                             config[section]["stream-mode"])
+                        input_clients[section]["poll-intervals"] = per_sensor(config[section], "poll-intervals",
+                                                                              len(sensors), float)
+                        if input_clients[section]["stream-mode"] == SubscriptionList.Mode.Value("POLL"):
+                            # Sensors without a poll interval are polled every sample-interval
+                            intervals: List[float] = input_clients[section]["poll-intervals"] or [
+                                input_clients[section]["sample-interval"] / 1000000000] * len(sensors)
+                            if any(interval <= 0 for interval in intervals):
+                                raise ValueError(f"Input {section} polls in POLL mode and needs poll-intervals, or "
+                                                 f"a sample-interval, greater than 0")
                     else:
                         input_clients[section]["format"] = "cisco-ems"
                         # Valid encode values- gpb:2, self-describing-gpb:3, json:4
@@ -68,6 +176,23 @@ def generate_clients(in_file: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
                 output_clients[section] = {}
                 output_clients[section]["address"] = config[section]["address"]
                 output_clients[section]["port"] = config[section]["port"]
+                if "dead-letter-file" in config[section]:
+                    output_clients[section]["dead-letter-file"] = config[section]["dead-letter-file"]
+                if "bulk-retries" in config[section]:
+                    output_clients[section]["bulk-retries"] = int(config[section]["bulk-retries"])
+                if "compression-level" in config[section]:
+                    level: str = config[section]["compression-level"]
+                    output_clients[section]["compression-level"] = 0 if level == "none" else int(level)
+                if "in-flight" in config[section]:
+                    output_clients[section]["in-flight"] = int(config[section]["in-flight"])
+                if "rate-limit" in config[section]:
+                    output_clients[section]["rate-limit"] = float(config[section]["rate-limit"])
+                if "upload-retries" in config[section]:
+                    output_clients[section]["upload-retries"] = int(config[section]["upload-retries"])
+                if "breaker-failures" in config[section]:
+                    output_clients[section]["breaker-failures"] = int(config[section]["breaker-failures"])
+                if "breaker-reset" in config[section]:
+                    output_clients[section]["breaker-reset"] = float(config[section]["breaker-reset"])
         return input_clients, output_clients
 
 
@@ -92,17 +217,8 @@ def create_gnmi_path(path: str) -> Path:
 
 
 def get_date() -> str:
-    now: datetime = datetime.now()
-    month: str = f"{now.month:02d}"
-    day: str = f"{now.day:02d}"
-    return ".".join([str(now.year), month, day])
+    return TODAY()
 
 
 def yang_path_to_es_index(name: str, encoding: str):
-    index: str = (name.replace("/", "-").lower().replace(":", "-").replace("[", "-").replace("]", "").replace('"', ""))
-    date: str = get_date()
-    size_of_date: int = sys.getsizeof(date)
-    size_of_encoding: int = sys.getsizeof(encoding)
-    while sys.getsizeof(index) + size_of_date + size_of_encoding > 255:
-        index = "-".join(index.split("-")[:-1])
-    return f"{index}-{encoding}-{get_date()}"
+    return f"{PATHS.rendered(name).es_stem(encoding)}-{TODAY()}"
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules import each other relative to the rtnm directory like rtnm.py does
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent / "rtnm"))
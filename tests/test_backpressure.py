@@ -0,0 +1,93 @@
+from queue import Empty
+from threading import Thread
+from time import monotonic
+
+import pytest
+
+from backpressure.backpressure import FrameQueue, BLOCK, DROP_OLDEST, SPILL
+
+
+def frame(payload: bytes, arrival: float = 1.0):
+    return "gnmi", payload, "router-1", "7.3.1", "10.0.0.1", arrival
+
+
+def drain(queue: FrameQueue):
+    frames = []
+    while True:
+        try:
+            frames.append(queue.get(timeout=0.05))
+        except Empty:
+            return frames
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        FrameQueue(100, "drop-newest")
+
+
+def test_block_puts_and_gets():
+    queue = FrameQueue(100, BLOCK)
+    queue.put(frame(b"a" * 10))
+    assert queue.queued_bytes.value == 10
+    assert queue.get(timeout=1)[1] == b"a" * 10
+    assert queue.queued_bytes.value == 0
+
+
+def test_frame_larger_than_the_queue_is_let_through_when_empty():
+    queue = FrameQueue(10, BLOCK)
+    queue.put(frame(b"a" * 50))
+    assert queue.get(timeout=1)[1] == b"a" * 50
+
+
+def test_drop_oldest():
+    queue = FrameQueue(30, DROP_OLDEST)
+    for index in range(5):
+        queue.put(frame(b"%09d" % index))
+    assert [payload for _, payload, *_ in drain(queue)] == [b"%09d" % index for index in range(2, 5)]
+    assert queue.dropped_frames.value == 2
+    assert queue.dropped_bytes.value == 18
+
+
+def test_drop_oldest_keeps_the_wake():
+    queue = FrameQueue(30, DROP_OLDEST)
+    queue.wake()
+    for index in range(5):
+        queue.put(frame(b"%09d" % index))
+    received = drain(queue)
+    assert None in received
+    assert [frame[1] for frame in received if frame is not None][-1] == b"%09d" % 4
+
+
+def test_spill_from_concurrent_threads(tmp_path):
+    queue = FrameQueue(100, SPILL, tmp_path)
+    threads = [Thread(target=lambda thread=thread: [queue.put(frame(b"%d-%03d" % (thread, index)))
+                                                    for index in range(200)]) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    received = drain(queue)
+    assert queue.spilled_frames.value > 0
+    # Spilled frames are queued again, in order, by the puts and the drainer once there is room
+    while queue._spill_writer is not None or queue._spill_files or queue._spill_reader is not None:
+        queue.put(frame(b"x"))
+        received.extend(drain(queue))
+    payloads = [payload for _, payload, *_ in received if payload != b"x"]
+    assert sorted(payloads) == sorted(b"%d-%03d" % (thread, index) for thread in range(4) for index in range(200))
+    for thread in range(4):
+        own = [payload for payload in payloads if payload.startswith(b"%d-" % thread)]
+        assert own == sorted(own)
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
+
+
+def test_spill_drains_after_the_input_stops(tmp_path):
+    queue = FrameQueue(100, SPILL, tmp_path)
+    for index in range(100):
+        queue.put(frame(b"%09d" % index))
+    assert queue.spilled_frames.value > 0
+    received = []
+    deadline = monotonic() + 10
+    while (len(received) < 100 or queue._drainer is not None) and monotonic() < deadline:
+        received.extend(drain(queue))
+    assert [payload for _, payload, *_ in received] == [b"%09d" % index for index in range(100)]
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
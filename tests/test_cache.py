@@ -0,0 +1,42 @@
+from cache.cache import DeviceMetadataCache
+
+
+def test_store_and_load(tmp_path):
+    cache = DeviceMetadataCache(tmp_path)
+    cache.store("10.0.0.1:57400", "router-1", "7.3.1", "abc", ["PROTO", "JSON_IETF"])
+    entry = cache.load("10.0.0.1:57400")
+    assert entry["hostname"] == "router-1"
+    assert entry["version"] == "7.3.1"
+    assert entry["encodings"] == ["PROTO", "JSON_IETF"]
+    assert not cache.is_stale(entry)
+
+
+def test_missing_entry(tmp_path):
+    assert DeviceMetadataCache(tmp_path).load("10.0.0.1:57400") is None
+
+
+def test_unreadable_entry(tmp_path):
+    cache = DeviceMetadataCache(tmp_path)
+    (tmp_path / "10.0.0.1_57400.json").write_text("{not json")
+    assert cache.load("10.0.0.1:57400") is None
+
+
+def test_two_inputs_to_the_same_device(tmp_path):
+    cache = DeviceMetadataCache(tmp_path)
+    # The gNMI input knows the hostname, the cisco-ems input to the same device doesn't
+    cache.store("10.0.0.1:57400", "router-1", "7.3.1", "abc", ["PROTO"])
+    cache.store("10.0.0.1:57400", "", "7.3.1", "abc", [])
+    entry = cache.load("10.0.0.1:57400")
+    assert entry["hostname"] == "router-1"
+    assert entry["encodings"] == ["PROTO"]
+    cache.store("10.0.0.1:57400", None, "7.4.1", "def")
+    entry = cache.load("10.0.0.1:57400")
+    assert entry["hostname"] == "router-1"
+    assert entry["version"] == "7.4.1"
+    assert entry["capabilities"] == "def"
+
+
+def test_stale(tmp_path):
+    cache = DeviceMetadataCache(tmp_path, ttl=-1)
+    cache.store("10.0.0.1:57400", "router-1", "7.3.1", "abc")
+    assert cache.is_stale(cache.load("10.0.0.1:57400"))
@@ -0,0 +1,52 @@
+import pytest
+
+from channels.channels import DEFAULT_CHANNEL_OPTIONS, ChannelRegistry, channel_options
+
+
+class FakeChannel:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_default_profile():
+    assert channel_options({"io": "channel-profile"}) == DEFAULT_CHANNEL_OPTIONS
+
+
+def test_profile_settings_are_converted():
+    options = dict(channel_options({"max-receive-message-size": "-1", "keepalive-time": "30",
+                                    "bdp-probe": "false", "grpc.http2.min_time_between_pings_ms": "10000",
+                                    "grpc.primary_user_agent": "rtnm"}))
+    assert options["grpc.max_receive_message_length"] == -1
+    assert options["grpc.keepalive_time_ms"] == 30000
+    assert options["grpc.keepalive_timeout_ms"] == 10000
+    assert options["grpc.http2.bdp_probe"] == 0
+    assert options["grpc.http2.min_time_between_pings_ms"] == 10000
+    assert options["grpc.primary_user_agent"] == "rtnm"
+
+
+def test_unknown_setting():
+    with pytest.raises(ValueError):
+        channel_options({"max-message-size": "1"})
+
+
+def test_channel_is_shared_until_released():
+    registry = ChannelRegistry()
+    created = []
+
+    def create():
+        created.append(FakeChannel())
+        return created[-1]
+
+    first = registry.acquire(("10.0.0.1", "57400"), create)
+    second = registry.acquire(("10.0.0.1", "57400"), create)
+    other = registry.acquire(("10.0.0.2", "57400"), create)
+    assert first is second is created[0]
+    assert other is created[1]
+    registry.release(("10.0.0.1", "57400"))
+    assert not first.closed
+    registry.release(("10.0.0.1", "57400"))
+    assert first.closed
+    assert registry.acquire(("10.0.0.1", "57400"), create) is created[2]
@@ -0,0 +1,59 @@
+from queue import Queue
+
+import pytest
+
+DialInClients = pytest.importorskip("connectors.DialInClients")
+from backpressure.backpressure import FrameQueue  # noqa: E402
+from protos.gnmi_pb2 import Encoding, SubscriptionList, SubscriptionMode  # noqa: E402
+
+
+def gnmi_client(tmp_path, encoding=None):
+    return DialInClients.DialInClient(
+        FrameQueue(1024, spill_path=tmp_path), "test", name="router-1", address="10.0.0.1", port="57400",
+        username="admin", password="admin", format="gnmi", encoding=encoding, debug=False, retry=False,
+        compression=False, sensors=["openconfig-interfaces:interfaces"],
+        **{"subscription-mode": SubscriptionMode.Value("SAMPLE"), "sample-interval": 10000000000,
+           "stream-mode": SubscriptionList.Mode.Value("STREAM")})
+
+
+def test_encoding_falls_back_to_json_ietf_without_capabilities(tmp_path):
+    client = gnmi_client(tmp_path)
+
+    def capabilities():
+        raise RuntimeError("Capabilities is not implemented")
+    client._get_capabilities = capabilities
+    client._get_hostname = lambda: "router-1"
+    client._get_version = lambda: "7.3.1"
+    client._fetch_metadata()
+    assert (client.hostname, client.version) == ("router-1", "7.3.1")
+    assert client._select_encoding() == Encoding.Value("JSON_IETF")
+
+
+class FlakyClient:
+    def __init__(self, name, failures, retry=True):
+        self.name = name
+        self.failures = failures
+        self.retry = retry
+        self.served = 0
+        self.backoffs = 0
+
+    def serve(self):
+        self.served += 1
+        if self.served <= self.failures:
+            raise RuntimeError("stream reset")
+
+    def _backoff(self):
+        self.backoffs += 1
+
+
+def test_group_restarts_a_failed_client_until_it_gives_up():
+    group = DialInClients.DeviceGroup("router-1", [], "test")
+    stopped = Queue()
+    flaky = FlakyClient("flaky", failures=2)
+    group._serve(flaky, stopped)
+    assert (flaky.served, flaky.backoffs) == (3, 2)
+    assert stopped.get_nowait() == "flaky"
+    without_retry = FlakyClient("without-retry", failures=5, retry=False)
+    group._serve(without_retry, stopped)
+    assert (without_retry.served, without_retry.backoffs) == (1, 0)
+    assert stopped.get_nowait() == "without-retry"
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+databases = pytest.importorskip("databases.databases")
+
+
+def bulk_item(index: int):
+    return json.dumps({"index": {"_index": "interfaces"}}), json.dumps({"counter": index})
+
+
+def test_bulk_backoff_delay_bounds():
+    for attempt in range(1, 20):
+        delay = databases.bulk_backoff_delay(attempt, 0.5, 30.0)
+        assert 0.5 <= delay <= 30.0
+    assert databases.bulk_backoff_delay(1, 0.5, 30.0) <= 1.0
+
+
+def test_split_bulk_items_without_errors():
+    items = [bulk_item(index) for index in range(3)]
+    assert databases.split_bulk_items(items, {"errors": False, "items": []}) == ([], [])
+
+
+def test_split_bulk_items():
+    items = [bulk_item(index) for index in range(4)]
+    response = {"errors": True, "items": [
+        {"index": {"status": 201}},
+        {"index": {"status": 429, "error": {"type": "too_many_requests"}}},
+        {"index": {"status": 400, "error": {"type": "mapper_parsing_exception"}}},
+        {"index": {"status": 503, "error": {"type": "es_rejected_execution_exception"}}},
+    ]}
+    retry_items, failed_items = databases.split_bulk_items(items, response)
+    assert retry_items == [items[1], items[3]]
+    assert failed_items == [(*items[2], {"type": "mapper_parsing_exception"})]
+
+
+def test_write_dead_letters(tmp_path):
+    dead_letter_file = tmp_path / "logs" / "dead-letter.ndjson"
+    action, document = bulk_item(1)
+    databases.write_dead_letters(str(dead_letter_file), [(action, document, {"type": "max_retries_exceeded"})])
+    databases.write_dead_letters(str(dead_letter_file), [(action, document, {"type": "mapper_parsing_exception"})])
+    lines = [json.loads(line) for line in dead_letter_file.read_text().splitlines()]
+    assert [line["error"]["type"] for line in lines] == ["max_retries_exceeded", "mapper_parsing_exception"]
+    assert lines[0]["document"] == {"counter": 1}
+
+
+def test_uploader_from_output(tmp_path):
+    output = {"address": "127.0.0.1", "port": "9200", "dead-letter-file": str(tmp_path / "dead.ndjson"),
+              "bulk-retries": 2, "compression-level": 0}
+    uploader = databases.ElasticSearchUploader.from_output("elasticsearch-server-1", output, "test")
+    assert uploader.dead_letter_file == str(tmp_path / "dead.ndjson")
+    assert uploader.max_retries == 2
+    assert uploader.compression_level == 0
+    assert uploader.name == "elasticsearch-server-1"
+
+
+def test_streaming_compressor_gzips_the_lines():
+    import gzip
+    lines = [f"interfaces,device=router-1 counter={index}i\n" for index in range(1000)]
+    compressor = databases.StreamingCompressor(databases.compressor_template(6))
+    body = compressor.compress(iter(lines))
+    assert gzip.decompress(body).decode() == "".join(lines)
+    assert compressor.bytes_in == len("".join(lines))
+    assert compressor.bytes_out == len(body)
+    assert compressor.ratio > 1
+    assert compressor.cpu_time >= 0
+
+
+def test_streaming_compressor_without_compression():
+    compressor = databases.StreamingCompressor(databases.compressor_template(0))
+    assert compressor.compress(["a\n", "b\n"]) == b"a\nb\n"
+    assert compressor.ratio == 1.0
+
+
+def test_compressor_template_is_shared():
+    assert databases.compressor_template(9) is databases.compressor_template(9)
+    assert databases.compressor_template(9) is not databases.compressor_template(1)
+    first = databases.StreamingCompressor(databases.compressor_template(9)).compress(["a\n"])
+    second = databases.StreamingCompressor(databases.compressor_template(9)).compress(["a\n"])
+    assert first == second
@@ -0,0 +1,85 @@
+import pytest
+
+from flattening.flattening import LIST_KEYS, flatten, is_subtree, list_keys, register_list_keys
+
+
+@pytest.fixture(autouse=True)
+def clear_list_keys():
+    LIST_KEYS.clear()
+    yield
+    LIST_KEYS.clear()
+
+
+def test_is_subtree():
+    assert is_subtree({"name": "Gi0"})
+    assert is_subtree([{"name": "Gi0"}])
+    assert not is_subtree([1, 2])
+    assert not is_subtree([])
+    assert not is_subtree("up")
+
+
+def test_openconfig_list_keys_are_the_scalars_next_to_containers():
+    interfaces = {"openconfig-interfaces:interface": [
+        {"name": "Gi0", "config": {"name": "Gi0", "mtu": 1500}, "state": {"counters": {"in-octets": "10"}}},
+        {"name": "Gi1", "config": {"name": "Gi1", "mtu": 9000}, "state": {"counters": {"in-octets": "20"}}},
+    ]}
+    rows = flatten(interfaces, "openconfig:interfaces", {})
+    assert rows == [
+        ("openconfig:interfaces/interface/config", {"name": "Gi0"}, {"name": "Gi0", "mtu": 1500}),
+        ("openconfig:interfaces/interface/state/counters", {"name": "Gi0"}, {"in-octets": "10"}),
+        ("openconfig:interfaces/interface/config", {"name": "Gi1"}, {"name": "Gi1", "mtu": 9000}),
+        ("openconfig:interfaces/interface/state/counters", {"name": "Gi1"}, {"in-octets": "20"}),
+    ]
+
+
+def test_only_key_like_members_are_inferred():
+    entries = [{"name": "peer-1", "local-address": "10.0.0.1", "route-index": 4, "state": "up"}]
+    rows = flatten(entries, "native:bgp/neighbor", {})
+    assert rows == [("native:bgp/neighbor", {"name": "peer-1", "route-index": 4},
+                     {"local-address": "10.0.0.1", "state": "up"})]
+
+
+def test_ios_xr_native_list_keeps_the_leaves_of_its_entries():
+    interfaces = {"Cisco-IOS-XR-pfi-im-cmd-oper:interface-xr": {"interface": [
+        {"interface-name": "GigabitEthernet0/0/0/0", "state": "im-state-up", "mtu": 1514, "bandwidth": 1000000,
+         "mac-address": {"address": "52:54:00:ab:cd:ef"}},
+        {"interface-name": "GigabitEthernet0/0/0/1", "state": "im-state-down", "mtu": 9000, "bandwidth": 1000000,
+         "mac-address": {"address": "52:54:00:ab:cd:f0"}},
+    ]}}
+    rows = flatten(interfaces, "Cisco-IOS-XR-pfi-im-cmd-oper:interfaces", {})
+    assert rows == [
+        ("Cisco-IOS-XR-pfi-im-cmd-oper:interfaces/interface-xr/interface/mac-address",
+         {"interface-name": "GigabitEthernet0/0/0/0"}, {"address": "52:54:00:ab:cd:ef"}),
+        ("Cisco-IOS-XR-pfi-im-cmd-oper:interfaces/interface-xr/interface",
+         {"interface-name": "GigabitEthernet0/0/0/0"}, {"state": "im-state-up", "mtu": 1514, "bandwidth": 1000000}),
+        ("Cisco-IOS-XR-pfi-im-cmd-oper:interfaces/interface-xr/interface/mac-address",
+         {"interface-name": "GigabitEthernet0/0/0/1"}, {"address": "52:54:00:ab:cd:f0"}),
+        ("Cisco-IOS-XR-pfi-im-cmd-oper:interfaces/interface-xr/interface",
+         {"interface-name": "GigabitEthernet0/0/0/1"}, {"state": "im-state-down", "mtu": 9000, "bandwidth": 1000000}),
+    ]
+
+
+def test_keys_are_stable_across_entries():
+    # The first entry alone would make description a key
+    entries = [{"name": "Gi0", "description": "uplink", "config": {"mtu": 1500}},
+               {"name": "Gi1", "config": {"mtu": 9000}}]
+    assert list_keys("openconfig:interfaces/interface", entries) == ("name",)
+    rows = flatten(entries, "openconfig:interfaces/interface", {})
+    assert [row_keys for _, row_keys, _ in rows] == [{"name": "Gi0"}, {"name": "Gi0"}, {"name": "Gi1"}]
+
+
+def test_keys_of_path_elements_win():
+    register_list_keys("openconfig:network-instances/network-instance/protocols/protocol",
+                       {"identifier": "BGP", "name": "default"})
+    entries = [{"identifier": "BGP", "name": "default", "enabled": True}]
+    rows = flatten(entries, "openconfig:network-instances/network-instance/protocols/protocol",
+                   {"name": "vrf-1"})
+    assert rows == [("openconfig:network-instances/network-instance/protocols/protocol",
+                     {"name": "vrf-1", "identifier": "BGP", "protocol-name": "default"}, {"enabled": True})]
+
+
+def test_empty_leaf_and_module_prefixes():
+    rows = flatten({"openconfig-interfaces:config": {"openconfig-vlan:tpid": "TPID_0X8100", "loopback": [None]}},
+                   "openconfig:interfaces/interface", {"name": "Gi0"})
+    assert rows == [("openconfig:interfaces/interface/config", {"name": "Gi0"},
+                     {"tpid": "TPID_0X8100", "loopback": True})]
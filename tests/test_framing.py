@@ -0,0 +1,59 @@
+from framing.framing import FrameBatcher, frame_count, unpack_batch, unpack_frames
+
+
+class ListQueue(list):
+    def put(self, item) -> None:
+        self.append(item)
+
+
+def test_unpack_a_single_frame():
+    frame = ("gnmi", b"payload", "router-1", "7.3.1", "10.0.0.1", 1.0)
+    assert list(unpack_frames(frame)) == [frame]
+    assert frame_count(frame) == 1
+
+
+def test_batch_round_trip():
+    queue = ListQueue()
+    batcher = FrameBatcher(queue, "ems", "10.0.0.1", max_frames=3)
+    for index in range(3):
+        batcher.add(b"message-%d" % index, None, "7.3.1", 100.0 + index)
+    assert len(queue) == 1
+    assert frame_count(queue[0]) == 3
+    assert list(unpack_batch(queue)) == [("ems", b"message-%d" % index, None, "7.3.1", "10.0.0.1", 100.0 + index)
+                                         for index in range(3)]
+
+
+def test_batch_is_sent_when_the_device_metadata_changes():
+    queue = ListQueue()
+    batcher = FrameBatcher(queue, "gnmi", "10.0.0.1", max_frames=10)
+    batcher.add(b"a", "router-1", "7.3.1", 1.0)
+    batcher.add(b"b", "router-1", "7.4.1", 2.0)
+    batcher.flush()
+    assert [frame[3] for frame in queue] == ["7.3.1", "7.4.1"]
+
+
+def test_batch_is_sent_at_max_bytes():
+    queue = ListQueue()
+    batcher = FrameBatcher(queue, "gnmi", "10.0.0.1", max_frames=100, max_bytes=64)
+    for _ in range(4):
+        batcher.add(b"x" * 30, None, None, 1.0)
+    assert [frame_count(frame) for frame in queue] == [2, 2]
+
+
+def test_stop_sends_the_partial_batch():
+    queue = ListQueue()
+    batcher = FrameBatcher(queue, "gnmi", "10.0.0.1", max_frames=10, max_delay=60.0)
+    batcher.start()
+    batcher.add(b"a", None, None, 1.0)
+    batcher.add(b"b", None, None, 2.0)
+    assert not queue
+    batcher.stop()
+    batcher.flusher.join(1)
+    assert not batcher.flusher.is_alive()
+    assert [payload for _, payload, *_ in unpack_batch(queue)] == [b"a", b"b"]
+
+
+def test_unbatched_frames_are_put_as_is():
+    queue = ListQueue()
+    FrameBatcher(queue, "gnmi", "10.0.0.1", max_frames=1).add(b"a", "router-1", None, 1.0)
+    assert queue == [("gnmi", b"a", "router-1", None, "10.0.0.1", 1.0)]
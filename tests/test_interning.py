@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from interning.interning import DailyDate, PathTable, es_index_stem
+
+
+def test_paths_are_interned():
+    table = PathTable()
+    path = table.gnmi("openconfig", ("interfaces", "interface", "state"))
+    assert path.yang_path == "openconfig:interfaces/interface/state"
+    assert table.gnmi("openconfig", ("interfaces", "interface", "state")) is path
+    assert path.key == ("openconfig", ("interfaces", "interface", "state"))
+    ems = table.ems("Cisco-IOS-XR-infra-statsd-oper:infra-statistics/interfaces", "/latest/generic-counters")
+    assert ems.yang_path == "Cisco-IOS-XR-infra-statsd-oper:infra-statistics/interfaces/latest/generic-counters"
+    assert ems is not path
+    assert table.rendered(ems.yang_path) is table.rendered(ems.yang_path) is not ems
+
+
+def test_table_is_cleared_at_max_paths():
+    table = PathTable(max_paths=2)
+    first = table.gnmi("", ("a",))
+    table.gnmi("", ("b",))
+    third = table.gnmi("", ("c",))
+    assert list(table.paths.values()) == [third]
+    assert table.gnmi("", ("a",)) is not first
+
+
+def test_es_index_stem():
+    assert es_index_stem("Cisco-IOS-XR-infra-statsd-oper:infra-statistics/interfaces", "gnmi") == \
+        "cisco-ios-xr-infra-statsd-oper-infra-statistics-interfaces-gnmi"
+    long_stem = es_index_stem("/".join(["segment"] * 100), "grpc")
+    assert len(long_stem) + len("-2020.01.01") < 255
+    assert long_stem.endswith("-grpc")
+    path = PathTable().gnmi("openconfig", ("interfaces",))
+    assert path.es_stem("gnmi") is path.es_stem("gnmi")
+
+
+def test_daily_date():
+    today = DailyDate()
+    now = datetime.now()
+    assert today() == f"{now.year}.{now.month:02d}.{now.day:02d}"
+    today.date = "cached"
+    assert today() == "cached"
+    today.next_day = 0.0
+    assert today() != "cached"
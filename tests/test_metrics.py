@@ -0,0 +1,46 @@
+from metrics.metrics import MetricsRegistry, escape_label_value
+
+
+def test_escape_label_value():
+    assert escape_label_value('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+    assert escape_label_value("Cisco-IOS-XR-infra-statsd-oper:infra-statistics") == \
+        "Cisco-IOS-XR-infra-statsd-oper:infra-statistics"
+
+
+def test_merge_from_workers():
+    main, worker = MetricsRegistry(), MetricsRegistry()
+    for registry in [main, worker]:
+        registry.counter("sent_total", "Sent", ("output",))
+        registry.gauge("up", "Up", ("input",))
+        registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    main.metrics["sent_total"].inc(2, output="influxdb")
+    worker.metrics["sent_total"].inc(3, output="influxdb")
+    worker.metrics["sent_total"].inc(output="elasticsearch")
+    worker.metrics["up"].set(1, input="router-1")
+    worker.metrics["latency_seconds"].observe(0.05)
+    worker.metrics["latency_seconds"].observe(5.0)
+    main.merge(worker.collect())
+    assert worker.collect() == {}
+    assert main.metrics["sent_total"].values == {("influxdb",): 5, ("elasticsearch",): 1}
+    assert main.metrics["up"].values == {("router-1",): 1}
+    assert main.metrics["latency_seconds"].values == {(): [1, 0, 5.05, 2]}
+
+
+def test_render():
+    registry = MetricsRegistry()
+    registry.counter("sent_total", "Sent", ("output",)).inc(4, output='influx "db"')
+    registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)).observe(0.5)
+    registry.gauge("idle", "Never set")
+    lines = registry.render().splitlines()
+    assert lines == [
+        "# HELP sent_total Sent",
+        "# TYPE sent_total counter",
+        'sent_total{output="influx \\"db\\""} 4',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 0',
+        'latency_seconds_bucket{le="1.0"} 1',
+        'latency_seconds_bucket{le="+Inf"} 1',
+        "latency_seconds_sum 0.5",
+        "latency_seconds_count 1",
+    ]
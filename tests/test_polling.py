@@ -0,0 +1,49 @@
+from threading import Event
+
+import pytest
+
+polling = pytest.importorskip("polling.polling")
+
+
+def test_timer_deadline_is_aligned_to_the_offset():
+    timer = polling.PollTimer("10.0.0.1:57400/60", 60.0, lambda: None, 0.0)
+    assert 0 <= timer.offset < 60
+    deadline = timer.next_deadline(1000.0)
+    assert 1000.0 < deadline <= 1060.0
+    assert (deadline - timer.offset) % 60 == pytest.approx(0, abs=1e-6)
+    assert timer.offset == polling.PollTimer("10.0.0.1:57400/60", 60.0, lambda: None, 0.0).offset
+
+
+def test_scheduler_fires_and_removes_timers():
+    scheduler = polling.PollScheduler(tick=0.01, slots=16)
+    fired = Event()
+    scheduler.start()
+    try:
+        timer = scheduler.add("10.0.0.1:57400/0.05", 0.05, fired.set)
+        assert fired.wait(2)
+        scheduler.remove(timer)
+        fired.clear()
+        assert not fired.wait(0.2)
+    finally:
+        scheduler.stop()
+
+
+def test_poll_is_skipped_while_outstanding():
+    requests = polling.PollRequests(polling.SubscribeRequest(), "router/60s", timeout=60.0)
+    stream = iter(requests)
+    next(stream)
+    requests.poll()
+    requests.poll()
+    assert requests.requests.qsize() == 1
+    requests.answered()
+    requests.poll()
+    assert requests.requests.qsize() == 2
+
+
+def test_lost_poll_is_given_up_after_the_timeout():
+    requests = polling.PollRequests(polling.SubscribeRequest(), "router/60s", timeout=60.0)
+    requests.poll()
+    requests.sent -= 61.0
+    requests.poll()
+    assert requests.requests.qsize() == 2
+    assert requests.outstanding
@@ -0,0 +1,75 @@
+from multiprocessing import Queue, current_process
+from threading import Thread
+
+from routing.routing import HashRing, AffinityPool
+
+
+def frame(ip: str):
+    return "gnmi", b"payload", "router", "7.3.1", ip, 1.0
+
+
+RESULTS = None
+
+
+def init_worker(results: Queue) -> None:
+    global RESULTS
+    RESULTS = results
+
+
+def record(batch) -> None:
+    RESULTS.put((current_process().name, [frame[4] for frame in batch]))
+
+
+def test_ring_is_stable():
+    ring = HashRing(4)
+    devices = [f"10.0.0.{index}" for index in range(200)]
+    nodes = {device: ring.node(device) for device in devices}
+    assert set(nodes.values()) == {0, 1, 2, 3}
+    assert nodes == {device: HashRing(4).node(device) for device in devices}
+
+
+def test_growing_the_ring_only_moves_devices_to_the_new_node():
+    ring = HashRing(4)
+    devices = [f"10.0.0.{index}" for index in range(200)]
+    before = {device: ring.node(device) for device in devices}
+    ring.resize(5)
+    moved = [device for device in devices if ring.node(device) != before[device]]
+    assert moved
+    assert all(ring.node(device) == 4 for device in moved)
+    assert len(moved) < len(devices) / 2
+
+
+def test_device_is_pinned_to_one_worker():
+    results = Queue()
+    with AffinityPool(3, record, (), 2, init_worker, (results,), "test") as pool:
+        for _ in range(5):
+            for device in ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"]:
+                pool.route(frame(device))
+        pool.close()
+        workers = {}
+        routed = 0
+        while routed < 20:
+            worker, devices = results.get(timeout=10)
+            routed += len(devices)
+            for device in devices:
+                workers.setdefault(device, set()).add(worker)
+        pool.join()
+    assert all(len(names) == 1 for names in workers.values())
+    assert set(workers) == {"10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"}
+
+
+def test_add_workers_while_routing():
+    results = Queue()
+    with AffinityPool(2, record, (), 100, init_worker, (results,), "test") as pool:
+        adder = Thread(target=pool.add_workers, args=(4,))
+        adder.start()
+        for index in range(2000):
+            pool.route(frame(f"10.0.{index % 50}.1"))
+        adder.join()
+        assert len(pool.workers) == len(pool.batches) == len(pool.queues) == 6
+        pool.close()
+        routed = 0
+        while routed < 2000:
+            routed += len(results.get(timeout=10)[1])
+        pool.join()
+    assert routed == 2000
@@ -0,0 +1,63 @@
+from multiprocessing import Process
+from threading import Event
+from time import monotonic, sleep
+
+from supervisor.supervisor import ProcessWatcher, Supervisor
+
+
+class FakeProcess:
+    def __init__(self, sentinel: int) -> None:
+        self.sentinel: int = sentinel
+
+
+def test_watch_many_processes_before_the_watcher_runs():
+    watcher = ProcessWatcher(lambda process: None)
+    # Every watch used to write to the wake pipe, which blocked once the pipe was full
+    for sentinel in range(20000):
+        watcher.watch(FakeProcess(sentinel))
+    assert len(watcher.processes) == 20000
+    assert watcher.woken
+
+
+def test_exited_process_is_reported():
+    exited = Event()
+    reported = []
+    watcher = ProcessWatcher(lambda process: (reported.append(process), exited.set()))
+    watcher.start()
+    try:
+        process = Process(target=int)
+        process.start()
+        watcher.watch(process)
+        assert exited.wait(10)
+        assert reported == [process]
+        assert process.exitcode == 0
+    finally:
+        watcher.stop()
+
+
+def test_input_that_is_not_restarted_stops_the_pipeline():
+    stopped = Event()
+    supervisor = Supervisor(stopped.set)
+    supervisor.start()
+    try:
+        supervisor.add("replay", lambda: Process(target=int), restart=False)
+        assert stopped.wait(10)
+    finally:
+        supervisor.stop()
+
+
+def test_restarted_input_backs_off():
+    supervisor = Supervisor(lambda: None)
+    supervisor.start()
+    try:
+        supervisor.add("router", lambda: Process(target=int))
+        supervised = supervisor.inputs["router"]
+        deadline = monotonic() + 10
+        while supervised.restart_at is None and monotonic() < deadline:
+            sleep(0.01)
+        assert supervised.restart_at is not None
+        assert supervised.backoff == Supervisor.MIN_BACKOFF_SECONDS
+        assert not supervised.is_up()
+    finally:
+        supervisor.stop()
+        supervisor.terminate()
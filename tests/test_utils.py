@@ -0,0 +1,48 @@
+import pytest
+
+from utils.utils import generate_clients
+
+CONFIG = """
+[poller]
+io = input
+dial = in
+address = 10.0.0.1
+port = 57400
+username = admin
+password = admin
+compression = false
+format = gnmi
+sensors = openconfig-interfaces:interfaces
+sample-interval = {sample_interval}
+subscription-mode = SAMPLE
+stream-mode = POLL
+{poll_intervals}
+
+[influxdb]
+io = output
+address = 127.0.0.1
+port = 8086
+"""
+
+
+def write_config(tmp_path, sample_interval: int = 10, poll_intervals: str = ""):
+    path = tmp_path / "rtnm.ini"
+    path.write_text(CONFIG.format(sample_interval=sample_interval, poll_intervals=poll_intervals))
+    return str(path)
+
+
+def test_poll_intervals(tmp_path):
+    inputs, _ = generate_clients(write_config(tmp_path, poll_intervals="poll-intervals = 30"))
+    assert inputs["poller"]["poll-intervals"] == [30.0]
+
+
+def test_poll_intervals_default_to_the_sample_interval(tmp_path):
+    inputs, _ = generate_clients(write_config(tmp_path))
+    assert inputs["poller"]["poll-intervals"] is None
+
+
+@pytest.mark.parametrize("sample_interval, poll_intervals", [(10, "poll-intervals = 0"), (10, "poll-intervals = -5"),
+                                                             (0, "")])
+def test_poll_intervals_must_be_positive(tmp_path, sample_interval, poll_intervals):
+    with pytest.raises(ValueError, match="Input poller"):
+        generate_clients(write_config(tmp_path, sample_interval, poll_intervals))